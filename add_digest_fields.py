@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Скрипт для добавления настроек сводки уведомлений в таблицу users:
+digest_threshold и digest_window_sec (NULL - значения по умолчанию из config.py)
+"""
+
+import asyncio
+import logging
+from sqlalchemy import text
+from database.db import engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def add_digest_fields():
+    """Добавляет поля настроек сводки уведомлений"""
+    
+    logger.info("🚀 Начинаю миграцию...")
+    
+    async with engine.begin() as conn:
+        try:
+            # Проверяем, существуют ли уже поля
+            check_query = text("""
+                SELECT column_name 
+                FROM information_schema.columns 
+                WHERE table_name = 'users' 
+                AND column_name IN ('digest_threshold', 'digest_window_sec')
+            """)
+            result = await conn.execute(check_query)
+            existing_columns = [row[0] for row in result.fetchall()]
+            
+            for column in ("digest_threshold", "digest_window_sec"):
+                if column not in existing_columns:
+                    await conn.execute(text(f"ALTER TABLE users ADD COLUMN {column} INTEGER"))
+                    logger.info(f"✅ Добавлено поле {column}")
+                else:
+                    logger.info(f"ℹ️  Поле {column} уже существует")
+            
+            logger.info("✅ Миграция завершена успешно!")
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка при миграции: {e}")
+            raise
+
+
+async def main():
+    try:
+        await add_digest_fields()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
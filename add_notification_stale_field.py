@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Скрипт для добавления поля is_stale в таблицу notifications_log
+(ленивый режим очистки уведомлений, NOTIFY_STALE_MODE)
+"""
+
+import asyncio
+import logging
+from sqlalchemy import text
+from database.db import engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def add_notification_stale_field():
+    """Добавляет поле is_stale (0 - актуально, 1 - объявление снято)"""
+    
+    logger.info("🚀 Начинаю миграцию...")
+    
+    async with engine.begin() as conn:
+        try:
+            # Проверяем, существует ли уже поле
+            check_query = text("""
+                SELECT column_name 
+                FROM information_schema.columns 
+                WHERE table_name = 'notifications_log' 
+                AND column_name = 'is_stale'
+            """)
+            result = await conn.execute(check_query)
+            
+            if not result.fetchone():
+                await conn.execute(text(
+                    "ALTER TABLE notifications_log ADD COLUMN is_stale INTEGER NOT NULL DEFAULT 0"
+                ))
+                logger.info("✅ Добавлено поле is_stale")
+            else:
+                logger.info("ℹ️  Поле is_stale уже существует")
+            
+            logger.info("✅ Миграция завершена успешно!")
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка при миграции: {e}")
+            raise
+
+
+async def main():
+    try:
+        await add_notification_stale_field()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
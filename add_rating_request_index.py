@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Скрипт для добавления частичного индекса idx_rating_requests_due
+(наступившие неотправленные запросы на оценку) в таблицу rating_requests
+"""
+
+import asyncio
+import logging
+from sqlalchemy import text
+from database.db import engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def add_rating_request_index():
+    """Создаёт индекс по scheduled_at для неотправленных запросов"""
+    
+    logger.info("🚀 Начинаю миграцию...")
+    
+    async with engine.begin() as conn:
+        try:
+            await conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_rating_requests_due
+                ON rating_requests (scheduled_at)
+                WHERE sent = 0
+            """))
+            logger.info("✅ Индекс idx_rating_requests_due создан")
+            
+            logger.info("✅ Миграция завершена успешно!")
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка при миграции: {e}")
+            raise
+
+
+async def main():
+    try:
+        await add_rating_request_index()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Скрипт для перевода ключей маршрутов на целочисленный словарь route_keys:
+- создаёт расширение intarray и таблицу route_keys
+- добавляет колонки key_ids_from / key_ids_to в posts и subscriptions
+- заполняет их для существующих строк пачками
+- строит GIN индексы (gin__int_ops)
+
+Скрипт идемпотентен: повторный запуск дозаполняет только пустые строки.
+"""
+
+import asyncio
+import logging
+from sqlalchemy import text
+from database.db import engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Размер пачки при заполнении существующих строк
+BATCH_SIZE = 1000
+
+TABLES = ("posts", "subscriptions")
+
+
+async def prepare_schema():
+    """Создаёт расширение, словарь и новые колонки"""
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS intarray"))
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS route_keys (
+                id SERIAL PRIMARY KEY,
+                key TEXT NOT NULL UNIQUE,
+                created_at TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc')
+            )
+        """))
+        logger.info("✅ Таблица route_keys готова")
+
+        for table in TABLES:
+            await conn.execute(text(f"""
+                ALTER TABLE {table}
+                ADD COLUMN IF NOT EXISTS key_ids_from INTEGER[],
+                ADD COLUMN IF NOT EXISTS key_ids_to INTEGER[]
+            """))
+            logger.info(f"✅ Колонки key_ids_from / key_ids_to добавлены в {table}")
+
+
+async def backfill_table(table: str):
+    """Заполняет key_ids_* для строк таблицы пачками по BATCH_SIZE"""
+    total = 0
+    last_id = 0
+
+    while True:
+        # Каждая пачка - отдельная транзакция, чтобы не держать долгих блокировок
+        async with engine.begin() as conn:
+            result = await conn.execute(text(f"""
+                SELECT id FROM {table}
+                WHERE id > :last_id AND (key_ids_from IS NULL OR key_ids_to IS NULL)
+                ORDER BY id
+                LIMIT :batch_size
+            """), {"last_id": last_id, "batch_size": BATCH_SIZE})
+            ids = [row[0] for row in result.fetchall()]
+
+            if not ids:
+                break
+
+            # Пополняем словарь ключами пачки
+            await conn.execute(text(f"""
+                INSERT INTO route_keys (key)
+                SELECT DISTINCT unnest(keys_from || keys_to)
+                FROM {table}
+                WHERE id = ANY(:ids)
+                ON CONFLICT (key) DO NOTHING
+            """), {"ids": ids})
+
+            # Переводим текстовые ключи в ID, сохраняя порядок
+            await conn.execute(text(f"""
+                UPDATE {table} AS t
+                SET key_ids_from = ARRAY(
+                        SELECT rk.id
+                        FROM unnest(t.keys_from) WITH ORDINALITY AS k(key, pos)
+                        JOIN route_keys rk ON rk.key = k.key
+                        ORDER BY k.pos
+                    ),
+                    key_ids_to = ARRAY(
+                        SELECT rk.id
+                        FROM unnest(t.keys_to) WITH ORDINALITY AS k(key, pos)
+                        JOIN route_keys rk ON rk.key = k.key
+                        ORDER BY k.pos
+                    )
+                WHERE t.id = ANY(:ids)
+            """), {"ids": ids})
+
+        total += len(ids)
+        last_id = ids[-1]
+        logger.info(f"   {table}: заполнено {total} строк (последний id={last_id})")
+
+    logger.info(f"✅ {table}: заполнение завершено, всего {total} строк")
+
+
+async def create_indexes():
+    """Строит GIN индексы по ID ключей"""
+    async with engine.begin() as conn:
+        for table in TABLES:
+            for column in ("key_ids_from", "key_ids_to"):
+                await conn.execute(text(f"""
+                    CREATE INDEX IF NOT EXISTS idx_{table}_{column}
+                    ON {table} USING gin ({column} gin__int_ops)
+                """))
+            logger.info(f"✅ GIN индексы по ID ключей для {table} созданы")
+
+
+async def add_route_key_ids():
+    """Полная миграция ключей маршрутов на словарь route_keys"""
+
+    logger.info("🚀 Начинаю миграцию...")
+
+    try:
+        await prepare_schema()
+        for table in TABLES:
+            await backfill_table(table)
+        await create_indexes()
+
+        logger.info("✅ Миграция завершена успешно!")
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка при миграции: {e}")
+        raise
+
+
+async def main():
+    try:
+        await add_route_key_ids()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Пакетный матчинг всех подписок со всеми активными объявлениями
+(services/batch_matcher.py).
+
+Применения:
+- оценка последствий смены генератора ключей (--regenerate-keys):
+  сравнивает пары с сохранёнными и с заново сгенерированными ключами
+- планирование ёмкости на синтетическом корпусе (--corpus)
+- восстановление после сбоя: полный список пар (post_id, sub_id, user_id)
+  в CSV для сверки с notification_logs
+
+Примеры:
+  python batch_match.py --output matches.csv
+  python batch_match.py --regenerate-keys
+  python batch_match.py --corpus 100000 --posts 5000
+"""
+
+import argparse
+import asyncio
+import csv
+import logging
+import time
+from typing import List, Tuple
+
+from services.batch_matcher import match_all, load_rows, RouteRow, DEFAULT_CHUNK_SIZE
+from services.keys_generator import generate_keys
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def load_from_db(regenerate_keys: bool) -> Tuple[List[RouteRow], List[RouteRow], List[RouteRow], List[RouteRow]]:
+    """
+    Загружает подписки и активные объявления из БД.
+
+    Returns:
+        (подписки, объявления, подписки с новыми ключами, объявления с новыми ключами);
+        последние два пустые без regenerate_keys
+    """
+    from sqlalchemy import select
+    from database.db import get_session, engine
+    from database.models import Subscription, Post
+
+    try:
+        async with get_session() as session:
+            subscriptions, posts = await load_rows(session)
+
+            new_subscriptions, new_posts = [], []
+            if regenerate_keys:
+                subs_result = await session.execute(
+                    select(Subscription.id, Subscription.user_id, Subscription.from_text,
+                           Subscription.to_text, Subscription.keys_from, Subscription.keys_to)
+                )
+                for sub_id, user_id, from_text, to_text, keys_from, keys_to in subs_result.all():
+                    # У старых подписок нет исходного текста - оставляем сохранённые ключи
+                    new_subscriptions.append((
+                        sub_id, user_id,
+                        generate_keys(from_text) if from_text else keys_from,
+                        generate_keys(to_text) if to_text else keys_to
+                    ))
+
+                posts_result = await session.execute(
+                    select(Post.id, Post.author_id, Post.from_place, Post.to_place)
+                    .where(Post.status == "active")
+                )
+                new_posts = [
+                    (post_id, author_id, generate_keys(from_place), generate_keys(to_place))
+                    for post_id, author_id, from_place, to_place in posts_result.all()
+                ]
+    finally:
+        await engine.dispose()
+
+    return subscriptions, posts, new_subscriptions, new_posts
+
+
+def load_from_corpus(subscriptions_count: int, posts_count: int, seed: int) -> Tuple[List[RouteRow], List[RouteRow]]:
+    """Синтетический корпус маршрутов Бишкека (benchmarks/corpus.py)"""
+    from benchmarks.corpus import generate_routes
+
+    subscriptions = [
+        (sub_id, sub_id % max(1, subscriptions_count // 3) + 1, route.keys_from, route.keys_to)
+        for sub_id, route in enumerate(generate_routes(subscriptions_count, seed=seed), 1)
+    ]
+    posts = [
+        (post_id, post_id % max(1, posts_count // 2) + 1, route.keys_from, route.keys_to)
+        for post_id, route in enumerate(generate_routes(posts_count, seed=seed + 1), 1)
+    ]
+    return subscriptions, posts
+
+
+def run_match(subscriptions: List[RouteRow], posts: List[RouteRow], chunk_size: int, label: str):
+    started = time.perf_counter()
+    pairs = match_all(subscriptions, posts, chunk_size=chunk_size)
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"✅ {label}: {len(pairs)} пар (подписок: {len(subscriptions)}, "
+        f"объявлений: {len(posts)}) за {elapsed:.2f} с"
+    )
+    return pairs
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Пакетный матчинг подписок и объявлений")
+    parser.add_argument("--corpus", type=int, default=0,
+                        help="Синтетический корпус из N подписок вместо БД")
+    parser.add_argument("--posts", type=int, default=5000, help="Объявлений в синтетическом корпусе")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--regenerate-keys", action="store_true",
+                        help="Сравнить совпадения с заново сгенерированными ключами (только БД)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--output", help="CSV файл для пар post_id,sub_id,user_id")
+    args = parser.parse_args()
+
+    new_subscriptions, new_posts = [], []
+    if args.corpus:
+        subscriptions, posts = load_from_corpus(args.corpus, args.posts, args.seed)
+    else:
+        subscriptions, posts, new_subscriptions, new_posts = await load_from_db(args.regenerate_keys)
+
+    pairs = run_match(subscriptions, posts, args.chunk_size, "Сохранённые ключи")
+
+    if args.regenerate_keys and not args.corpus:
+        new_pairs = run_match(new_subscriptions, new_posts, args.chunk_size, "Новые ключи")
+        old_set, new_set = set(pairs), set(new_pairs)
+        logger.info(f"   Появятся: {len(new_set - old_set)} пар, пропадут: {len(old_set - new_set)} пар")
+        pairs = new_pairs
+
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["post_id", "sub_id", "user_id"])
+            writer.writerows(pairs)
+        logger.info(f"✅ Пары записаны в {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
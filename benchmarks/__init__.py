@@ -0,0 +1 @@
+# benchmarks - Бенчмарки матчинга маршрутов
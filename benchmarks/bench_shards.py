@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк шардированного матчинга подписок против одного процесса.
+
+Сравнивает find_matching_subscriptions на одном SubscriptionIndex и на
+ShardedSubscriptionMatcher с N процессами-шардами: задержку одного запроса
+(p50/p99) и пропускную способность при параллельных публикациях.
+Память шардов живёт в других процессах, поэтому колонка peak здесь не заполняется.
+
+Примеры:
+  python -m benchmarks.bench_shards --sizes 100000,1000000 --shards 4
+  python -m benchmarks.bench_shards --sizes 1000000 --shards 2,4,8 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import List
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from services import matching
+from services.match_index import subscription_index
+from services.match_shards import ShardedSubscriptionMatcher
+from benchmarks.bench_matching import make_probe_posts, format_row, header
+from benchmarks.corpus import generate_routes
+
+
+async def run_queries(probes, concurrency: int) -> tuple:
+    """
+    Прогоняет объявления через find_matching_subscriptions
+    с заданным числом одновременных запросов.
+
+    Returns:
+        (задержки, общее время)
+    """
+    latencies: List[float] = []
+    queue = list(probes)
+
+    async def worker():
+        while queue:
+            post = queue.pop()
+            started = time.perf_counter()
+            await matching.find_matching_subscriptions(None, post)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started
+
+
+async def bench_size(size: int, shard_counts: List[int], queries: int, concurrency: int, seed: int) -> List[str]:
+    rows = []
+    subscription_rows = [
+        (sub_id, sub_id % max(1, size // 3) + 1, route.keys_from, route.keys_to)
+        for sub_id, route in enumerate(generate_routes(size, seed=seed), 1)
+    ]
+    probes = make_probe_posts(queries, seed=seed + 2)
+
+    # Один процесс: SubscriptionIndex
+    matching.MATCHING_BACKEND = "memory"
+    matching.subscription_shards = None
+    subscription_index.load_rows(subscription_rows)
+    latencies, elapsed = await run_queries(probes, concurrency)
+    baseline = len(latencies) / elapsed
+    rows.append(format_row("single process", size, latencies, elapsed, 0))
+
+    for shard_count in shard_counts:
+        shards = ShardedSubscriptionMatcher(shard_count)
+        try:
+            shards.load_rows(subscription_rows)
+            matching.subscription_shards = shards
+            latencies, elapsed = await run_queries(probes, concurrency)
+            speedup = (len(latencies) / elapsed) / baseline
+            rows.append(
+                format_row(f"{shard_count} shards (x{speedup:.2f})", size, latencies, elapsed, 0)
+            )
+        finally:
+            matching.subscription_shards = None
+            shards.close()
+
+    return rows
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк шардированного матчинга подписок")
+    parser.add_argument("--sizes", default="100000,1000000", help="Размеры корпуса подписок через запятую")
+    parser.add_argument("--shards", default=str(os.cpu_count() or 2), help="Числа шардов через запятую")
+    parser.add_argument("--queries", type=int, default=500, help="Количество объявлений-запросов")
+    parser.add_argument("--concurrency", type=int, default=16, help="Одновременных публикаций")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    sizes = [int(value) for value in args.sizes.split(",") if value]
+    shard_counts = [int(value) for value in args.shards.split(",") if value]
+
+    print(f"cpus={os.cpu_count()} queries={args.queries} concurrency={args.concurrency} seed={args.seed}")
+    print(header())
+    for size in sizes:
+        for row in await bench_size(size, shard_counts, args.queries, args.concurrency, args.seed):
+            print(row)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -12,8 +12,8 @@ from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.exceptions import TelegramNetworkError, TelegramBadRequest
 
-from config import BOT_TOKEN, CHANNEL_ID
-from database.db import init_db, close_db
+from config import BOT_TOKEN, CHANNEL_ID, MATCHING_PIPELINE, MATCHER_IN_BOT, MATCHING_BACKEND
+from database.db import init_db, close_db, get_session
 from handlers import (
     start_router,
     registration_router,
@@ -22,9 +22,16 @@ from handlers import (
     my_posts_router,
     profile_router,
     rating_router,
-    callbacks_router
+    callbacks_router,
+    admin_router
 )
 from workers.expiration import start_expiration_worker, stop_expiration_worker
+from workers.rating_requests import start_rating_requests_worker, stop_rating_requests_worker
+from workers.match_stream import start_match_stream_worker, stop_match_stream_worker
+from utils.redis_client import close_redis
+from utils.rate_limiter import TelegramRateLimiter
+from services.matching import subscription_shards
+from services.notification_log import notification_log_buffer
 
 # Настройка логирования
 logging.basicConfig(
@@ -52,11 +59,18 @@ async def main():
         await init_db()
         logger.info("База данных инициализирована")
         
+        # Партиции шардов матчинга загружаются при старте, а не на первом объявлении
+        if subscription_shards is not None and MATCHING_BACKEND != "sql":
+            async with get_session() as session:
+                await subscription_shards.ensure_loaded(session)
+        
         # Создание бота и диспетчера
         bot = Bot(
             token=BOT_TOKEN,
             default=DefaultBotProperties(parse_mode=ParseMode.HTML)
         )
+        # Общий с Celery воркерами лимит запросов к Telegram (ответы - в интерактивной полосе)
+        bot.session.middleware(TelegramRateLimiter())
         
         # Используем MemoryStorage для FSM (для продакшн рекомендуется Redis)
         storage = MemoryStorage()
@@ -92,6 +106,7 @@ async def main():
         dp.include_router(profile_router)
         dp.include_router(rating_router)
         dp.include_router(callbacks_router)
+        dp.include_router(admin_router)
         
         logger.info("Роутеры зарегистрированы")
         
@@ -99,6 +114,13 @@ async def main():
         start_expiration_worker(bot)
         logger.info("Воркер истечения запущен")
         
+        # Отправка запланированных запросов на оценку
+        start_rating_requests_worker(bot)
+        
+        # Запуск матчера стрима "post_published" (если не вынесен в отдельный процесс)
+        if MATCHING_PIPELINE == "stream" and MATCHER_IN_BOT:
+            start_match_stream_worker()
+        
         # Удаляем вебхук если был установлен
         try:
             await bot.delete_webhook(drop_pending_updates=True)
@@ -138,6 +160,12 @@ async def main():
     finally:
         # Корректное завершение
         stop_expiration_worker()
+        stop_rating_requests_worker()
+        await stop_match_stream_worker()
+        await close_redis()
+        await notification_log_buffer.close()
+        if subscription_shards is not None:
+            subscription_shards.close()
         await close_db()
         await bot.session.close()
         logger.info("Бот остановлен")
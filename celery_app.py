@@ -7,8 +7,29 @@ import sys
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
 from celery import Celery
+from celery.signals import celeryd_init
+from kombu import Queue
 from config import REDIS_URL, TIMEZONE
 
+# Очереди по классам трафика уведомлений: большая рассылка не задерживает
+# уведомления об истечении и запросы на оценку
+QUEUE_REALTIME_MATCH = "realtime-match"  # Единичные уведомления о совпадении
+QUEUE_BULK = "bulk"  # Пакетные рассылки объявления подписчикам
+QUEUE_EXPIRATION = "expiration"  # Уведомления об истечении объявления
+QUEUE_RATING = "rating"  # Запросы на оценку поездки
+
+NOTIFICATION_QUEUES = [QUEUE_REALTIME_MATCH, QUEUE_BULK, QUEUE_EXPIRATION, QUEUE_RATING]
+
+# Параметры воркера для каждой очереди (celery -A celery_app worker -Q <очередь>).
+# Задачи уведомлений ждут Telegram, а не CPU, поэтому процессов больше, чем ядер;
+# рассылке - небольшой prefetch, чтобы длинные пачки не копились за одним процессом.
+QUEUE_WORKER_SETTINGS = {
+    QUEUE_REALTIME_MATCH: {"concurrency": 8, "prefetch_multiplier": 4},
+    QUEUE_BULK: {"concurrency": 4, "prefetch_multiplier": 1},
+    QUEUE_EXPIRATION: {"concurrency": 2, "prefetch_multiplier": 4},
+    QUEUE_RATING: {"concurrency": 2, "prefetch_multiplier": 4},
+}
+
 celery = Celery(
     "poputchik_bot",
     broker=REDIS_URL,
@@ -25,8 +46,30 @@ celery.conf.update(
     task_time_limit=300,  # 5 минут максимум на задачу
     worker_prefetch_multiplier=1,  # Для равномерного распределения задач
     task_acks_late=True,  # Подтверждать задачу после выполнения
+    task_queues=[Queue(name) for name in NOTIFICATION_QUEUES],
+    task_default_queue=QUEUE_REALTIME_MATCH,  # Очередь задачи задаётся в @celery.task(queue=...)
 )
 
+
+@celeryd_init.connect
+def configure_queue_worker(sender=None, conf=None, options=None, **kwargs):
+    """
+    Воркер, запущенный на одну очередь (-Q bulk), получает её concurrency
+    и prefetch из QUEUE_WORKER_SETTINGS, если они не заданы в командной строке.
+    """
+    queues = options.get("queues") or []
+    if isinstance(queues, str):
+        queues = queues.split(",")
+    if len(queues) != 1 or queues[0] not in QUEUE_WORKER_SETTINGS:
+        return
+
+    settings = QUEUE_WORKER_SETTINGS[queues[0]]
+    if not options.get("concurrency"):
+        conf.worker_concurrency = settings["concurrency"]
+    if not options.get("prefetch_multiplier"):
+        conf.worker_prefetch_multiplier = settings["prefetch_multiplier"]
+
+
 # Автоматическое обнаружение задач
 celery.autodiscover_tasks(["tasks"])
 
@@ -25,8 +25,99 @@ REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 POST_LIFETIME_MINUTES = 60  # Время жизни объявления
 MAX_PRICE = 270  # Максимальная цена в сомах
 
+# Режим матчинга маршрутов:
+# "memory" - in-memory индекс в процессе бота
+# "sql" - проверка вхождения ключей в PostgreSQL (GIN индексы)
+MATCHING_BACKEND = os.getenv("MATCHING_BACKEND", "memory")
+
+# Число процессов-шардов для матчинга подписок в режиме memory (0 - без шардирования)
+MATCH_SHARDS = int(os.getenv("MATCH_SHARDS", "0"))
+
+# Пакетный матчинг: объявления, опубликованные в пределах окна, матчатся вместе
+MATCH_BATCH_WINDOW_MS = int(os.getenv("MATCH_BATCH_WINDOW_MS", "200"))  # 0 - без ожидания
+MATCH_BATCH_MAX_SIZE = int(os.getenv("MATCH_BATCH_MAX_SIZE", "50"))
+
+# Конвейер матчинга после публикации объявления:
+# "stream" - событие в Redis Stream, матчинг и рассылку выполняет матчер (workers/match_stream.py)
+# "inline" - матчинг и рассылка прямо в хендлере публикации
+MATCHING_PIPELINE = os.getenv("MATCHING_PIPELINE", "stream")
+MATCH_STREAM_KEY = os.getenv("MATCH_STREAM_KEY", "match:post_published")
+MATCH_STREAM_GROUP = os.getenv("MATCH_STREAM_GROUP", "matchers")
+MATCH_STREAM_MAXLEN = int(os.getenv("MATCH_STREAM_MAXLEN", "100000"))  # Приблизительная обрезка стрима
+MATCH_STREAM_BATCH_SIZE = int(os.getenv("MATCH_STREAM_BATCH_SIZE", "50"))
+MATCH_STREAM_CLAIM_IDLE_MS = int(os.getenv("MATCH_STREAM_CLAIM_IDLE_MS", "60000"))  # Когда подбирать события упавшего матчера
+MATCH_STREAM_MAX_DELIVERIES = int(os.getenv("MATCH_STREAM_MAX_DELIVERIES", "5"))
+# Запускать матчер внутри процесса бота. Отдельный матчер (python matcher.py)
+# не видит in-memory индексов бота и требует MATCHING_BACKEND=sql
+MATCHER_IN_BOT = os.getenv("MATCHER_IN_BOT", "true").lower() == "true"
+
+# Трассировка матчинга: 1 из N объявлений (0 - выключена, без накладных расходов)
+MATCH_TRACE_SAMPLE = int(os.getenv("MATCH_TRACE_SAMPLE", "0"))
+MATCH_TRACE_CAPACITY = int(os.getenv("MATCH_TRACE_CAPACITY", "200"))  # Объявлений в кольцевом буфере
+MATCH_TRACE_MAX_CANDIDATES = int(os.getenv("MATCH_TRACE_MAX_CANDIDATES", "500"))  # Записей на объявление
+
+# Очередь задач уведомлений:
+# "celery" - Celery воркеры (celery -A celery_app worker)
+# "stream" - Redis Stream и asyncio потребитель (python notifier.py)
+NOTIFY_QUEUE_BACKEND = os.getenv("NOTIFY_QUEUE_BACKEND", "celery")
+NOTIFY_QUEUE_STREAM = os.getenv("NOTIFY_QUEUE_STREAM", "notify:tasks")
+NOTIFY_QUEUE_GROUP = os.getenv("NOTIFY_QUEUE_GROUP", "notifiers")
+NOTIFY_QUEUE_DELAYED = os.getenv("NOTIFY_QUEUE_DELAYED", "notify:delayed")  # ZSET отложенных задач (countdown, повторы)
+NOTIFY_QUEUE_CONCURRENCY = int(os.getenv("NOTIFY_QUEUE_CONCURRENCY", "200"))  # Одновременных задач на потребителя
+NOTIFY_QUEUE_CLAIM_IDLE_MS = int(os.getenv("NOTIFY_QUEUE_CLAIM_IDLE_MS", "300000"))  # Когда подбирать задачи упавшего потребителя
+NOTIFY_QUEUE_MAX_DELIVERIES = int(os.getenv("NOTIFY_QUEUE_MAX_DELIVERIES", "5"))
+
+# Повторы задач уведомлений (tasks/delivery.py): TelegramRetryAfter - ровно через
+# указанное Telegram время, временные ошибки - экспоненциально со случайным разбросом
+NOTIFY_RETRY_BACKOFF_BASE = float(os.getenv("NOTIFY_RETRY_BACKOFF_BASE", "5"))  # Секунды, первый повтор
+NOTIFY_RETRY_BACKOFF_MAX = float(os.getenv("NOTIFY_RETRY_BACKOFF_MAX", "600"))
+# Стрим неотправляемых задач (постоянные ошибки, исчерпанные повторы): /dlq у админа
+NOTIFY_DLQ_STREAM = os.getenv("NOTIFY_DLQ_STREAM", "notify:dead")
+NOTIFY_DLQ_MAXLEN = int(os.getenv("NOTIFY_DLQ_MAXLEN", "10000"))
+
+# Общий лимит запросов к Telegram (token bucket в Redis для бота и Celery воркеров)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_GLOBAL_RATE = float(os.getenv("RATE_LIMIT_GLOBAL_RATE", "30"))  # Сообщений в секунду на бота
+RATE_LIMIT_GLOBAL_BURST = float(os.getenv("RATE_LIMIT_GLOBAL_BURST", "30"))
+RATE_LIMIT_CHAT_RATE = float(os.getenv("RATE_LIMIT_CHAT_RATE", "1"))  # Сообщений в секунду в один чат
+RATE_LIMIT_CHAT_BURST = float(os.getenv("RATE_LIMIT_CHAT_BURST", "3"))
+RATE_LIMIT_CHANNEL_PER_MIN = float(os.getenv("RATE_LIMIT_CHANNEL_PER_MIN", "20"))  # Публикаций/правок в канале в минуту
+RATE_LIMIT_CHANNEL_BURST = float(os.getenv("RATE_LIMIT_CHANNEL_BURST", "5"))
+# Токены глобального ведра, недоступные рассылкам: ответы пользователям не ждут за ними
+RATE_LIMIT_INTERACTIVE_RESERVE = float(os.getenv("RATE_LIMIT_INTERACTIVE_RESERVE", "10"))
+
+# Пакетная рассылка уведомлений об одном объявлении (tasks.send_match_notifications_batch)
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "100"))  # Получателей в одной задаче
+NOTIFY_BATCH_CONCURRENCY = int(os.getenv("NOTIFY_BATCH_CONCURRENCY", "10"))  # Одновременных запросов к Telegram
+NOTIFY_BATCH_RATE = int(os.getenv("NOTIFY_BATCH_RATE", "25"))  # Сообщений в секунду на задачу
+
+# Фоновое удаление уведомлений при паузе/удалении объявления: сообщений на задачу
+# и одновременных запросов deleteMessages
+NOTIFY_CLEANUP_BATCH = int(os.getenv("NOTIFY_CLEANUP_BATCH", "1000"))
+NOTIFY_CLEANUP_CONCURRENCY = int(os.getenv("NOTIFY_CLEANUP_CONCURRENCY", "5"))
+# Ленивый режим: старые уведомления не удаляются из чатов, а помечаются устаревшими
+# (is_stale) и исправляются при нажатии "Связаться". Из чатов удаляются только
+# уведомления моложе NOTIFY_EAGER_DELETE_MAX_AGE секунд
+NOTIFY_STALE_MODE = os.getenv("NOTIFY_STALE_MODE", "false").lower() == "true"
+NOTIFY_EAGER_DELETE_MAX_AGE = int(os.getenv("NOTIFY_EAGER_DELETE_MAX_AGE", "3600"))
+
+# Отложенная запись notifications_log: сброс каждые N строк или T миллисекунд
+NOTIFICATION_LOG_FLUSH_ROWS = int(os.getenv("NOTIFICATION_LOG_FLUSH_ROWS", "200"))
+NOTIFICATION_LOG_FLUSH_MS = int(os.getenv("NOTIFICATION_LOG_FLUSH_MS", "500"))
+
+# Сводка уведомлений по умолчанию (пользователь меняет в профиле):
+# больше DIGEST_THRESHOLD совпадений за DIGEST_WINDOW_SEC секунд - одно сообщение со списком
+DIGEST_THRESHOLD = int(os.getenv("DIGEST_THRESHOLD", "3"))
+DIGEST_WINDOW_SEC = int(os.getenv("DIGEST_WINDOW_SEC", "600"))
+DIGEST_MAX_ITEMS = 10  # Объявлений в одном сообщении сводки
+
+# Журнал отправленных уведомлений в Redis (защита от дублей при повторах), секунды
+NOTIFY_LEDGER_TTL = int(os.getenv("NOTIFY_LEDGER_TTL", "86400"))
+
 # Настройки рейтинга
 RATING_REQUEST_DELAY_HOURS = 2  # Через сколько часов запрашивать рейтинг
+RATING_SWEEP_INTERVAL = int(os.getenv("RATING_SWEEP_INTERVAL", "60"))  # Как часто отправлять наступившие запросы (сек)
+RATING_SWEEP_BATCH = int(os.getenv("RATING_SWEEP_BATCH", "100"))  # Сколько запросов забирать за раз
 
 # Интервал проверки истёкших объявлений (в секундах)
 EXPIRATION_CHECK_INTERVAL = 60
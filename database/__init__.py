@@ -1,6 +1,6 @@
 # database/__init__.py
 from database.db import get_session, init_db, engine
-from database.models import User, Post, Subscription, Rating, NotificationLog
+from database.models import User, Post, Subscription, Rating, NotificationLog, RouteKey
 
 __all__ = [
     "get_session",
@@ -10,6 +10,7 @@ __all__ = [
     "Post",
     "Subscription",
     "Rating",
-    "NotificationLog"
+    "NotificationLog",
+    "RouteKey"
 ]
 
@@ -1,6 +1,7 @@
 # database/db.py - Подключение к PostgreSQL
 # Асинхронное подключение через SQLAlchemy + asyncpg
 
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from contextlib import asynccontextmanager
@@ -47,6 +48,8 @@ async def init_db():
     from database.models import Base
     
     async with engine.begin() as conn:
+        # intarray нужен для GIN индексов по ID ключей маршрутов (gin__int_ops)
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS intarray"))
         await conn.run_sync(Base.metadata.create_all)
     
     logger.info("База данных инициализирована")
@@ -6,7 +6,7 @@ from decimal import Decimal
 from sqlalchemy import (
     Column, Integer, BigInteger, String, Text, 
     DECIMAL, DateTime, ForeignKey, Index, 
-    CheckConstraint, UniqueConstraint
+    CheckConstraint, UniqueConstraint, text
 )
 from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship, declarative_base
@@ -31,6 +31,11 @@ class User(Base):
     car_photo_file_id = Column(String(255), nullable=True)  # file_id фото автомобиля
     car_number = Column(String(20), nullable=True, unique=True)  # Номер автомобиля (только в БД, не публикуется, уникальный)
     
+    # Сводка уведомлений: совпадения сверх digest_threshold за digest_window_sec секунд
+    # приходят одним сообщением (NULL - значения по умолчанию, digest_threshold=0 - выключено)
+    digest_threshold = Column(Integer, nullable=True)
+    digest_window_sec = Column(Integer, nullable=True)
+    
     # Связи
     posts = relationship("Post", back_populates="author", lazy="selectin")
     subscriptions = relationship("Subscription", back_populates="user", lazy="selectin")
@@ -60,6 +65,10 @@ class Post(Base):
     keys_from = Column(ARRAY(Text), nullable=False)
     keys_to = Column(ARRAY(Text), nullable=False)
     
+    # Те же ключи в виде ID из словаря route_keys (intarray)
+    key_ids_from = Column(ARRAY(Integer), nullable=True)
+    key_ids_to = Column(ARRAY(Integer), nullable=True)
+    
     # Детали поездки
     departure_time = Column(String(100), nullable=True)  # Время выезда (текст)
     seats = Column(Integer, nullable=True)  # Только для водителей
@@ -80,6 +89,10 @@ class Post(Base):
         Index("idx_posts_expires_at", "expires_at"),
         Index("idx_posts_keys_from", "keys_from", postgresql_using="gin"),
         Index("idx_posts_keys_to", "keys_to", postgresql_using="gin"),
+        Index("idx_posts_key_ids_from", "key_ids_from", postgresql_using="gin",
+              postgresql_ops={"key_ids_from": "gin__int_ops"}),
+        Index("idx_posts_key_ids_to", "key_ids_to", postgresql_using="gin",
+              postgresql_ops={"key_ids_to": "gin__int_ops"}),
     )
     
     def __repr__(self):
@@ -97,6 +110,10 @@ class Subscription(Base):
     keys_from = Column(ARRAY(Text), nullable=False)
     keys_to = Column(ARRAY(Text), nullable=False)
     
+    # Те же ключи в виде ID из словаря route_keys (intarray)
+    key_ids_from = Column(ARRAY(Integer), nullable=True)
+    key_ids_to = Column(ARRAY(Integer), nullable=True)
+    
     # Оригинальный текст (для отображения)
     from_text = Column(String(255), nullable=True)
     to_text = Column(String(255), nullable=True)
@@ -111,6 +128,10 @@ class Subscription(Base):
         Index("idx_subscriptions_user_id", "user_id"),
         Index("idx_subscriptions_keys_from", "keys_from", postgresql_using="gin"),
         Index("idx_subscriptions_keys_to", "keys_to", postgresql_using="gin"),
+        Index("idx_subscriptions_key_ids_from", "key_ids_from", postgresql_using="gin",
+              postgresql_ops={"key_ids_from": "gin__int_ops"}),
+        Index("idx_subscriptions_key_ids_to", "key_ids_to", postgresql_using="gin",
+              postgresql_ops={"key_ids_to": "gin__int_ops"}),
         UniqueConstraint("user_id", "keys_from", "keys_to", name="uq_subscription_route"),
     )
     
@@ -118,6 +139,18 @@ class Subscription(Base):
         return f"<Subscription {self.id}: {self.keys_from} → {self.keys_to}>"
 
 
+class RouteKey(Base):
+    """Словарь ключей маршрутов: нормализованное слово → компактный ID"""
+    __tablename__ = "route_keys"
+    
+    id = Column(Integer, primary_key=True)
+    key = Column(Text, unique=True, nullable=False)  # Ключ из generate_keys
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<RouteKey {self.id}: {self.key}>"
+
+
 class Rating(Base):
     """Оценки пользователей"""
     __tablename__ = "ratings"
@@ -153,6 +186,7 @@ class NotificationLog(Base):
     notification_message_id = Column(BigInteger, nullable=True)  # ID сообщения уведомления в Telegram
     recipient_telegram_id = Column(BigInteger, nullable=True)  # Telegram ID получателя (для быстрого доступа)
     sent_at = Column(DateTime, default=datetime.utcnow)
+    is_stale = Column(Integer, default=0)  # 1 - объявление снято, сообщение не удалено
     
     # Связи
     post = relationship("Post", lazy="selectin")
@@ -180,5 +214,7 @@ class RatingRequest(Base):
     
     __table_args__ = (
         UniqueConstraint("post_id", "from_user_id", "to_user_id", name="uq_rating_request"),
+        # Выборка наступивших неотправленных запросов (workers/rating_requests.py)
+        Index("idx_rating_requests_due", "scheduled_at", postgresql_where=text("sent = 0")),
     )
 
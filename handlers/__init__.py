@@ -7,6 +7,7 @@ from handlers.my_posts import router as my_posts_router
 from handlers.profile import router as profile_router
 from handlers.rating import router as rating_router
 from handlers.callbacks import router as callbacks_router
+from handlers.admin import router as admin_router
 
 __all__ = [
     "start_router",
@@ -16,5 +17,6 @@ __all__ = [
     "my_posts_router",
     "profile_router",
     "rating_router",
-    "callbacks_router"
+    "callbacks_router",
+    "admin_router"
 ]
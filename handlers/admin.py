@@ -0,0 +1,193 @@
+# handlers/admin.py - Команды администратора
+# Диагностика матчинга (трасса объявления), очередей уведомлений, DLQ и очистки уведомлений
+
+from aiogram import Router, F
+from aiogram.types import Message
+from aiogram.filters import Command, CommandObject
+from datetime import datetime
+import logging
+
+from config import ADMIN_IDS
+from services.notifications_cleaner import cleanup_progress
+from tasks import delivery
+from tasks.monitoring import queue_stats
+from utils import match_trace
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+# Команды доступны только администраторам из ADMIN_IDS
+router.message.filter(F.from_user.id.in_(ADMIN_IDS))
+
+# Лимит длины сообщения Telegram
+MESSAGE_LIMIT = 4000
+
+
+@router.message(Command("trace"))
+async def cmd_trace(message: Message, command: CommandObject):
+    """
+    /trace <post_id> - трасса матчинга объявления из кольцевого буфера.
+    Если трассы нет, объявление будет трассировано при следующем матчинге.
+    """
+    if not command.args or not command.args.strip().isdigit():
+        await message.answer("Использование: /trace <post_id>")
+        return
+
+    post_id = int(command.args.strip())
+
+    if not match_trace.ENABLED:
+        await message.answer("Трассировка выключена (MATCH_TRACE_SAMPLE=0)")
+        return
+
+    text = match_trace.dump(post_id)
+    if text is None:
+        match_trace.force(post_id)
+        await message.answer(
+            f"Трассы объявления {post_id} нет в буфере.\n"
+            f"Оно будет трассировано при следующем матчинге."
+        )
+        return
+
+    logger.info(f"Админ {message.from_user.id} запросил трассу объявления {post_id}")
+
+    # Длинную трассу отправляем несколькими сообщениями
+    chunk = []
+    chunk_length = 0
+    for line in text.split("\n"):
+        if chunk and chunk_length + len(line) + 1 > MESSAGE_LIMIT:
+            await message.answer("\n".join(chunk))
+            chunk, chunk_length = [], 0
+        chunk.append(line)
+        chunk_length += len(line) + 1
+    if chunk:
+        await message.answer("\n".join(chunk))
+
+
+@router.message(Command("queues"))
+async def cmd_queues(message: Message):
+    """
+    /queues - глубина очередей уведомлений и время ожидания задач
+    (по последним задачам каждой очереди, от всех воркеров).
+    """
+    try:
+        stats = await queue_stats()
+    except Exception as e:
+        logger.error(f"❌ Не удалось получить состояние очередей: {e}")
+        await message.answer("Не удалось получить состояние очередей (Redis недоступен)")
+        return
+
+    lines = ["Очереди уведомлений (ожидание в мс):"]
+    for queue, info in stats.items():
+        if "wait" not in info:
+            lines.append(f"{queue}: в стриме {info['depth']}, отложено {info['delayed']}")
+            continue
+        wait = info["wait"]
+        depth = f"в очереди {info['depth']}, " if info["depth"] is not None else ""
+        lines.append(
+            f"{queue}: {depth}задач {wait['count']}, "
+            f"p50 {wait['p50']:.0f}, p99 {wait['p99']:.0f}, max {wait['max']:.0f}"
+        )
+    await message.answer("\n".join(lines))
+
+
+@router.message(Command("dlq"))
+async def cmd_dlq(message: Message, command: CommandObject):
+    """
+    /dlq [N] - последние N (по умолчанию 10) задач уведомлений,
+    не выполненных из-за постоянной ошибки или исчерпанных повторов.
+    """
+    count = int(command.args.strip()) if command.args and command.args.strip().isdigit() else 10
+
+    try:
+        total = await delivery.dead_letters_count()
+        entries = await delivery.dead_letters(count)
+    except Exception as e:
+        logger.error(f"❌ Не удалось прочитать DLQ: {e}")
+        await message.answer("Не удалось прочитать DLQ (Redis недоступен)")
+        return
+
+    if not entries:
+        await message.answer("DLQ пуста")
+        return
+
+    lines = [f"DLQ: {total} задач, последние {len(entries)}:"]
+    for entry_id, fields in entries:
+        failed_at = datetime.utcfromtimestamp(int(fields.get("failed_at", 0))).strftime("%d.%m %H:%M")
+        lines.append(
+            f"\n{entry_id} [{fields.get('reason')}] {failed_at} UTC\n"
+            f"{fields.get('task')} {fields.get('kwargs')}\n"
+            f"{fields.get('error')}"
+        )
+    lines.append("\n/dlq_replay <id|all> - в очередь, /dlq_drop <id|all> - удалить")
+    await message.answer("\n".join(lines)[:MESSAGE_LIMIT])
+
+
+def _entry_ids(command: CommandObject):
+    """ID записей DLQ из аргументов команды (None - все)"""
+    args = (command.args or "").split()
+    return None if args == ["all"] else args
+
+
+@router.message(Command("dlq_replay"))
+async def cmd_dlq_replay(message: Message, command: CommandObject):
+    """/dlq_replay <id ...|all> - поставить задачи из DLQ обратно в очередь"""
+    if not command.args:
+        await message.answer("Использование: /dlq_replay <id ...|all>")
+        return
+
+    try:
+        replayed = await delivery.replay(_entry_ids(command))
+    except Exception as e:
+        logger.error(f"❌ Не удалось переотправить задачи из DLQ: {e}")
+        await message.answer("Не удалось переотправить задачи из DLQ")
+        return
+
+    logger.info(f"Админ {message.from_user.id} переотправил {replayed} задач из DLQ")
+    await message.answer(f"✅ В очередь поставлено задач: {replayed}")
+
+
+@router.message(Command("dlq_drop"))
+async def cmd_dlq_drop(message: Message, command: CommandObject):
+    """/dlq_drop <id ...|all> - удалить задачи из DLQ"""
+    if not command.args:
+        await message.answer("Использование: /dlq_drop <id ...|all>")
+        return
+
+    try:
+        dropped = await delivery.drop(_entry_ids(command))
+    except Exception as e:
+        logger.error(f"❌ Не удалось удалить задачи из DLQ: {e}")
+        await message.answer("Не удалось удалить задачи из DLQ")
+        return
+
+    logger.info(f"Админ {message.from_user.id} удалил {dropped} задач из DLQ")
+    await message.answer(f"✅ Удалено задач: {dropped}")
+
+
+@router.message(Command("cleanup"))
+async def cmd_cleanup(message: Message, command: CommandObject):
+    """
+    /cleanup <job_id> - прогресс фонового удаления сообщений уведомлений
+    (ID очистки пишется в лог при паузе/удалении объявления или профиля).
+    """
+    if not command.args:
+        await message.answer("Использование: /cleanup <job_id>")
+        return
+
+    job_id = command.args.strip()
+    try:
+        progress = await cleanup_progress(job_id)
+    except Exception as e:
+        logger.error(f"❌ Не удалось прочитать прогресс очистки {job_id}: {e}")
+        await message.answer("Не удалось прочитать прогресс очистки (Redis недоступен)")
+        return
+
+    if progress is None:
+        await message.answer(f"Очистка {job_id} не найдена (завершена более суток назад или не существует)")
+        return
+
+    done = progress.get("deleted", 0) + progress.get("failed", 0)
+    await message.answer(
+        f"Очистка {job_id}: обработано {done} из {progress.get('total', 0)}, "
+        f"удалено {progress.get('deleted', 0)}, не удалось {progress.get('failed', 0)}"
+    )
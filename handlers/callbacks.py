@@ -9,11 +9,13 @@ from sqlalchemy import select
 import logging
 
 from database.db import get_session
-from database.models import User, Post, NotificationLog, Rating
+from database.models import User, Post, Rating, NotificationLog
 from services.channel import publish_to_channel
-from services.matching import find_matching_subscriptions, get_users_to_notify, log_notification, find_matching_posts
-from tasks.notifications import send_match_notification, schedule_rating_request
-from config import POST_LIFETIME_MINUTES, RATING_REQUEST_DELAY_HOURS
+from services.route_keys import assign_key_ids
+from services.matching import index_post, unindex_post
+from services.match_stream import schedule_post_matching
+from services.rating_requests import schedule_rating_requests
+from config import POST_LIFETIME_MINUTES, RATING_REQUEST_DELAY_HOURS, NOTIFY_STALE_MODE
 from utils.helpers import format_local_time, safe_answer_callback
 from keyboards import (
     get_contact_keyboard,
@@ -34,8 +36,6 @@ async def show_contact(callback: CallbackQuery, bot: Bot):
     """
     logger.info(f"🔔 CALLBACK CONTACT: data='{callback.data}', user={callback.from_user.id}, msg_id={callback.message.message_id if callback.message else None}")
     try:
-        await safe_answer_callback(callback, "Обрабатываю...")
-        
         parts = callback.data.split(":")
         logger.info(f"Обработка contact callback: {parts}, всего частей: {len(parts)}")
         
@@ -54,12 +54,36 @@ async def show_contact(callback: CallbackQuery, bot: Bot):
             post = post_result.scalar_one_or_none()
             
             if not post:
+                await safe_answer_callback(callback)
                 await callback.message.edit_text(
                     "❌ Объявление не найдено или удалено.",
                     reply_markup=get_back_to_menu_keyboard()
                 )
                 return
             
+            # Ленивый режим (NOTIFY_STALE_MODE): уведомление о снятом объявлении
+            # не удалялось из чата - исправляем его при нажатии
+            stale_query = select(NotificationLog.notification_message_id).where(
+                NotificationLog.post_id == post_id,
+                NotificationLog.recipient_telegram_id == callback.from_user.id,
+                NotificationLog.is_stale == 1
+            )
+            stale_message_id = (await session.execute(stale_query)).scalar_one_or_none()
+            if stale_message_id is not None and stale_message_id == callback.message.message_id:
+                logger.info(f"Уведомление о посте {post_id} у пользователя {callback.from_user.id} устарело")
+                await safe_answer_callback(callback)
+                await callback.message.edit_text(
+                    "❌ Объявление больше не актуально.",
+                    reply_markup=get_back_to_menu_keyboard()
+                )
+                return
+            if stale_message_id is not None or (NOTIFY_STALE_MODE and post.status != "active"):
+                # Сводка: в сообщении есть и актуальные объявления - не редактируем
+                await safe_answer_callback(callback, "❌ Объявление больше не актуально", show_alert=True)
+                return
+            
+            await safe_answer_callback(callback, "Обрабатываю...")
+            
             # Получаем автора объявления
             author_query = select(User).where(User.id == author_user_id)
             author_result = await session.execute(author_query)
@@ -130,39 +154,22 @@ async def show_contact(callback: CallbackQuery, bot: Bot):
                 rating_result_2 = await session.execute(rating_check_2)
                 existing_rating_2 = rating_result_2.scalar_one_or_none()
                 
-                # Планируем оценку от текущего пользователя автору (если еще не оценено)
+                # Запросы на оценку в обе стороны (если ещё не оценено) - в rating_requests,
+                # их отправит workers/rating_requests.py; повторный клик не создаёт дублей
+                pairs = []
                 if not existing_rating_1:
-                    schedule_rating_request.apply_async(
-                        args=[
-                            callback.from_user.id,  # Кто оценивает
-                            author.telegram_id,      # Кого оценивают
-                            "пользователя",          # Имя (упрощённо)
-                            post_id,
-                            post.from_place,
-                            post.to_place
-                        ],
-                        countdown=RATING_REQUEST_DELAY_HOURS * 3600  # Через 2 часа
-                    )
-                    logger.info(f"Запланирован запрос на рейтинг: {callback.from_user.id} → {author.telegram_id} для поста {post_id}")
+                    pairs.append((current_user.id, author.id))
                 else:
                     logger.info(f"Оценка уже поставлена: {callback.from_user.id} → {author.telegram_id} для поста {post_id}, пропускаем запрос")
                 
-                # И наоборот - от автора текущему пользователю (если еще не оценено)
                 if not existing_rating_2:
-                    schedule_rating_request.apply_async(
-                        args=[
-                            author.telegram_id,
-                            callback.from_user.id,
-                            "пользователя",
-                            post_id,
-                            post.from_place,
-                            post.to_place
-                        ],
-                        countdown=RATING_REQUEST_DELAY_HOURS * 3600
-                    )
-                    logger.info(f"Запланирован запрос на рейтинг: {author.telegram_id} → {callback.from_user.id} для поста {post_id}")
+                    pairs.append((author.id, current_user.id))
                 else:
                     logger.info(f"Оценка уже поставлена: {author.telegram_id} → {callback.from_user.id} для поста {post_id}, пропускаем запрос")
+                
+                scheduled = await schedule_rating_requests(session, post_id, pairs)
+                if scheduled:
+                    logger.info(f"Запланировано {scheduled} запросов на рейтинг для поста {post_id} через {RATING_REQUEST_DELAY_HOURS} ч")
         
     except Exception as e:
         logger.error(f"Ошибка в show_contact: {e}", exc_info=True)
@@ -241,6 +248,7 @@ async def recreate_post(callback: CallbackQuery, state: FSMContext, bot: Bot):
             expires_at=expires_at
         )
         
+        await assign_key_ids(session, new_post)
         session.add(new_post)
         await session.flush()
         
@@ -250,107 +258,10 @@ async def recreate_post(callback: CallbackQuery, state: FSMContext, bot: Bot):
             new_post.channel_message_id = msg_id
         
         await session.commit()
+        index_post(new_post)
         
-        # Ищем совпадения
-        matching_user_ids = await find_matching_subscriptions(session, new_post)
-        
-        if matching_user_ids:
-            users_to_notify = await get_users_to_notify(session, new_post, matching_user_ids)
-            
-            for notify_user in users_to_notify:
-                send_match_notification.delay(
-                    recipient_telegram_id=notify_user.telegram_id,
-                    post_data={
-                        "id": new_post.id,
-                        "role": new_post.role,
-                        "from_place": new_post.from_place,
-                        "to_place": new_post.to_place,
-                        "departure_time": new_post.departure_time,
-                        "seats": new_post.seats,
-                        "price": new_post.price
-                    },
-                    author_data={
-                        "user_id": user.id,
-                        "name": callback.from_user.first_name,
-                        "rating": str(user.rating),
-                        "car_photo_file_id": user.car_photo_file_id if user.car_photo_file_id else None
-                    },
-                    recipient_db_id=notify_user.id
-                )
-        
-        # Ищем совпадающие объявления противоположной роли
-        matching_posts = await find_matching_posts(session, new_post)
-        logger.info(f"При пересоздании поста {new_post.id} найдено {len(matching_posts)} совпадающих объявлений")
-        
-        if matching_posts:
-            # Получаем авторов совпадающих объявлений
-            matching_author_ids = [p.author_id for p in matching_posts]
-            authors_query = select(User).where(User.id.in_(matching_author_ids))
-            authors_result = await session.execute(authors_query)
-            matching_authors = {author.id: author for author in authors_result.scalars().all()}
-            
-            # Отправляем уведомления авторам совпадающих объявлений
-            for matching_post in matching_posts:
-                matching_author = matching_authors.get(matching_post.author_id)
-                if not matching_author:
-                    continue
-                
-                # Проверяем, не отправляли ли уже уведомление этому пользователю
-                already_notified_query = select(NotificationLog).where(
-                    NotificationLog.post_id == new_post.id,
-                    NotificationLog.recipient_id == matching_author.id
-                )
-                already_result = await session.execute(already_notified_query)
-                if already_result.scalar_one_or_none():
-                    logger.info(f"Пропускаем {matching_author.id} - уже получил уведомление")
-                    continue
-                
-                logger.info(f"Отправляю уведомление автору совпадающего объявления {matching_post.id} (user_id={matching_author.id})")
-                
-                send_match_notification.delay(
-                    recipient_telegram_id=matching_author.telegram_id,
-                    post_data={
-                        "id": new_post.id,
-                        "role": new_post.role,
-                        "from_place": new_post.from_place,
-                        "to_place": new_post.to_place,
-                        "departure_time": new_post.departure_time,
-                        "seats": new_post.seats,
-                        "price": new_post.price
-                    },
-                    author_data={
-                        "user_id": user.id,
-                        "name": callback.from_user.first_name,
-                        "rating": str(user.rating),
-                        "car_photo_file_id": user.car_photo_file_id if user.car_photo_file_id else None
-                    },
-                    recipient_db_id=matching_author.id
-                )
-                
-                # Также отправляем уведомление автору текущего объявления о совпадающем
-                logger.info(f"Отправляю уведомление автору текущего объявления о совпадающем {matching_post.id}")
-                
-                send_match_notification.delay(
-                    recipient_telegram_id=user.telegram_id,
-                    post_data={
-                        "id": matching_post.id,
-                        "role": matching_post.role,
-                        "from_place": matching_post.from_place,
-                        "to_place": matching_post.to_place,
-                        "departure_time": matching_post.departure_time,
-                        "seats": matching_post.seats,
-                        "price": matching_post.price
-                    },
-                    author_data={
-                        "user_id": matching_author.id,
-                        "name": matching_author.phone[:4] + "***" if matching_author.phone else "Пользователь",
-                        "rating": str(matching_author.rating),
-                        "car_photo_file_id": matching_author.car_photo_file_id if matching_author.car_photo_file_id else None
-                    },
-                    recipient_db_id=user.id
-                )
-            
-            logger.info(f"✅ Запланировано отправка уведомлений о совпадающих объявлениях при пересоздании поста {new_post.id}")
+        # Матчинг и рассылка уведомлений не задерживают ответ пользователю
+        await schedule_post_matching(new_post, user)
         
         logger.info(f"Объявление {new_post.id} пересоздано из {post_id}")
     
@@ -392,20 +303,25 @@ async def pause_current_post(callback: CallbackQuery, bot: Bot):
             return
         
         from services.channel import delete_channel_message
-        from services.notifications_cleaner import delete_notifications_for_post, delete_notifications_received_by_author
+        from services.notifications_cleaner import (
+            take_notifications_for_posts,
+            take_notifications_received_by,
+            schedule_messages_cleanup
+        )
         
         post.status = "paused"
         if post.channel_message_id:
             await delete_channel_message(bot, post.channel_message_id)
             post.channel_message_id = None
         
-        # Удаляем уведомления о совпадениях у подписчиков
-        await delete_notifications_for_post(bot, session, post.id)
-        
-        # Удаляем уведомления, которые получил автор от других объявлений
-        await delete_notifications_received_by_author(bot, session, post.author_id)
+        # Уведомления о совпадениях у подписчиков и полученные автором
+        # от других объявлений: записи лога - сейчас, сообщения - в фоне
+        notifications = await take_notifications_for_posts(session, [post.id])
+        notifications += await take_notifications_received_by(session, post.author_id)
         
         await session.commit()
+        unindex_post(post.id)
+        await schedule_messages_cleanup(notifications)
     
     await callback.message.edit_text(
         "⏸ <b>Объявление приостановлено</b>\n\n"
@@ -441,17 +357,19 @@ async def delete_current_post(callback: CallbackQuery, bot: Bot):
             return
         
         from services.channel import delete_channel_message
-        from services.notifications_cleaner import delete_notifications_for_post
+        from services.notifications_cleaner import take_notifications_for_posts, schedule_messages_cleanup
         
         # Удаляем сообщение из канала
         if post.channel_message_id:
             await delete_channel_message(bot, post.channel_message_id)
         
-        # Удаляем уведомления о совпадениях у пользователей
-        await delete_notifications_for_post(bot, session, post.id)
+        # Уведомления о совпадениях у пользователей: записи лога - сейчас, сообщения - в фоне
+        notifications = await take_notifications_for_posts(session, [post.id])
         
         post.status = "deleted"
         await session.commit()
+        unindex_post(post.id)
+        await schedule_messages_cleanup(notifications)
     
     await callback.message.edit_text(
         "❌ <b>Объявление удалено</b>",
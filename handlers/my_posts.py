@@ -9,11 +9,16 @@ from sqlalchemy import select
 import logging
 
 from database.db import get_session
-from database.models import User, Post, NotificationLog
+from database.models import User, Post
 from services.channel import delete_channel_message, publish_to_channel
-from services.notifications_cleaner import delete_notifications_for_post, delete_notifications_received_by_author
-from services.matching import find_matching_subscriptions, get_users_to_notify, find_matching_posts
-from tasks.notifications import send_match_notification
+from services.notifications_cleaner import (
+    take_notifications_for_posts,
+    take_notifications_received_by,
+    revive_notifications,
+    schedule_messages_cleanup
+)
+from services.matching import index_post, unindex_post
+from services.match_stream import schedule_post_matching
 from config import POST_LIFETIME_MINUTES, CHANNEL_ID
 from keyboards import (
     get_posts_list_keyboard,
@@ -164,13 +169,14 @@ async def handle_post_action(callback: CallbackQuery, bot: Bot):
                 await delete_channel_message(bot, post.channel_message_id)
                 post.channel_message_id = None
             
-            # Удаляем уведомления о совпадениях у подписчиков
-            await delete_notifications_for_post(bot, session, post.id)
-            
-            # Удаляем уведомления, которые получил автор от других объявлений
-            await delete_notifications_received_by_author(bot, session, post.author_id)
+            # Уведомления о совпадениях у подписчиков и полученные автором
+            # от других объявлений: записи лога - сейчас, сообщения - в фоне
+            notifications = await take_notifications_for_posts(session, [post.id])
+            notifications += await take_notifications_received_by(session, post.author_id)
             
             await session.commit()
+            unindex_post(post.id)
+            await schedule_messages_cleanup(notifications)
             await callback.answer("⏸ Объявление приостановлено")
             
         elif action == "resume":
@@ -193,6 +199,7 @@ async def handle_post_action(callback: CallbackQuery, bot: Bot):
             
             # Возобновить
             post.status = "active"
+            await revive_notifications(session, post.id)
             
             # Получаем автора для публикации
             author_query = select(User).where(User.id == post.author_id)
@@ -205,111 +212,10 @@ async def handle_post_action(callback: CallbackQuery, bot: Bot):
                 post.channel_message_id = msg_id
             
             await session.commit()
+            index_post(post)
             
-            # Ищем совпадения и отправляем уведомления подписчикам
-            matching_user_ids = await find_matching_subscriptions(session, post)
-            logger.info(f"При возобновлении поста {post.id} найдено {len(matching_user_ids)} совпадений")
-            
-            if matching_user_ids:
-                users_to_notify = await get_users_to_notify(session, post, matching_user_ids)
-                logger.info(f"Пользователей для уведомления: {len(users_to_notify)}")
-                
-                for notify_user in users_to_notify:
-                    send_match_notification.delay(
-                        recipient_telegram_id=notify_user.telegram_id,
-                        post_data={
-                            "id": post.id,
-                            "role": post.role,
-                            "from_place": post.from_place,
-                            "to_place": post.to_place,
-                            "departure_time": post.departure_time,
-                            "seats": post.seats,
-                            "price": post.price
-                        },
-                        author_data={
-                            "user_id": author.id,
-                            "name": author.phone[:4] + "***",  # Скрываем часть номера
-                            "rating": str(author.rating),
-                            "car_photo_file_id": author.car_photo_file_id if author.car_photo_file_id else None
-                        },
-                        recipient_db_id=notify_user.id
-                    )
-                
-                logger.info(f"✅ Запланировано {len(users_to_notify)} уведомлений при возобновлении поста {post.id}")
-            
-            # Ищем совпадающие объявления противоположной роли
-            matching_posts = await find_matching_posts(session, post)
-            logger.info(f"При возобновлении поста {post.id} найдено {len(matching_posts)} совпадающих объявлений")
-            
-            if matching_posts:
-                # Получаем авторов совпадающих объявлений
-                matching_author_ids = [p.author_id for p in matching_posts]
-                authors_query = select(User).where(User.id.in_(matching_author_ids))
-                authors_result = await session.execute(authors_query)
-                matching_authors = {author.id: author for author in authors_result.scalars().all()}
-                
-                # Отправляем уведомления авторам совпадающих объявлений
-                for matching_post in matching_posts:
-                    matching_author = matching_authors.get(matching_post.author_id)
-                    if not matching_author:
-                        continue
-                    
-                    # Проверяем, не отправляли ли уже уведомление этому пользователю
-                    already_notified_query = select(NotificationLog).where(
-                        NotificationLog.post_id == post.id,
-                        NotificationLog.recipient_id == matching_author.id
-                    )
-                    already_result = await session.execute(already_notified_query)
-                    if already_result.scalar_one_or_none():
-                        logger.info(f"Пропускаем {matching_author.id} - уже получил уведомление")
-                        continue
-                    
-                    logger.info(f"Отправляю уведомление автору совпадающего объявления {matching_post.id} (user_id={matching_author.id})")
-                    
-                    send_match_notification.delay(
-                        recipient_telegram_id=matching_author.telegram_id,
-                        post_data={
-                            "id": post.id,
-                            "role": post.role,
-                            "from_place": post.from_place,
-                            "to_place": post.to_place,
-                            "departure_time": post.departure_time,
-                            "seats": post.seats,
-                            "price": post.price
-                        },
-                        author_data={
-                            "user_id": author.id,
-                            "name": author.phone[:4] + "***" if author.phone else "Пользователь",
-                            "rating": str(author.rating),
-                            "car_photo_file_id": author.car_photo_file_id if author.car_photo_file_id else None
-                        },
-                        recipient_db_id=matching_author.id
-                    )
-                    
-                    # Также отправляем уведомление автору текущего объявления о совпадающем
-                    logger.info(f"Отправляю уведомление автору текущего объявления о совпадающем {matching_post.id}")
-                    
-                    send_match_notification.delay(
-                        recipient_telegram_id=author.telegram_id,
-                        post_data={
-                            "id": matching_post.id,
-                            "role": matching_post.role,
-                            "from_place": matching_post.from_place,
-                            "to_place": matching_post.to_place,
-                            "departure_time": matching_post.departure_time,
-                            "seats": matching_post.seats,
-                            "price": matching_post.price
-                        },
-                        author_data={
-                            "user_id": matching_author.id,
-                            "name": matching_author.phone[:4] + "***" if matching_author.phone else "Пользователь",
-                            "rating": str(matching_author.rating),
-                            "car_photo_file_id": matching_author.car_photo_file_id if matching_author.car_photo_file_id else None
-                        },
-                        recipient_db_id=author.id
-                    )
-                
-                logger.info(f"✅ Запланировано отправка уведомлений о совпадающих объявлениях при возобновлении поста {post.id}")
+            # Матчинг и рассылка уведомлений не задерживают ответ пользователю
+            await schedule_post_matching(post, author)
             
             await callback.answer("▶️ Объявление возобновлено")
             
@@ -333,8 +239,11 @@ async def handle_post_action(callback: CallbackQuery, bot: Bot):
             
             # Продлить на 60 минут
             post.expires_at = datetime.utcnow() + timedelta(minutes=POST_LIFETIME_MINUTES)
+            if post.status == "paused":
+                await revive_notifications(session, post.id)
             post.status = "active"
             await session.commit()
+            index_post(post)
             await callback.answer(f"🔄 Продлено на {POST_LIFETIME_MINUTES} минут")
             
         elif action == "delete":
@@ -342,14 +251,15 @@ async def handle_post_action(callback: CallbackQuery, bot: Bot):
             if post.channel_message_id:
                 await delete_channel_message(bot, post.channel_message_id)
             
-            # Удаляем уведомления о совпадениях у пользователей
-            await delete_notifications_for_post(bot, session, post.id)
-            
-            # Удаляем уведомления, которые получил автор от других объявлений
-            await delete_notifications_received_by_author(bot, session, post.author_id)
+            # Уведомления о совпадениях у пользователей и полученные автором
+            # от других объявлений: записи лога - сейчас, сообщения - в фоне
+            notifications = await take_notifications_for_posts(session, [post.id])
+            notifications += await take_notifications_received_by(session, post.author_id)
             
             post.status = "deleted"
             await session.commit()
+            unindex_post(post.id)
+            await schedule_messages_cleanup(notifications)
             await callback.answer("❌ Объявление удалено")
             
             # Возвращаемся к списку
@@ -10,11 +10,13 @@ import logging
 
 from states import CreatePost
 from database.db import get_session
-from database.models import User, Post, Subscription, NotificationLog
+from database.models import User, Post, Subscription
 from services.keys_generator import generate_keys, keys_to_display
 from services.channel import publish_to_channel
-from services.matching import find_matching_subscriptions, get_users_to_notify, log_notification, find_matching_posts
-from tasks.notifications import send_match_notification
+from services.route_keys import assign_key_ids
+from services.matching import index_subscription, index_post
+from services.match_stream import schedule_post_matching
+from services.reverse_matching import notify_subscription_matches
 from config import MAX_PRICE, POST_LIFETIME_MINUTES
 from utils.message_cleaner import add_message_to_delete, clean_chat
 from utils.retry_utils import safe_callback_message_edit, retry_on_database_error
@@ -401,6 +403,7 @@ async def publish_post(callback: CallbackQuery, state: FSMContext, bot: Bot):
             expires_at=expires_at
         )
         
+        await assign_key_ids(session, post)
         session.add(post)
         await session.flush()  # Получаем ID
         
@@ -415,125 +418,10 @@ async def publish_post(callback: CallbackQuery, state: FSMContext, bot: Bot):
             post.channel_message_id = channel_msg_id
         
         await session.commit()
+        index_post(post)
         
-        # Ищем совпадения и отправляем уведомления
-        matching_user_ids = await find_matching_subscriptions(session, post)
-        logger.info(f"Найдено {len(matching_user_ids)} совпадений для поста {post.id}: {matching_user_ids}")
-        
-        if matching_user_ids:
-            users_to_notify = await get_users_to_notify(session, post, matching_user_ids)
-            logger.info(f"Пользователей для уведомления: {len(users_to_notify)}")
-            
-            if users_to_notify:
-                for user in users_to_notify:
-                    logger.info(f"Отправляю уведомление пользователю {user.telegram_id} (user_id={user.id})")
-                    # Отправляем через Celery (message_id будет сохранен внутри задачи)
-                    send_match_notification.delay(
-                        recipient_telegram_id=user.telegram_id,
-                        post_data={
-                            "id": post.id,
-                            "role": post.role,
-                            "from_place": post.from_place,
-                            "to_place": post.to_place,
-                            "departure_time": post.departure_time,
-                            "seats": post.seats,
-                            "price": post.price
-                        },
-                        author_data={
-                            "user_id": author.id,
-                            "name": callback.from_user.first_name,
-                            "rating": str(author.rating),
-                            "car_photo_file_id": author.car_photo_file_id if author.car_photo_file_id else None
-                        },
-                        recipient_db_id=user.id
-                    )
-                
-                logger.info(f"✅ Запланировано отправка {len(users_to_notify)} уведомлений о совпадении")
-            else:
-                logger.info("Нет пользователей для уведомления (все уже получили уведомления ранее)")
-        else:
-            logger.info(f"Нет совпадений для поста {post.id}")
-        
-        # Ищем совпадающие объявления противоположной роли
-        matching_posts = await find_matching_posts(session, post)
-        logger.info(f"Найдено {len(matching_posts)} совпадающих объявлений для поста {post.id}")
-        
-        if matching_posts:
-            # Получаем авторов совпадающих объявлений
-            matching_author_ids = [p.author_id for p in matching_posts]
-            authors_query = select(User).where(User.id.in_(matching_author_ids))
-            authors_result = await session.execute(authors_query)
-            matching_authors = {author.id: author for author in authors_result.scalars().all()}
-            
-            # Отправляем уведомления авторам совпадающих объявлений
-            for matching_post in matching_posts:
-                matching_author = matching_authors.get(matching_post.author_id)
-                if not matching_author:
-                    continue
-                
-                # Проверяем, не отправляли ли уже уведомление этому пользователю
-                already_notified_query = select(NotificationLog).where(
-                    NotificationLog.post_id == post.id,
-                    NotificationLog.recipient_id == matching_author.id
-                )
-                already_result = await session.execute(already_notified_query)
-                if already_result.scalar_one_or_none():
-                    logger.info(f"Пропускаем {matching_author.id} - уже получил уведомление")
-                    continue
-                
-                logger.info(f"Отправляю уведомление автору совпадающего объявления {matching_post.id} (user_id={matching_author.id})")
-                
-                # Определяем текст в зависимости от роли
-                if post.role == "driver":
-                    notification_text = "🔔 <b>Найден клиент!</b>"
-                else:
-                    notification_text = "🔔 <b>Найден водитель!</b>"
-                
-                send_match_notification.delay(
-                    recipient_telegram_id=matching_author.telegram_id,
-                    post_data={
-                        "id": post.id,
-                        "role": post.role,
-                        "from_place": post.from_place,
-                        "to_place": post.to_place,
-                        "departure_time": post.departure_time,
-                        "seats": post.seats,
-                        "price": post.price
-                    },
-                    author_data={
-                        "user_id": author.id,
-                        "name": callback.from_user.first_name,
-                        "rating": str(author.rating),
-                        "car_photo_file_id": author.car_photo_file_id if author.car_photo_file_id else None
-                    },
-                    recipient_db_id=matching_author.id
-                )
-                
-                # Также отправляем уведомление автору текущего объявления о совпадающем
-                logger.info(f"Отправляю уведомление автору текущего объявления о совпадающем {matching_post.id}")
-                
-                matching_role_text = "клиент" if matching_post.role == "passenger" else "водитель"
-                send_match_notification.delay(
-                    recipient_telegram_id=author.telegram_id,
-                    post_data={
-                        "id": matching_post.id,
-                        "role": matching_post.role,
-                        "from_place": matching_post.from_place,
-                        "to_place": matching_post.to_place,
-                        "departure_time": matching_post.departure_time,
-                        "seats": matching_post.seats,
-                        "price": matching_post.price
-                    },
-                    author_data={
-                        "user_id": matching_author.id,
-                        "name": matching_author.phone[:4] + "***" if matching_author.phone else "Пользователь",
-                        "rating": str(matching_author.rating),
-                        "car_photo_file_id": matching_author.car_photo_file_id if matching_author.car_photo_file_id else None
-                    },
-                    recipient_db_id=author.id
-                )
-            
-            logger.info(f"✅ Запланировано отправка уведомлений о совпадающих объявлениях для поста {post.id}")
+        # Матчинг и рассылка уведомлений не задерживают ответ пользователю
+        await schedule_post_matching(post, author)
         
         logger.info(f"Объявление {post.id} опубликовано пользователем {callback.from_user.id}")
         
@@ -577,11 +465,20 @@ async def subscribe_to_route(callback: CallbackQuery, state: FSMContext):
         )
         
         try:
+            await assign_key_ids(session, subscription)
             session.add(subscription)
             await session.commit()
+            index_subscription(subscription)
             await callback.answer("✅ Подписка создана!", show_alert=True)
         except:
             await callback.answer("Такая подписка уже существует", show_alert=True)
+            return
+        
+        # Уведомляем об уже активных объявлениях по этому маршруту
+        try:
+            await notify_subscription_matches(session, subscription)
+        except Exception as e:
+            logger.error(f"Ошибка обратного матчинга подписки {subscription.id}: {e}", exc_info=True)
 
 
 @router.callback_query(CreatePost.confirming, F.data == "post:edit")
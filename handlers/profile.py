@@ -11,9 +11,15 @@ import logging
 
 from states import EditProfile
 from database.db import get_session
-from database.models import User, Post, Subscription, NotificationLog, Rating, RatingRequest
+from database.models import User, Post, Subscription, Rating, RatingRequest
 from services.channel import delete_channel_message
-from services.notifications_cleaner import delete_notifications_for_post, delete_notifications_received_by_author
+from services.digest import digest_kwargs
+from services.notifications_cleaner import (
+    take_notifications_for_posts,
+    take_notifications_received_by,
+    schedule_messages_cleanup
+)
+from services.matching import unindex_subscription, unindex_post
 from utils.message_cleaner import add_message_to_delete, clean_chat
 from keyboards import (
     get_profile_keyboard,
@@ -21,7 +27,8 @@ from keyboards import (
     get_phone_keyboard,
     get_remove_keyboard,
     get_back_to_menu_keyboard,
-    get_delete_profile_confirm_keyboard
+    get_delete_profile_confirm_keyboard,
+    get_digest_settings_keyboard
 )
 
 router = Router()
@@ -220,6 +227,81 @@ async def switch_role(callback: CallbackQuery):
     )
 
 
+def digest_settings_text(threshold: int, window_sec: int) -> str:
+    """Текст экрана настроек сводки уведомлений"""
+    if threshold == 0:
+        current = "выключена - каждое совпадение приходит отдельным сообщением"
+    else:
+        current = (
+            f"первые {threshold} совпадений за {window_sec // 60} мин приходят по отдельности, "
+            f"остальные - одним сообщением в конце окна"
+        )
+    return (
+        f"🔔 <b>Сводка уведомлений</b>\n\n"
+        f"Сейчас: {current}\n\n"
+        "Верхний ряд - сколько совпадений присылать по отдельности, "
+        "нижний - длина окна:"
+    )
+
+
+@router.callback_query(F.data == "profile:digest")
+async def show_digest_settings(callback: CallbackQuery):
+    """Показать настройки сводки уведомлений"""
+    await callback.answer()
+    
+    async with get_session() as session:
+        query = select(User).where(User.telegram_id == callback.from_user.id)
+        result = await session.execute(query)
+        user = result.scalar_one_or_none()
+        
+        if not user:
+            return
+        
+        settings = digest_kwargs(user)
+    
+    await callback.message.edit_text(
+        digest_settings_text(settings["digest_threshold"], settings["digest_window"]),
+        parse_mode="HTML",
+        reply_markup=get_digest_settings_keyboard(settings["digest_threshold"], settings["digest_window"])
+    )
+
+
+@router.callback_query(F.data.startswith("digest:"))
+async def update_digest_settings(callback: CallbackQuery):
+    """Изменение порога или окна сводки уведомлений"""
+    _, field, value = callback.data.split(":")
+    
+    async with get_session() as session:
+        query = select(User).where(User.telegram_id == callback.from_user.id)
+        result = await session.execute(query)
+        user = result.scalar_one_or_none()
+        
+        if not user:
+            return
+        
+        settings = digest_kwargs(user)
+        if settings["digest_threshold" if field == "threshold" else "digest_window"] == int(value):
+            # Повторное нажатие на текущее значение - сообщение не изменится
+            await callback.answer()
+            return
+        
+        if field == "threshold":
+            user.digest_threshold = int(value)
+        else:
+            user.digest_window_sec = int(value)
+        await session.commit()
+        
+        settings = digest_kwargs(user)
+    
+    await callback.answer("✅ Сохранено")
+    
+    await callback.message.edit_text(
+        digest_settings_text(settings["digest_threshold"], settings["digest_window"]),
+        parse_mode="HTML",
+        reply_markup=get_digest_settings_keyboard(settings["digest_threshold"], settings["digest_window"])
+    )
+
+
 @router.callback_query(F.data == "profile:delete")
 async def show_delete_confirm(callback: CallbackQuery):
     """Показать подтверждение удаления профиля"""
@@ -269,18 +351,11 @@ async def delete_profile(callback: CallbackQuery, bot: Bot):
                     await delete_channel_message(bot, post.channel_message_id)
                 except:
                     pass
-            
-            # Удаляем уведомления о совпадениях
-            try:
-                await delete_notifications_for_post(bot, session, post.id)
-            except:
-                pass
-        
-        # Удаляем уведомления, которые получил пользователь
-        try:
-            await delete_notifications_received_by_author(bot, session, user.id)
-        except:
-            pass
+        
+        # Уведомления о совпадениях с объявлениями пользователя и полученные им:
+        # записи лога - сейчас (до удаления объявлений), сообщения - в фоне
+        notifications = await take_notifications_for_posts(session, [post.id for post in posts], keep_stale=False)
+        notifications += await take_notifications_received_by(session, user.id)
         
         # Удаляем все подписки пользователя
         subscriptions_query = select(Subscription).where(Subscription.user_id == user.id)
@@ -288,13 +363,7 @@ async def delete_profile(callback: CallbackQuery, bot: Bot):
         subscriptions = subscriptions_result.scalars().all()
         for sub in subscriptions:
             await session.delete(sub)
-        
-        # Удаляем все записи в логе уведомлений, где пользователь был получателем
-        notifications_query = select(NotificationLog).where(NotificationLog.recipient_id == user.id)
-        notifications_result = await session.execute(notifications_query)
-        notifications = notifications_result.scalars().all()
-        for notification in notifications:
-            await session.delete(notification)
+        deleted_subscription_ids = [sub.id for sub in subscriptions]
         
         # Удаляем все оценки, где пользователь был оценщиком или получателем
         ratings_from_query = select(Rating).where(Rating.from_user_id == user.id)
@@ -330,6 +399,12 @@ async def delete_profile(callback: CallbackQuery, bot: Bot):
         await session.delete(user)
         await session.commit()
         
+        for sub_id in deleted_subscription_ids:
+            unindex_subscription(sub_id)
+        for post in posts:
+            unindex_post(post.id)
+        await schedule_messages_cleanup(notifications)
+        
         logger.info(f"Профиль пользователя {user.id} (telegram_id={user.telegram_id}) удален")
     
     await callback.message.edit_text(
@@ -12,6 +12,9 @@ from states import Subscriptions
 from database.db import get_session
 from database.models import User, Subscription
 from services.keys_generator import generate_keys, keys_to_display
+from services.matching import index_subscription, unindex_subscription
+from services.route_keys import assign_key_ids
+from services.reverse_matching import notify_subscription_matches
 from utils.message_cleaner import add_message_to_delete, clean_chat
 from keyboards import (
     get_subscriptions_keyboard,
@@ -233,8 +236,10 @@ async def confirm_subscription(callback: CallbackQuery, state: FSMContext, bot:
             )
             
             try:
+                await assign_key_ids(session, subscription)
                 session.add(subscription)
                 await session.commit()
+                index_subscription(subscription)
                 
                 # Очищаем все временные сообщения перед завершением диалога
                 await clean_chat(bot, callback.from_user.id, state)
@@ -258,6 +263,12 @@ async def confirm_subscription(callback: CallbackQuery, state: FSMContext, bot:
                         reply_markup=get_back_to_menu_keyboard()
                     )
                 
+                # Уведомляем об уже активных объявлениях по этому маршруту
+                try:
+                    await notify_subscription_matches(session, subscription)
+                except Exception as e:
+                    logger.error(f"Ошибка обратного матчинга подписки {subscription.id}: {e}", exc_info=True)
+                
             except IntegrityError as e:
                 # Дублирующаяся подписка (на случай race condition)
                 await session.rollback()  # Важно: откатываем транзакцию
@@ -331,6 +342,8 @@ async def delete_subscription(callback: CallbackQuery):
         )
         await session.commit()
     
+    unindex_subscription(sub_id)
+    
     await callback.answer("✅ Подписка удалена")
     
     # Возвращаемся к списку
@@ -10,6 +10,8 @@ from aiogram.types import (
     KeyboardButton
 )
 
+from config import DIGEST_THRESHOLD, DIGEST_WINDOW_SEC
+
 
 # ==================== СОГЛАСИЕ С ПРАВИЛАМИ ====================
 
@@ -241,6 +243,7 @@ def get_profile_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="📱 Изменить телефон", callback_data="profile:phone")],
         [InlineKeyboardButton(text="🔄 Сменить роль", callback_data="profile:role")],
+        [InlineKeyboardButton(text="🔔 Сводка уведомлений", callback_data="profile:digest")],
         [InlineKeyboardButton(text="🗑 Удалить профиль", callback_data="profile:delete")],
         [InlineKeyboardButton(text="🏠 В меню", callback_data="main_menu")]
     ])
@@ -260,6 +263,42 @@ def get_role_change_keyboard(current_role: str) -> InlineKeyboardMarkup:
     ])
 
 
+# Варианты настроек сводки; значения по умолчанию из config.py добавляются к ним,
+# чтобы к ним можно было вернуться
+DIGEST_THRESHOLD_OPTIONS = (0, 3, 5, 10)
+DIGEST_WINDOW_OPTIONS = (300, 600, 900, 1800)
+
+
+def get_digest_settings_keyboard(threshold: int, window_sec: int) -> InlineKeyboardMarkup:
+    """Клавиатура настроек сводки уведомлений (текущие значения отмечены ✅)"""
+    def mark(text: str, selected: bool) -> str:
+        return f"✅ {text}" if selected else text
+    
+    def window_text(seconds: int) -> str:
+        return f"{seconds // 60} мин" if seconds % 60 == 0 else f"{seconds} сек"
+    
+    thresholds = sorted(set(DIGEST_THRESHOLD_OPTIONS) | {DIGEST_THRESHOLD})
+    windows = sorted(set(DIGEST_WINDOW_OPTIONS) | {DIGEST_WINDOW_SEC})
+    
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(
+                text=mark("Выкл" if value == 0 else str(value), threshold == value),
+                callback_data=f"digest:threshold:{value}"
+            )
+            for value in thresholds
+        ],
+        [
+            InlineKeyboardButton(
+                text=mark(window_text(value), window_sec == value),
+                callback_data=f"digest:window:{value}"
+            )
+            for value in windows
+        ],
+        [InlineKeyboardButton(text="◀️ Назад", callback_data="profile")]
+    ])
+
+
 def get_delete_profile_confirm_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура подтверждения удаления профиля"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# matcher.py - Точка входа отдельного матчера
+# Читает стрим "post_published", матчит объявления и рассылает уведомления
+
+import asyncio
+import logging
+import signal
+import sys
+
+from config import MATCHING_BACKEND
+from database.db import close_db
+from utils.redis_client import close_redis
+from workers.match_stream import MatchStreamConsumer
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    """Запуск матчера до получения SIGTERM/SIGINT"""
+    # In-memory индексы обновляются хуками в процессе бота, здесь они устарели бы
+    if MATCHING_BACKEND != "sql":
+        logger.error("Отдельный матчер требует MATCHING_BACKEND=sql (и MATCHER_IN_BOT=false у бота)")
+        sys.exit(1)
+    
+    consumer = MatchStreamConsumer()
+    
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, consumer.stop)
+    
+    try:
+        await consumer.run()
+    finally:
+        await close_redis()
+        await close_db()
+        logger.info("Матчер остановлен")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
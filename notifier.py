@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# notifier.py - Точка входа потребителя очереди уведомлений
+# Заменяет Celery воркер при NOTIFY_QUEUE_BACKEND=stream
+
+import asyncio
+import logging
+import signal
+import sys
+
+from config import NOTIFY_QUEUE_BACKEND
+from tasks import runtime
+from workers.notify_queue import NotifyQueueConsumer
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    """Запуск потребителя до получения SIGTERM/SIGINT"""
+    if NOTIFY_QUEUE_BACKEND != "stream":
+        logger.error("notifier.py требует NOTIFY_QUEUE_BACKEND=stream (иначе задачи выполняет Celery)")
+        sys.exit(1)
+
+    runtime.attach()
+    consumer = NotifyQueueConsumer()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, consumer.stop)
+
+    try:
+        await consumer.run()
+    finally:
+        await runtime.detach()
+        logger.info("Потребитель уведомлений остановлен")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
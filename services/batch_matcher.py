@@ -0,0 +1,168 @@
+# services/batch_matcher.py - Пакетный матчинг всех подписок со всеми объявлениями
+# Разреженные матрицы инцидентности ключей (scipy.sparse), без цикла по объявлениям
+
+import logging
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Subscription, Post
+
+logger = logging.getLogger(__name__)
+
+# Строка для матчинга: (id, user_id/author_id, keys_from, keys_to)
+RouteRow = Tuple[int, int, Sequence[str], Sequence[str]]
+
+# Сколько объявлений обрабатывать за одно матричное произведение
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def _build_vocabulary(*row_sets: Iterable[RouteRow]) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """Словари ключ → номер колонки отдельно для keys_from и keys_to"""
+    vocabulary_from: Dict[str, int] = {}
+    vocabulary_to: Dict[str, int] = {}
+    for rows in row_sets:
+        for _, _, keys_from, keys_to in rows:
+            for key in keys_from or ():
+                vocabulary_from.setdefault(key, len(vocabulary_from))
+            for key in keys_to or ():
+                vocabulary_to.setdefault(key, len(vocabulary_to))
+    return vocabulary_from, vocabulary_to
+
+
+def _incidence(key_lists: Sequence[Sequence[str]], vocabulary: Dict[str, int]) -> sparse.csr_matrix:
+    """
+    Матрица инцидентности строк и ключей: [i, k] = 1, если ключ k есть в строке i.
+    Повторяющиеся ключи строки учитываются один раз.
+    """
+    indptr = [0]
+    indices: List[int] = []
+    for keys in key_lists:
+        indices.extend({vocabulary[key] for key in keys or ()})
+        indptr.append(len(indices))
+
+    return sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.int32), np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(key_lists), len(vocabulary))
+    )
+
+
+def _subset_matrix(sub_matrix: sparse.csr_matrix, post_matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+    """
+    Отношение "ключи подписки ⊆ ключей объявления" для всех пар.
+
+    (S · Pᵀ)[s, p] - число общих ключей; подмножество - когда оно равно
+    числу ключей подписки. Подписки без ключей совпадают с любым объявлением.
+
+    Returns:
+        Булева разреженная матрица (подписки × объявления)
+    """
+    sub_lengths = np.diff(sub_matrix.indptr)
+    counts = (sub_matrix @ post_matrix.T).tocsr()
+
+    entry_rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+    counts.data = counts.data == sub_lengths[entry_rows]
+    counts.eliminate_zeros()
+    result = counts.astype(bool)
+
+    unkeyed = np.flatnonzero(sub_lengths == 0)
+    if unkeyed.size:
+        n_posts = post_matrix.shape[0]
+        rows = np.repeat(unkeyed, n_posts)
+        cols = np.tile(np.arange(n_posts), unkeyed.size)
+        result = result + sparse.csr_matrix(
+            (np.ones(rows.size, dtype=bool), (rows, cols)),
+            shape=result.shape
+        )
+
+    return result
+
+
+def match_all(
+    subscriptions: Sequence[RouteRow],
+    posts: Sequence[RouteRow],
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> List[Tuple[int, int, int]]:
+    """
+    Находит все пары (объявление, подписка) по правилу find_matching_subscriptions:
+    ВСЕ ключи keys_from и keys_to подписки присутствуют в объявлении,
+    подписки автора объявления не учитываются.
+
+    Объявления обрабатываются пачками по chunk_size, чтобы промежуточная
+    матрица общих ключей не росла с общим числом объявлений.
+
+    Args:
+        subscriptions: Строки подписок (sub_id, user_id, keys_from, keys_to)
+        posts: Строки объявлений (post_id, author_id, keys_from, keys_to)
+        chunk_size: Объявлений в одной пачке
+
+    Returns:
+        Список (post_id, sub_id, user_id), отсортированный по post_id и sub_id
+    """
+    if not subscriptions or not posts:
+        return []
+
+    vocabulary_from, vocabulary_to = _build_vocabulary(subscriptions, posts)
+
+    sub_ids = np.array([row[0] for row in subscriptions], dtype=np.int64)
+    sub_users = np.array([row[1] for row in subscriptions], dtype=np.int64)
+    sub_from = _incidence([row[2] for row in subscriptions], vocabulary_from)
+    sub_to = _incidence([row[3] for row in subscriptions], vocabulary_to)
+
+    post_ids = np.array([row[0] for row in posts], dtype=np.int64)
+    post_authors = np.array([row[1] for row in posts], dtype=np.int64)
+
+    found_posts: List[np.ndarray] = []
+    found_subs: List[np.ndarray] = []
+    for start in range(0, len(posts), chunk_size):
+        chunk = posts[start:start + chunk_size]
+        post_from = _incidence([row[2] for row in chunk], vocabulary_from)
+        post_to = _incidence([row[3] for row in chunk], vocabulary_to)
+
+        both = _subset_matrix(sub_from, post_from).multiply(_subset_matrix(sub_to, post_to)).tocoo()
+        sub_index = both.row
+        post_index = both.col + start
+
+        # Автор не получает совпадений со своими подписками
+        own = sub_users[sub_index] == post_authors[post_index]
+        found_subs.append(sub_index[~own])
+        found_posts.append(post_index[~own])
+
+    sub_index = np.concatenate(found_subs)
+    post_index = np.concatenate(found_posts)
+    order = np.lexsort((sub_ids[sub_index], post_ids[post_index]))
+
+    return list(zip(
+        post_ids[post_index][order].tolist(),
+        sub_ids[sub_index][order].tolist(),
+        sub_users[sub_index][order].tolist()
+    ))
+
+
+async def load_rows(session: AsyncSession, active_only: bool = True) -> Tuple[List[RouteRow], List[RouteRow]]:
+    """
+    Загружает строки подписок и объявлений для match_all.
+
+    Args:
+        session: Сессия БД
+        active_only: Только активные объявления
+
+    Returns:
+        (подписки, объявления)
+    """
+    subs_result = await session.execute(
+        select(Subscription.id, Subscription.user_id, Subscription.keys_from, Subscription.keys_to)
+    )
+    subscriptions = [tuple(row) for row in subs_result.all()]
+
+    posts_query = select(Post.id, Post.author_id, Post.keys_from, Post.keys_to)
+    if active_only:
+        posts_query = posts_query.where(Post.status == "active")
+    posts_result = await session.execute(posts_query)
+    posts = [tuple(row) for row in posts_result.all()]
+
+    logger.info(f"Загружено {len(subscriptions)} подписок и {len(posts)} объявлений для пакетного матчинга")
+    return subscriptions, posts
@@ -0,0 +1,175 @@
+# services/digest.py - Сводка уведомлений о совпадениях
+# Совпадения сверх порога за окно копятся в Redis и уходят одним сообщением
+
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from config import DIGEST_THRESHOLD, DIGEST_WINDOW_SEC
+from database.models import User
+from utils import metrics
+from utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Счётчик совпадений получателя в текущем окне
+COUNT_KEY = "digest:count:{user_id}"
+# Отложенные до сводки совпадения получателя
+PENDING_KEY = "digest:pending:{user_id}"
+
+# Сколько хранить отложенные совпадения, если задача сводки потерялась
+PENDING_TTL = 24 * 3600
+
+
+def digest_kwargs(user: User) -> Dict[str, int]:
+    """
+    Настройки сводки пользователя для передачи в задачу уведомления.
+
+    Args:
+        user: Получатель
+
+    Returns:
+        {"digest_threshold": ..., "digest_window": ...}
+    """
+    return {
+        "digest_threshold": user.digest_threshold if user.digest_threshold is not None else DIGEST_THRESHOLD,
+        "digest_window": user.digest_window_sec or DIGEST_WINDOW_SEC
+    }
+
+
+async def admit(user_id: int, threshold: Optional[int], window: Optional[int]) -> bool:
+    """
+    Учитывает совпадение в окне получателя.
+
+    Args:
+        user_id: ID получателя в БД
+        threshold: Сколько совпадений за окно отправлять по отдельности (0 - сводка выключена)
+        window: Длина окна в секундах
+
+    Returns:
+        True - отправить отдельным сообщением, False - отложить в сводку
+    """
+    threshold = DIGEST_THRESHOLD if threshold is None else threshold
+    window = window or DIGEST_WINDOW_SEC
+    if threshold <= 0:
+        return True
+
+    key = COUNT_KEY.format(user_id=user_id)
+    try:
+        async with get_redis().pipeline(transaction=True) as pipe:
+            # Окно начинается с первого совпадения (SET NX EX), дальше только растёт счётчик
+            pipe.set(key, 0, ex=window, nx=True)
+            pipe.incr(key)
+            _, count = await pipe.execute()
+    except Exception as e:
+        # Без Redis сводка невозможна - отправляем как обычно
+        logger.warning(f"⚠️ Сводка уведомлений недоступна: {e}")
+        return True
+
+    return count <= threshold
+
+
+async def defer(user_id: int, post_data: Dict[str, Any], author_data: Dict[str, Any]) -> Optional[float]:
+    """
+    Откладывает совпадение в сводку получателя.
+
+    Args:
+        user_id: ID получателя в БД
+        post_data: Данные объявления
+        author_data: Данные автора
+
+    Returns:
+        Через сколько секунд отправить сводку, если её нужно запланировать
+        (первое отложенное совпадение), иначе None - сводка уже запланирована
+    """
+    pending_key = PENDING_KEY.format(user_id=user_id)
+    item = json.dumps({"post": post_data, "author": author_data}, ensure_ascii=False)
+
+    async with get_redis().pipeline(transaction=True) as pipe:
+        pipe.rpush(pending_key, item)
+        pipe.expire(pending_key, PENDING_TTL)
+        pipe.pttl(COUNT_KEY.format(user_id=user_id))
+        pending, _, window_left_ms = await pipe.execute()
+
+    metrics.inc("digest.deferred")
+    if pending != 1:
+        return None
+    # Сводка уходит в конце окна
+    return max(window_left_ms, 1000) / 1000
+
+
+async def peek_pending(user_id: int) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Читает отложенные совпадения получателя (без повторов объявлений).
+    Из Redis они удаляются только после отправки (ack_pending).
+
+    Args:
+        user_id: ID получателя в БД
+
+    Returns:
+        (список {"post": ..., "author": ...}, сколько записей прочитано)
+    """
+    raw_items = await get_redis().lrange(PENDING_KEY.format(user_id=user_id), 0, -1)
+
+    items = {}
+    for raw in raw_items:
+        item = json.loads(raw)
+        items.setdefault(item["post"]["id"], item)
+    return list(items.values()), len(raw_items)
+
+
+async def ack_pending(user_id: int, count: int) -> Optional[float]:
+    """
+    Удаляет отправленные в сводке совпадения.
+
+    Args:
+        user_id: ID получателя в БД
+        count: Сколько записей было прочитано peek_pending
+
+    Returns:
+        Через сколько секунд отправить следующую сводку, если за время
+        отправки отложились новые совпадения, иначе None
+    """
+    pending_key = PENDING_KEY.format(user_id=user_id)
+    async with get_redis().pipeline(transaction=True) as pipe:
+        pipe.ltrim(pending_key, count, -1)
+        pipe.llen(pending_key)
+        pipe.pttl(COUNT_KEY.format(user_id=user_id))
+        _, left, window_left_ms = await pipe.execute()
+
+    if not left:
+        return None
+    return max(window_left_ms, 1000) / 1000
+
+
+def render_digest(items: List[Dict[str, Any]]) -> Tuple[str, InlineKeyboardMarkup]:
+    """
+    Формирует сообщение сводки: список объявлений и кнопка "Связаться" для каждого.
+
+    Args:
+        items: Отложенные совпадения (не больше DIGEST_MAX_ITEMS)
+
+    Returns:
+        (текст, клавиатура)
+    """
+    lines = [f"🔔 <b>Найдено попутчиков: {len(items)}</b>\n"]
+    buttons = []
+
+    for number, item in enumerate(items, start=1):
+        post_data, author_data = item["post"], item["author"]
+        role_emoji = "🚗" if post_data["role"] == "driver" else "🚶"
+        seats = f" · 🪑 {post_data['seats']}" if post_data["role"] == "driver" and post_data.get("seats") else ""
+        lines.append(
+            f"{number}. {role_emoji} <b>{post_data['from_place']} → {post_data['to_place']}</b>\n"
+            f"    ⏰ {post_data.get('departure_time') or 'Не указано'} · "
+            f"💰 {post_data['price']} сом{seats} · ⭐ {author_data['rating']}"
+        )
+        buttons.append([InlineKeyboardButton(
+            text=f"📞 {number}. Связаться",
+            callback_data=f"contact:{post_data['id']}:{author_data['user_id']}"
+        )])
+
+    buttons.append([InlineKeyboardButton(text="🏠 В меню", callback_data="main_menu")])
+    return "\n".join(lines), InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -0,0 +1,97 @@
+# services/fanout.py - Рассылка уведомлений о совпадениях
+# Ставит в очередь Celery уведомления по результату матчинга объявления
+
+import logging
+from typing import List
+
+from config import NOTIFY_BATCH_SIZE
+from database.models import Post, User
+from services import notify_ledger
+from services.digest import digest_kwargs
+from services.matching import PostMatches
+from tasks.notifications import send_match_notification, send_match_notifications_batch
+
+logger = logging.getLogger(__name__)
+
+
+def schedule_post_notifications(post_id: int, recipient_ids: List[int]) -> int:
+    """
+    Ставит в очередь уведомления об одном объявлении пачками
+    по NOTIFY_BATCH_SIZE получателей (одна задача Celery на пачку).
+
+    Args:
+        post_id: ID объявления
+        recipient_ids: ID получателей в БД
+
+    Returns:
+        Количество поставленных задач
+    """
+    # Один получатель может прийти и как подписчик, и как автор встречного объявления
+    recipient_ids = list(dict.fromkeys(recipient_ids))
+    batches = 0
+    for start in range(0, len(recipient_ids), NOTIFY_BATCH_SIZE):
+        send_match_notifications_batch.delay(
+            post_id=post_id,
+            recipient_ids=recipient_ids[start:start + NOTIFY_BATCH_SIZE]
+        )
+        batches += 1
+    return batches
+
+
+def fan_out_post_matches(
+    post: Post,
+    author: User,
+    matches: PostMatches
+) -> int:
+    """
+    Ставит в очередь уведомления по результату матчинга объявления:
+    - подписчикам, чьи подписки совпали с объявлением, и авторам встречных
+      объявлений - о новом объявлении (пакетными задачами);
+    - автору объявления - о каждом встречном объявлении.
+
+    Дедупликация по notifications_log уже выполнена в match_posts_batch,
+    поэтому здесь нет запросов к БД - только проверка журнала notify_ledger
+    (уведомления, отправленные, но ещё не записанные в notifications_log).
+
+    Args:
+        post: Сматченное объявление
+        author: Автор объявления
+        matches: Результат матчинга (match_posts_batch)
+
+    Returns:
+        Количество запланированных уведомлений
+    """
+    recipient_ids = [user.id for user in matches.users_to_notify]
+    for matching_post in matches.matching_posts:
+        matching_author = matches.matching_authors.get(matching_post.author_id)
+        if matching_author:
+            recipient_ids.append(matching_author.id)
+    counterparts = matches.counterpart_posts
+
+    # Уже отправленные уведомления (повторная рассылка) не ставим в очередь
+    unsent = set(notify_ledger.filter_unsent(
+        [(post.id, recipient_id) for recipient_id in recipient_ids]
+        + [(matching_post.id, author.id) for matching_post in counterparts]
+    ))
+    recipient_ids = [recipient_id for recipient_id in recipient_ids if (post.id, recipient_id) in unsent]
+    scheduled = 0
+
+    for matching_post in counterparts:
+        if (matching_post.id, author.id) not in unsent:
+            continue
+
+        # Автору текущего объявления - о совпадающем (у каждого своё объявление)
+        logger.info(f"Отправляю уведомление автору текущего объявления о совпадающем {matching_post.id}")
+        send_match_notification.delay(
+            recipient_telegram_id=author.telegram_id,
+            post_id=matching_post.id,
+            recipient_db_id=author.id,
+            **digest_kwargs(author)
+        )
+        scheduled += 1
+
+    batches = schedule_post_notifications(post.id, recipient_ids)
+    scheduled += len(set(recipient_ids))
+
+    logger.info(f"✅ Запланировано {scheduled} уведомлений о совпадениях для поста {post.id} ({batches} пакетов)")
+    return scheduled
@@ -0,0 +1,95 @@
+# services/match_batcher.py - Микро-пакетный матчинг объявлений
+# Собирает объявления, опубликованные в течение короткого окна, и матчит их вместе
+
+import asyncio
+import logging
+import time
+from typing import List, Optional, Tuple
+
+from database.db import get_session
+from database.models import Post
+from services.matching import match_posts_batch, PostMatches
+from config import MATCH_BATCH_WINDOW_MS, MATCH_BATCH_MAX_SIZE
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MatchBatcher:
+    """
+    Пакетирует матчинг объявлений в часы пик.
+
+    Объявление, переданное в submit(), ждёт не дольше window_ms: за это время
+    к нему присоединяются другие опубликованные объявления (но не больше
+    max_size), после чего вся пачка матчится одним вызовом match_posts_batch.
+    Каждый вызывающий получает свой PostMatches.
+
+    Метрики:
+    - match_batch.size - размер пачки
+    - match_batch.wait_ms - задержка, добавленная ожиданием пачки (на объявление)
+    - match_batch.duration_ms - время матчинга пачки
+    """
+
+    def __init__(self, window_ms: int, max_size: int):
+        self.window = window_ms / 1000
+        self.max_size = max(1, max_size)
+        self._batch: List[Tuple[Post, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, post: Post) -> PostMatches:
+        """
+        Ставит объявление в текущую пачку и ждёт результата её матчинга.
+
+        Args:
+            post: Сохранённое объявление
+
+        Returns:
+            Результат матчинга объявления
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._batch.append((post, future, time.monotonic()))
+
+        if len(self._batch) >= self.max_size or self.window <= 0:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush_now)
+
+        return await future
+
+    def _flush_now(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._batch = self._batch, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._process(batch))
+
+    async def _process(self, batch: List[Tuple[Post, asyncio.Future, float]]) -> None:
+        started = time.monotonic()
+        metrics.observe("match_batch.size", len(batch))
+        for _, _, enqueued_at in batch:
+            metrics.observe("match_batch.wait_ms", (started - enqueued_at) * 1000)
+
+        try:
+            async with get_session() as session:
+                results = await match_posts_batch(session, [post for post, _, _ in batch])
+        except Exception as e:
+            logger.error(f"Ошибка пакетного матчинга ({len(batch)} объявлений): {e}", exc_info=True)
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        duration_ms = (time.monotonic() - started) * 1000
+        metrics.observe("match_batch.duration_ms", duration_ms)
+        logger.info(f"Пачка из {len(batch)} объявлений сматчена за {duration_ms:.1f} мс")
+
+        for post, future, _ in batch:
+            if not future.done():
+                future.set_result(results[post.id])
+
+
+# Глобальный батчер процесса бота
+match_batcher = MatchBatcher(MATCH_BATCH_WINDOW_MS, MATCH_BATCH_MAX_SIZE)
@@ -0,0 +1,558 @@
+# services/match_index.py - In-memory индексы для матчинга маршрутов
+# Инвертированные индексы подписок и активных объявлений: ключ → записи,
+# без полного сканирования таблиц
+
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Subscription, Post
+from utils import match_trace
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionIndex:
+    """
+    Инвертированный индекс подписок внутри процесса.
+
+    Для каждого ключа "откуда" хранит множество ID подписок, в которых он
+    встречается, а для каждой подписки - её ключи (и тем самым их количество).
+    Поиск совпадений для объявления перебирает только ключи объявления,
+    поэтому его стоимость не зависит от общего числа подписок.
+
+    Индекс загружается из БД при первом обращении и далее обновляется
+    инкрементально через add() / remove().
+    """
+
+    def __init__(self):
+        self._from_postings: Dict[str, Set[int]] = defaultdict(set)
+        # sub_id -> (user_id, keys_from, keys_to)
+        self._subscriptions: Dict[int, Tuple[int, FrozenSet[str], FrozenSet[str]]] = {}
+        # Подписки без ключей "откуда" (совпадают с любым keys_from)
+        self._unkeyed_from: Set[int] = set()
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        # Операции, пришедшие во время загрузки (применяются после неё)
+        self._pending: Optional[List[Tuple[str, tuple]]] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    async def ensure_loaded(self, session: AsyncSession) -> None:
+        """Загружает все подписки из БД, если индекс ещё не построен"""
+        if self._loaded:
+            return
+
+        async with self._lock:
+            if self._loaded:
+                return
+
+            self._pending = []
+            try:
+                query = select(
+                    Subscription.id,
+                    Subscription.user_id,
+                    Subscription.keys_from,
+                    Subscription.keys_to
+                )
+                result = await session.execute(query)
+                rows = result.all()
+
+                self.load_rows(rows)
+
+                for op, args in self._pending:
+                    getattr(self, op)(*args)
+            finally:
+                self._pending = None
+
+            logger.info(f"Индекс подписок построен: {len(self._subscriptions)} подписок")
+
+    def load_rows(self, rows: Iterable[Tuple[int, int, List[str], List[str]]]) -> None:
+        """
+        Полностью перестраивает индекс из строк (sub_id, user_id, keys_from, keys_to).
+
+        Args:
+            rows: Строки подписок
+        """
+        self._reset()
+        for sub_id, user_id, keys_from, keys_to in rows:
+            self._add(sub_id, user_id, keys_from, keys_to)
+        self._loaded = True
+
+    def add(self, sub_id: int, user_id: int, keys_from: List[str], keys_to: List[str]) -> None:
+        """Добавляет (или обновляет) подписку в индексе"""
+        if self._pending is not None:
+            self._pending.append(("_add", (sub_id, user_id, keys_from, keys_to)))
+        elif self._loaded:
+            self._add(sub_id, user_id, keys_from, keys_to)
+
+    def remove(self, sub_id: int) -> None:
+        """Удаляет подписку из индекса"""
+        if self._pending is not None:
+            self._pending.append(("_remove", (sub_id,)))
+        elif self._loaded:
+            self._remove(sub_id)
+
+    def match(
+        self,
+        keys_from: Iterable[str],
+        keys_to: Iterable[str],
+        exclude_user_id: Optional[int] = None
+    ) -> List[Tuple[int, int]]:
+        """
+        Находит подписки, ВСЕ ключи которых присутствуют в ключах объявления.
+
+        Сначала по постинг-листам keys_from считается, сколько ключей "откуда"
+        каждой подписки встречается в объявлении; кандидаты с полным совпадением
+        затем проверяются по keys_to.
+
+        Args:
+            keys_from: Ключи "откуда" объявления
+            keys_to: Ключи "куда" объявления
+            exclude_user_id: ID пользователя, чьи подписки не учитываются (автор)
+
+        Returns:
+            Список пар (sub_id, user_id), отсортированный по sub_id
+        """
+        post_keys_from = set(keys_from)
+        post_keys_to = set(keys_to)
+
+        from_hits: Dict[int, int] = defaultdict(int)
+        for key in post_keys_from:
+            postings = self._from_postings.get(key)
+            if postings:
+                for sub_id in postings:
+                    from_hits[sub_id] += 1
+
+        candidates = [
+            sub_id for sub_id, hits in from_hits.items()
+            if hits == len(self._subscriptions[sub_id][1])
+        ]
+        candidates.extend(self._unkeyed_from)
+
+        matches = []
+        for sub_id in candidates:
+            user_id, _, sub_keys_to = self._subscriptions[sub_id]
+            if user_id == exclude_user_id:
+                continue
+            if sub_keys_to.issubset(post_keys_to):
+                matches.append((sub_id, user_id))
+
+        matches.sort()
+        return matches
+
+    def explain(
+        self,
+        keys_from: Iterable[str],
+        keys_to: Iterable[str],
+        exclude_user_id: Optional[int] = None
+    ) -> List[match_trace.TraceEntry]:
+        """
+        Причины совпадения/несовпадения для каждой подписки-кандидата
+        (подписки хотя бы с одним общим ключом "откуда" и без ключей "откуда").
+        Медленный путь - только для трассируемых объявлений.
+
+        Returns:
+            Записи трассы, отсортированные по sub_id
+        """
+        post_keys_from = set(keys_from)
+        post_keys_to = set(keys_to)
+
+        candidates = set(self._unkeyed_from)
+        for key in post_keys_from:
+            candidates |= self._from_postings.get(key, set())
+
+        entries = []
+        for sub_id in sorted(candidates):
+            user_id, sub_keys_from, sub_keys_to = self._subscriptions[sub_id]
+            entries.append(match_trace.explain(
+                "sub", sub_id, user_id, exclude_user_id,
+                sub_keys_from, sub_keys_to, post_keys_from, post_keys_to
+            ))
+        return entries
+
+    def _reset(self) -> None:
+        self._from_postings = defaultdict(set)
+        self._subscriptions = {}
+        self._unkeyed_from = set()
+
+    def _add(self, sub_id: int, user_id: int, keys_from: List[str], keys_to: List[str]) -> None:
+        if sub_id in self._subscriptions:
+            self._remove(sub_id)
+
+        sub_keys_from = frozenset(keys_from or ())
+        sub_keys_to = frozenset(keys_to or ())
+        self._subscriptions[sub_id] = (user_id, sub_keys_from, sub_keys_to)
+
+        for key in sub_keys_from:
+            self._from_postings[key].add(sub_id)
+        if not sub_keys_from:
+            self._unkeyed_from.add(sub_id)
+
+    def _remove(self, sub_id: int) -> None:
+        entry = self._subscriptions.pop(sub_id, None)
+        if entry is None:
+            return
+
+        _, sub_keys_from, _ = entry
+        for key in sub_keys_from:
+            postings = self._from_postings.get(key)
+            if postings is not None:
+                postings.discard(sub_id)
+                if not postings:
+                    del self._from_postings[key]
+        self._unkeyed_from.discard(sub_id)
+
+
+class IndexedPost(NamedTuple):
+    """Снимок активного объявления в индексе (поля, нужные для уведомлений)"""
+    id: int
+    author_id: int
+    role: str
+    from_place: str
+    to_place: str
+    departure_time: Optional[str]
+    seats: Optional[int]
+    price: int
+    keys_from: FrozenSet[str]
+    keys_to: FrozenSet[str]
+    expires_at: Optional[datetime]
+
+
+# Колонки Post, из которых строится IndexedPost (в том же порядке)
+_INDEXED_POST_COLUMNS = (
+    Post.id,
+    Post.author_id,
+    Post.role,
+    Post.from_place,
+    Post.to_place,
+    Post.departure_time,
+    Post.seats,
+    Post.price,
+    Post.keys_from,
+    Post.keys_to,
+    Post.expires_at,
+)
+
+
+class ActivePostIndex:
+    """
+    Индекс активных объявлений внутри процесса, по ролям и ключам.
+
+    Для каждой роли хранит постинг-листы ключей keys_from и keys_to.
+    Поиск встречных объявлений не обращается к БД:
+    - "кандидат более общий" (ключи кандидата ⊆ ключей поста) - подсчёт
+      попаданий по постинг-листам ключей поста;
+    - "пост более общий" (ключи поста ⊆ ключей кандидата) - пересечение
+      постинг-листов ключей поста.
+
+    Объявление попадает в индекс при публикации/возобновлении/продлении и
+    покидает его при приостановке, удалении и истечении.
+    """
+
+    def __init__(self):
+        # role -> key -> {post_id}
+        self._from_postings: Dict[str, Dict[str, Set[int]]] = defaultdict(lambda: defaultdict(set))
+        self._to_postings: Dict[str, Dict[str, Set[int]]] = defaultdict(lambda: defaultdict(set))
+        # role -> {post_id} без ключей "откуда"
+        self._unkeyed_from: Dict[str, Set[int]] = defaultdict(set)
+        self._posts: Dict[int, IndexedPost] = {}
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self._pending: Optional[List[Tuple[str, tuple]]] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def __len__(self) -> int:
+        return len(self._posts)
+
+    def get(self, post_id: int) -> Optional[IndexedPost]:
+        return self._posts.get(post_id)
+
+    async def ensure_loaded(self, session: AsyncSession) -> None:
+        """Загружает активные объявления из БД, если индекс ещё не построен"""
+        if self._loaded:
+            return
+
+        async with self._lock:
+            if self._loaded:
+                return
+
+            self._pending = []
+            try:
+                query = select(*_INDEXED_POST_COLUMNS).where(Post.status == "active")
+                result = await session.execute(query)
+                rows = result.all()
+
+                self.load_rows(tuple(row) for row in rows)
+
+                for op, args in self._pending:
+                    getattr(self, op)(*args)
+            finally:
+                self._pending = None
+
+            logger.info(f"Индекс активных объявлений построен: {len(self._posts)} объявлений")
+
+    def load_rows(self, rows: Iterable[tuple]) -> None:
+        """
+        Полностью перестраивает индекс из строк в порядке _INDEXED_POST_COLUMNS.
+
+        Args:
+            rows: Строки активных объявлений
+        """
+        self._reset()
+        for row in rows:
+            self._add(_make_indexed_post(*row))
+        self._loaded = True
+
+    def add(self, post: Post) -> None:
+        """Добавляет (или обновляет) активное объявление в индексе"""
+        entry = _make_indexed_post(*(getattr(post, column.key) for column in _INDEXED_POST_COLUMNS))
+        if self._pending is not None:
+            self._pending.append(("_add", (entry,)))
+        elif self._loaded:
+            self._add(entry)
+
+    def remove(self, post_id: int) -> None:
+        """Удаляет объявление из индекса"""
+        if self._pending is not None:
+            self._pending.append(("_remove", (post_id,)))
+        elif self._loaded:
+            self._remove(post_id)
+
+    def match(
+        self,
+        role: str,
+        keys_from: Iterable[str],
+        keys_to: Iterable[str],
+        exclude_author_id: Optional[int] = None
+    ) -> List[IndexedPost]:
+        """
+        Находит активные объявления роли role, совпадающие с маршрутом
+        в том же направлении (в любую сторону вложенности ключей).
+
+        Args:
+            role: Роль искомых объявлений
+            keys_from: Ключи "откуда" текущего поста
+            keys_to: Ключи "куда" текущего поста
+            exclude_author_id: ID автора, чьи объявления не учитываются
+
+        Returns:
+            Список объявлений, отсортированный по ID
+        """
+        post_keys_from = set(keys_from)
+        post_keys_to = set(keys_to)
+        from_postings = self._from_postings.get(role, {})
+        to_postings = self._to_postings.get(role, {})
+
+        matched_ids: Set[int] = set()
+
+        # Кандидат более общий: все его ключи есть в текущем посте
+        from_hits: Dict[int, int] = defaultdict(int)
+        for key in post_keys_from:
+            postings = from_postings.get(key)
+            if postings:
+                for post_id in postings:
+                    from_hits[post_id] += 1
+        candidates = [
+            post_id for post_id, hits in from_hits.items()
+            if hits == len(self._posts[post_id].keys_from)
+        ]
+        candidates.extend(self._unkeyed_from.get(role, ()))
+        for post_id in candidates:
+            if self._posts[post_id].keys_to.issubset(post_keys_to):
+                matched_ids.add(post_id)
+
+        # Текущий пост более общий: все его ключи есть в кандидате
+        # (пустой набор ключей содержится в любом, как ARRAY[] <@ в PostgreSQL)
+        postings_lists = (
+            [from_postings.get(key, set()) for key in post_keys_from] +
+            [to_postings.get(key, set()) for key in post_keys_to]
+        )
+        if not postings_lists:
+            matched_ids.update(
+                post_id for post_id, entry in self._posts.items() if entry.role == role
+            )
+        else:
+            postings_lists.sort(key=len)
+            common = set(postings_lists[0])
+            for postings in postings_lists[1:]:
+                if not common:
+                    break
+                common &= postings
+            matched_ids |= common
+
+        return sorted(
+            (self._posts[post_id] for post_id in matched_ids
+             if self._posts[post_id].author_id != exclude_author_id),
+            key=lambda p: p.id
+        )
+
+    def explain(
+        self,
+        role: str,
+        keys_from: Iterable[str],
+        keys_to: Iterable[str],
+        exclude_author_id: Optional[int] = None
+    ) -> List[match_trace.TraceEntry]:
+        """
+        Причины совпадения/несовпадения для каждого объявления роли role,
+        имеющего хотя бы один общий ключ с текущим постом.
+        Медленный путь - только для трассируемых объявлений.
+
+        Returns:
+            Записи трассы, отсортированные по ID объявления
+        """
+        post_keys_from = set(keys_from)
+        post_keys_to = set(keys_to)
+        from_postings = self._from_postings.get(role, {})
+        to_postings = self._to_postings.get(role, {})
+
+        candidates = set(self._unkeyed_from.get(role, ()))
+        for key in post_keys_from:
+            candidates |= from_postings.get(key, set())
+        for key in post_keys_to:
+            candidates |= to_postings.get(key, set())
+        if not post_keys_from and not post_keys_to:
+            # Пост без ключей содержится в любом объявлении роли
+            candidates = {post_id for post_id, entry in self._posts.items() if entry.role == role}
+
+        entries = []
+        for post_id in sorted(candidates):
+            entry = self._posts[post_id]
+            # Кандидат более общий
+            forward = match_trace.explain(
+                "post", post_id, entry.author_id, exclude_author_id,
+                entry.keys_from, entry.keys_to, post_keys_from, post_keys_to
+            )
+            if forward[2] in (match_trace.MATCHED, match_trace.OWN):
+                entries.append(forward)
+                continue
+            # Текущий пост более общий
+            backward = match_trace.explain(
+                "post", post_id, entry.author_id, exclude_author_id,
+                post_keys_from, post_keys_to, entry.keys_from, entry.keys_to
+            )
+            entries.append(backward if backward[2] == match_trace.MATCHED else forward)
+        return entries
+
+    def match_subscription(
+        self,
+        keys_from: Iterable[str],
+        keys_to: Iterable[str],
+        exclude_author_id: Optional[int] = None
+    ) -> List[IndexedPost]:
+        """
+        Обратный поиск: активные объявления (любой роли), которым
+        удовлетворяет подписка - все её ключи есть в ключах объявления.
+
+        Args:
+            keys_from: Ключи "откуда" подписки
+            keys_to: Ключи "куда" подписки
+            exclude_author_id: ID автора, чьи объявления не учитываются
+
+        Returns:
+            Список объявлений, отсортированный по ID
+        """
+        sub_keys_from = set(keys_from)
+        sub_keys_to = set(keys_to)
+
+        matched_ids: Set[int] = set()
+        for role in set(self._from_postings) | set(self._to_postings):
+            from_postings = self._from_postings[role]
+            to_postings = self._to_postings[role]
+            postings_lists = (
+                [from_postings.get(key, set()) for key in sub_keys_from] +
+                [to_postings.get(key, set()) for key in sub_keys_to]
+            )
+            if not postings_lists:
+                # Подписка без ключей совпадает с любым объявлением
+                matched_ids.update(
+                    post_id for post_id, entry in self._posts.items() if entry.role == role
+                )
+                continue
+
+            postings_lists.sort(key=len)
+            common = set(postings_lists[0])
+            for postings in postings_lists[1:]:
+                if not common:
+                    break
+                common &= postings
+            matched_ids |= common
+
+        return sorted(
+            (self._posts[post_id] for post_id in matched_ids
+             if self._posts[post_id].author_id != exclude_author_id),
+            key=lambda p: p.id
+        )
+
+    def _reset(self) -> None:
+        self._from_postings = defaultdict(lambda: defaultdict(set))
+        self._to_postings = defaultdict(lambda: defaultdict(set))
+        self._unkeyed_from = defaultdict(set)
+        self._posts = {}
+
+    def _add(self, entry: IndexedPost) -> None:
+        if entry.id in self._posts:
+            self._remove(entry.id)
+
+        self._posts[entry.id] = entry
+        for key in entry.keys_from:
+            self._from_postings[entry.role][key].add(entry.id)
+        for key in entry.keys_to:
+            self._to_postings[entry.role][key].add(entry.id)
+        if not entry.keys_from:
+            self._unkeyed_from[entry.role].add(entry.id)
+
+    def _remove(self, post_id: int) -> None:
+        entry = self._posts.pop(post_id, None)
+        if entry is None:
+            return
+
+        for postings_by_key, keys in (
+            (self._from_postings[entry.role], entry.keys_from),
+            (self._to_postings[entry.role], entry.keys_to),
+        ):
+            for key in keys:
+                postings = postings_by_key.get(key)
+                if postings is not None:
+                    postings.discard(post_id)
+                    if not postings:
+                        del postings_by_key[key]
+        self._unkeyed_from[entry.role].discard(post_id)
+
+
+def _make_indexed_post(
+    post_id, author_id, role, from_place, to_place,
+    departure_time, seats, price, keys_from, keys_to, expires_at
+) -> IndexedPost:
+    return IndexedPost(
+        id=post_id,
+        author_id=author_id,
+        role=role,
+        from_place=from_place,
+        to_place=to_place,
+        departure_time=departure_time,
+        seats=seats,
+        price=price,
+        keys_from=frozenset(keys_from or ()),
+        keys_to=frozenset(keys_to or ()),
+        expires_at=expires_at
+    )
+
+
+# Глобальные индексы процесса бота
+subscription_index = SubscriptionIndex()
+active_post_index = ActivePostIndex()
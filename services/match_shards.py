@@ -0,0 +1,269 @@
+# services/match_shards.py - Шардированный матчинг подписок на пуле процессов
+# Подписки разбиты по sub_id % N между процессами; объявление рассылается
+# всем шардам, результаты объединяются
+
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Connection
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Subscription
+from services.match_index import SubscriptionIndex
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк отправлять шарду за одно сообщение при загрузке
+LOAD_CHUNK_SIZE = 10000
+
+
+def _shard_main(conn: Connection) -> None:
+    """
+    Цикл процесса-шарда: держит свой SubscriptionIndex и выполняет команды.
+
+    Команды (кортежи):
+    - ("load", rows, final) - строки партиции; первая пачка сбрасывает индекс
+    - ("add", sub_id, user_id, keys_from, keys_to)
+    - ("remove", sub_id)
+    - ("match", keys_from, keys_to, exclude_user_id) - единственная команда с ответом
+    - ("stop",)
+    """
+    index = SubscriptionIndex()
+    loading: List[tuple] = []
+
+    while True:
+        try:
+            command = conn.recv()
+        except EOFError:
+            break
+
+        op = command[0]
+        if op == "match":
+            conn.send(index.match(command[1], command[2], exclude_user_id=command[3]))
+        elif op == "add":
+            index.add(*command[1:])
+        elif op == "remove":
+            index.remove(command[1])
+        elif op == "load":
+            loading.extend(command[1])
+            if command[2]:
+                index.load_rows(loading)
+                loading = []
+                conn.send(len(index))
+        elif op == "stop":
+            break
+
+    conn.close()
+
+
+class _Shard:
+    """
+    Процесс-шард и канал к нему (запросы по каналу сериализуются локом).
+    add/remove уходят через собственный поток шарда: вызывающий (event loop)
+    не ждёт лок, который держит идущий match, а порядок команд сохраняется.
+    """
+
+    def __init__(self, context, number: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_shard_main,
+            args=(child_conn,),
+            name=f"match-shard-{number}",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.lock = threading.Lock()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"match-shard-{number}-send")
+
+    def send(self, command: tuple) -> None:
+        with self.lock:
+            self.conn.send(command)
+
+    def send_nowait(self, command: tuple) -> None:
+        """Ставит команду без ответа в очередь потока шарда"""
+        self.writer.submit(self.send, command).add_done_callback(self._log_send_error)
+
+    @staticmethod
+    def _log_send_error(future) -> None:
+        error = future.exception()
+        if error is not None:
+            logger.error(f"❌ Не удалось отправить команду шарду матчинга: {error}")
+
+    def request(self, command: tuple):
+        with self.lock:
+            self.conn.send(command)
+            return self.conn.recv()
+
+
+class ShardedSubscriptionMatcher:
+    """
+    Матчинг подписок, распределённый по N процессам.
+
+    Подписка принадлежит шарду sub_id % N. Каждый шард загружает свою партицию
+    при старте и получает инкрементальные add/remove только своих подписок.
+    match() рассылает ключи объявления всем шардам параллельно и объединяет
+    отсортированные списки совпадений - результат тот же, что у одного
+    SubscriptionIndex.
+
+    Интерфейс совпадает с SubscriptionIndex (ensure_loaded, load_rows, add,
+    remove), но match() асинхронный.
+    """
+
+    def __init__(self, num_shards: int):
+        self.num_shards = max(1, num_shards)
+        self._shards: List[_Shard] = []
+        # Потоки ожидают ответы шардов, не блокируя event loop
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self._pending: Optional[List[Tuple[str, tuple]]] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def start(self) -> None:
+        """Запускает процессы-шарды (spawn - безопасно для процесса с потоками)"""
+        if self._shards:
+            return
+
+        context = multiprocessing.get_context("spawn")
+        self._shards = [_Shard(context, number) for number in range(self.num_shards)]
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.num_shards,
+            thread_name_prefix="match-shard"
+        )
+        logger.info(f"🚀 Запущено {self.num_shards} шардов матчинга подписок")
+
+    def close(self) -> None:
+        """Останавливает процессы-шарды"""
+        for shard in self._shards:
+            # Сначала доходят поставленные add/remove
+            shard.writer.shutdown(wait=True)
+            try:
+                shard.send(("stop",))
+            except (BrokenPipeError, OSError):
+                pass
+        for shard in self._shards:
+            shard.process.join(timeout=5)
+            if shard.process.is_alive():
+                shard.process.terminate()
+            shard.conn.close()
+        self._shards = []
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+        self._loaded = False
+        logger.info("Шарды матчинга подписок остановлены")
+
+    async def ensure_loaded(self, session: AsyncSession) -> None:
+        """Загружает подписки из БД и раздаёт партиции шардам (один раз)"""
+        if self._loaded:
+            return
+
+        async with self._lock:
+            if self._loaded:
+                return
+
+            self._pending = []
+            try:
+                query = select(
+                    Subscription.id,
+                    Subscription.user_id,
+                    Subscription.keys_from,
+                    Subscription.keys_to
+                )
+                result = await session.execute(query)
+                rows = [tuple(row) for row in result.all()]
+
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, self.load_rows, rows)
+
+                for op, args in self._pending:
+                    getattr(self, op)(*args)
+            finally:
+                self._pending = None
+
+            logger.info(f"Шардированный индекс подписок построен: {len(rows)} подписок")
+
+    def load_rows(self, rows: Iterable[Tuple[int, int, List[str], List[str]]]) -> None:
+        """
+        Разбивает подписки по шардам и полностью перестраивает их индексы.
+        Блокирует до подтверждения загрузки всеми шардами.
+
+        Args:
+            rows: Строки (sub_id, user_id, keys_from, keys_to)
+        """
+        self.start()
+
+        partitions: List[List[tuple]] = [[] for _ in self._shards]
+        for row in rows:
+            partitions[row[0] % self.num_shards].append(tuple(row))
+
+        for shard, partition in zip(self._shards, partitions):
+            with shard.lock:
+                # Первая пачка (возможно пустая) сбрасывает индекс шарда
+                for start in range(0, max(len(partition), 1), LOAD_CHUNK_SIZE):
+                    chunk = partition[start:start + LOAD_CHUNK_SIZE]
+                    final = start + LOAD_CHUNK_SIZE >= len(partition)
+                    shard.conn.send(("load", chunk, final))
+
+        for shard in self._shards:
+            with shard.lock:
+                shard.conn.recv()
+
+        self._loaded = True
+
+    def add(self, sub_id: int, user_id: int, keys_from: List[str], keys_to: List[str]) -> None:
+        """Отправляет подписку шарду-владельцу"""
+        if self._pending is not None:
+            self._pending.append(("_add", (sub_id, user_id, keys_from, keys_to)))
+        elif self._loaded:
+            self._add(sub_id, user_id, keys_from, keys_to)
+
+    def remove(self, sub_id: int) -> None:
+        """Удаляет подписку у шарда-владельца"""
+        if self._pending is not None:
+            self._pending.append(("_remove", (sub_id,)))
+        elif self._loaded:
+            self._remove(sub_id)
+
+    async def match(
+        self,
+        keys_from: Iterable[str],
+        keys_to: Iterable[str],
+        exclude_user_id: Optional[int] = None
+    ) -> List[Tuple[int, int]]:
+        """
+        Находит подписки, ВСЕ ключи которых присутствуют в ключах объявления
+        (см. SubscriptionIndex.match), опрашивая все шарды параллельно.
+
+        Returns:
+            Список пар (sub_id, user_id), отсортированный по sub_id
+        """
+        command = ("match", list(keys_from), list(keys_to), exclude_user_id)
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self._executor, shard.request, command)
+            for shard in self._shards
+        ))
+
+        matches = [match for shard_matches in results for match in shard_matches]
+        matches.sort()
+        return matches
+
+    def _add(self, sub_id: int, user_id: int, keys_from: List[str], keys_to: List[str]) -> None:
+        self._shards[sub_id % self.num_shards].send_nowait(
+            ("add", sub_id, user_id, list(keys_from or ()), list(keys_to or ()))
+        )
+
+    def _remove(self, sub_id: int) -> None:
+        self._shards[sub_id % self.num_shards].send_nowait(("remove", sub_id))
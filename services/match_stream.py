@@ -0,0 +1,71 @@
+# services/match_stream.py - Событие "post_published" в Redis Stream
+# Публикация объявления не ждёт матчинга: его выполняет отдельный матчер
+
+import logging
+
+from config import MATCHING_PIPELINE, MATCH_STREAM_KEY, MATCH_STREAM_MAXLEN
+from database.models import Post, User
+from services.fanout import fan_out_post_matches
+from services.match_batcher import match_batcher
+from services import render_cache
+from utils import metrics
+from utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+POST_PUBLISHED = "post_published"
+
+
+async def emit_post_published(post_id: int) -> str:
+    """
+    Добавляет событие публикации объявления в стрим матчинга.
+
+    Args:
+        post_id: ID сохранённого (закоммиченного) объявления
+
+    Returns:
+        ID записи в стриме
+    """
+    entry_id = await get_redis().xadd(
+        MATCH_STREAM_KEY,
+        {"event": POST_PUBLISHED, "post_id": str(post_id)},
+        maxlen=MATCH_STREAM_MAXLEN,
+        approximate=True
+    )
+    metrics.inc("match_stream.emitted")
+    return entry_id
+
+
+async def schedule_post_matching(post: Post, author: User) -> None:
+    """
+    Запускает матчинг только что опубликованного (возобновлённого) объявления.
+
+    MATCHING_PIPELINE="stream" - событие уходит в Redis Stream, и вызывающий
+    хендлер сразу отвечает пользователю; уведомления рассылает матчер
+    (workers/match_stream.py). Если Redis недоступен, матчинг выполняется
+    на месте, чтобы уведомления не потерялись.
+    MATCHING_PIPELINE="inline" - матчинг и рассылка выполняются здесь же.
+
+    Args:
+        post: Сохранённое объявление (после commit)
+        author: Автор объявления
+    """
+    # Уведомление о совпадении формируется один раз - задачи передают только ID объявления
+    try:
+        await render_cache.store(post, author)
+    except Exception as e:
+        # Воркер сформирует уведомление из БД при промахе
+        logger.warning(f"⚠️ Не удалось сохранить уведомление о посте {post.id} в кэш: {e}")
+
+    if MATCHING_PIPELINE == "stream":
+        try:
+            entry_id = await emit_post_published(post.id)
+            logger.info(f"📨 Объявление {post.id} отправлено в стрим матчинга ({entry_id})")
+            return
+        except Exception as e:
+            metrics.inc("match_stream.emit_failed")
+            logger.error(f"❌ Не удалось отправить объявление {post.id} в стрим, матчу на месте: {e}")
+
+    # Ищем совпадения (пачкой вместе с одновременно опубликованными объявлениями)
+    matches = await match_batcher.submit(post)
+    fan_out_post_matches(post, author, matches)
@@ -1,15 +1,23 @@
 # services/matching.py - Логика матчинга маршрутов
 # Находит совпадения между объявлениями и подписками
 
-from typing import List, Optional
-from sqlalchemy import select, and_
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple, Union
+from sqlalchemy import select, and_, or_, exists, func, bindparam, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 
 from database.models import Subscription, User, Post, NotificationLog
+from services.match_index import subscription_index, active_post_index, IndexedPost
+from services.match_shards import ShardedSubscriptionMatcher
+from config import MATCHING_BACKEND, MATCH_SHARDS
+from utils import match_trace
 
 logger = logging.getLogger(__name__)
 
+# Подписки, распределённые по процессам-шардам (MATCH_SHARDS > 0)
+subscription_shards = ShardedSubscriptionMatcher(MATCH_SHARDS) if MATCH_SHARDS > 0 else None
+
 
 async def find_matching_subscriptions(
     session: AsyncSession, 
@@ -38,51 +46,156 @@ async def find_matching_subscriptions(
     Returns:
         Список user_id пользователей с совпавшими подписками
     """
-    # Получаем все подписки
-    subscriptions_query = select(Subscription).where(
-            Subscription.user_id != post.author_id
-        )
-    result = await session.execute(subscriptions_query)
-    subscriptions = result.scalars().all()
-    
-    matching_user_ids = []
-    post_keys_from_set = set(post.keys_from)
-    post_keys_to_set = set(post.keys_to)
-    
-    for sub in subscriptions:
-        sub_keys_from = set(sub.keys_from)
-        sub_keys_to = set(sub.keys_to)
-        
-        # Подсчитываем совпадающие ключи
-        from_intersection = sub_keys_from & post_keys_from_set
-        to_intersection = sub_keys_to & post_keys_to_set
+    if MATCHING_BACKEND == "sql":
+        matches = await _find_matching_subscriptions_sql(session, post)
+    elif subscription_shards is not None:
+        # Ключи объявления рассылаются всем шардам, результаты объединяются
+        await subscription_shards.ensure_loaded(session)
         
-        # Требуем совпадение ВСЕХ ключей подписки
-        # Это предотвращает ложные совпадения из-за общих слов
-        from_match = sub_keys_from.issubset(post_keys_from_set)
-        to_match = sub_keys_to.issubset(post_keys_to_set)
-        
-        # Детальное логирование для отладки
-        logger.debug(
-            f"Проверка подписки {sub.id} (user_id={sub.user_id}):\n"
-            f"  Подписка keys_from: {list(sub_keys_from)}, keys_to: {list(sub_keys_to)}\n"
-            f"  Объявление keys_from: {list(post_keys_from_set)}, keys_to: {list(post_keys_to_set)}\n"
-            f"  Пересечение from: {list(from_intersection)} ({len(from_intersection)}), to: {list(to_intersection)} ({len(to_intersection)})\n"
-            f"  Требуется: ВСЕ ключи подписки должны быть в объявлении\n"
-            f"  Результат: from_match={from_match}, to_match={to_match}"
+        matches = await subscription_shards.match(
+            post.keys_from,
+            post.keys_to,
+            exclude_user_id=post.author_id
         )
+    else:
+        # Подписки ищутся по инвертированному индексу (без сканирования таблицы)
+        await subscription_index.ensure_loaded(session)
         
-        if from_match and to_match:
-            logger.info(f"✅ Подписка {sub.id} совпадает с постом {post.id}")
-            matching_user_ids.append(sub.user_id)
-        else:
-            logger.debug(f"❌ Подписка {sub.id} НЕ совпадает с постом {post.id}")
+        matches = subscription_index.match(
+            post.keys_from,
+            post.keys_to,
+            exclude_user_id=post.author_id
+        )
+    
+    if match_trace.ENABLED and match_trace.sampled(post.id):
+        _trace_subscriptions(post, matches)
+    
+    matching_user_ids = [user_id for _, user_id in matches]
     
     logger.info(f"Найдено {len(matching_user_ids)} совпадений для поста {post.id}")
     
     return matching_user_ids
 
 
+def _trace_subscriptions(post: Post, matches: List[tuple]) -> None:
+    """Записывает трассу матчинга подписок для объявления из выборки"""
+    if MATCHING_BACKEND != "sql" and subscription_shards is None:
+        entries = subscription_index.explain(post.keys_from, post.keys_to, exclude_user_id=post.author_id)
+    else:
+        # Подписки вне процесса (БД или шарды) - известны только совпавшие
+        entries = [("sub", sub_id, match_trace.MATCHED, ()) for sub_id, _ in matches]
+    match_trace.record(post.id, entries)
+
+
+def _keys_condition(model, post: Post, contained: bool):
+    """
+    Условие SQL-матчинга: ключи строки model содержатся в ключах post
+    (contained=True, <@) или содержат их (contained=False, @>) - одновременно
+    для "откуда" и "куда".
+    
+    Если у post заполнены ID ключей (словарь route_keys), сравниваются
+    int[] колонки key_ids_* (intarray, gin__int_ops); строки без ID ключей
+    (созданные до add_route_key_ids.py или без assign_key_ids) сравниваются
+    по TEXT[] keys_*, чтобы не выпасть из матчинга.
+    """
+    def compare(column, value):
+        return column.contained_by(value) if contained else column.contains(value)
+    
+    by_keys = and_(compare(model.keys_from, post.keys_from), compare(model.keys_to, post.keys_to))
+    if post.key_ids_from is None or post.key_ids_to is None:
+        return by_keys
+    
+    return or_(
+        and_(
+            model.key_ids_from.isnot(None),
+            model.key_ids_to.isnot(None),
+            compare(model.key_ids_from, post.key_ids_from),
+            compare(model.key_ids_to, post.key_ids_to)
+        ),
+        and_(
+            or_(model.key_ids_from.is_(None), model.key_ids_to.is_(None)),
+            by_keys
+        )
+    )
+
+
+async def _find_matching_subscriptions_sql(
+    session: AsyncSession,
+    post: Post
+) -> List[tuple]:
+    """
+    Строгий матчинг подписок на стороне PostgreSQL.
+    
+    subscription.keys_from <@ post.keys_from AND subscription.keys_to <@ post.keys_to
+    обслуживается GIN индексами (по ID ключей - idx_subscriptions_key_ids_*),
+    поэтому из БД приходят только совпавшие подписки.
+    
+    Returns:
+        Список пар (sub_id, user_id), отсортированный по sub_id
+    """
+    query = select(Subscription.id, Subscription.user_id).where(
+        Subscription.user_id != post.author_id,
+        _keys_condition(Subscription, post, contained=True)
+    ).order_by(Subscription.id)
+    
+    result = await session.execute(query)
+    return [(row.id, row.user_id) for row in result.all()]
+
+
+def index_subscription(subscription: Subscription) -> None:
+    """
+    Добавляет сохранённую подписку в индекс матчинга.
+    Вызывается после commit, когда у подписки уже есть ID.
+    
+    Args:
+        subscription: Подписка
+    """
+    matcher = subscription_shards if subscription_shards is not None else subscription_index
+    matcher.add(
+        subscription.id,
+        subscription.user_id,
+        subscription.keys_from,
+        subscription.keys_to
+    )
+
+
+def unindex_subscription(subscription_id: int) -> None:
+    """
+    Удаляет подписку из индекса матчинга.
+    
+    Args:
+        subscription_id: ID подписки
+    """
+    matcher = subscription_shards if subscription_shards is not None else subscription_index
+    matcher.remove(subscription_id)
+
+
+def index_post(post: Post) -> None:
+    """
+    Обновляет объявление в индексе активных объявлений после смены статуса:
+    активные добавляются, остальные удаляются.
+    Вызывается после commit (публикация, возобновление, продление).
+    
+    Args:
+        post: Объявление
+    """
+    if post.status == "active":
+        active_post_index.add(post)
+    else:
+        active_post_index.remove(post.id)
+
+
+def unindex_post(post_id: int) -> None:
+    """
+    Удаляет объявление из индекса активных объявлений
+    (приостановка, удаление, истечение).
+    
+    Args:
+        post_id: ID объявления
+    """
+    active_post_index.remove(post_id)
+
+
 async def check_subscription_match(
     keys_from_sub: List[str],
     keys_to_sub: List[str],
@@ -112,6 +225,50 @@ async def check_subscription_match(
     return from_match and to_match
 
 
+async def resolve_recipients(
+    session: AsyncSession,
+    pairs: Iterable[Tuple[int, int]]
+) -> Dict[int, Dict[int, User]]:
+    """
+    Отбирает получателей, которым ещё не отправлялось уведомление, одним запросом.
+    
+    Пары (post_id, user_id) передаются массивами в unnest() и соединяются
+    с users; анти-join (NOT EXISTS) по notifications_log отбрасывает уже
+    уведомлённых (обслуживается уникальным индексом uq_notification).
+    
+    Args:
+        session: Сессия БД
+        pairs: Пары (post_id, user_id) кандидатов в получатели
+        
+    Returns:
+        Словарь post_id → {user_id: User} для неуведомлённых получателей
+    """
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+        return {}
+    
+    candidates = func.unnest(
+        bindparam("post_ids", [post_id for post_id, _ in pairs], type_=ARRAY(Integer)),
+        bindparam("user_ids", [user_id for _, user_id in pairs], type_=ARRAY(Integer))
+    ).table_valued("post_id", "user_id").render_derived(name="candidates")
+    
+    query = select(candidates.c.post_id, User).join(
+        User, User.id == candidates.c.user_id
+    ).where(
+        ~exists().where(
+            NotificationLog.post_id == candidates.c.post_id,
+            NotificationLog.recipient_id == candidates.c.user_id
+        )
+    )
+    
+    result = await session.execute(query)
+    
+    recipients: Dict[int, Dict[int, User]] = {}
+    for post_id, user in result.all():
+        recipients.setdefault(post_id, {})[user.id] = user
+    return recipients
+
+
 async def get_users_to_notify(
     session: AsyncSession,
     post: Post,
@@ -129,34 +286,15 @@ async def get_users_to_notify(
     Returns:
         Список пользователей для уведомления
     """
-    if not matching_user_ids:
-        return []
-    
-    # Получаем ID тех, кому уже отправлено
-    already_notified_query = select(NotificationLog.recipient_id).where(
-        NotificationLog.post_id == post.id
-    )
-    result = await session.execute(already_notified_query)
-    already_notified = {row[0] for row in result.fetchall()}
-    
-    # Фильтруем
-    to_notify_ids = [uid for uid in matching_user_ids if uid not in already_notified]
-    
-    if not to_notify_ids:
-        return []
-    
-    # Получаем данные пользователей
-    users_query = select(User).where(User.id.in_(to_notify_ids))
-    result = await session.execute(users_query)
-    users = result.scalars().all()
-    
-    return list(users)
+    recipients = await resolve_recipients(session, ((post.id, uid) for uid in matching_user_ids))
+    users = recipients.get(post.id, {})
+    return [users[uid] for uid in dict.fromkeys(matching_user_ids) if uid in users]
 
 
 async def find_matching_posts(
     session: AsyncSession,
     post: Post
-) -> List[Post]:
+) -> List[Union[Post, IndexedPost]]:
     """
     Находит активные объявления противоположной роли с совпадающим маршрутом.
     
@@ -180,84 +318,234 @@ async def find_matching_posts(
         post: Объявление для проверки
         
     Returns:
-        Список совпадающих объявлений
+        Список совпадающих объявлений (в режиме memory - снимки IndexedPost
+        с теми же полями, что нужны для уведомлений)
     """
     # Определяем противоположную роль
     opposite_role = "passenger" if post.role == "driver" else "driver"
     
-    # Получаем все активные объявления противоположной роли
+    if MATCHING_BACKEND == "sql":
+        return await _find_matching_posts_sql(session, post, opposite_role)
+    
+    # Встречные объявления ищутся по индексу активных объявлений (без запроса к БД)
+    await active_post_index.ensure_loaded(session)
+    
+    matching_posts = active_post_index.match(
+        opposite_role,
+        post.keys_from,
+        post.keys_to,
+        exclude_author_id=post.author_id
+    )
+    
+    if match_trace.ENABLED and match_trace.sampled(post.id):
+        match_trace.record(post.id, active_post_index.explain(
+            opposite_role, post.keys_from, post.keys_to, exclude_author_id=post.author_id
+        ))
+    
+    logger.info(f"Найдено {len(matching_posts)} совпадающих объявлений для поста {post.id} (роль: {post.role})")
+    
+    return matching_posts
+
+
+async def _find_matching_posts_sql(
+    session: AsyncSession,
+    post: Post,
+    opposite_role: str
+) -> List[Post]:
+    """
+    Двусторонний матчинг объявлений на стороне PostgreSQL.
+    
+    Кандидат совпадает, если его ключи содержат ключи поста (@>)
+    или содержатся в них (<@) - одновременно для keys_from и keys_to.
+    Условия обслуживаются GIN индексами (по ID ключей - idx_posts_key_ids_*).
+    """
     query = select(Post).where(
-        and_(
-            Post.role == opposite_role,
-            Post.status == "active",
-            Post.author_id != post.author_id  # Исключаем автора
+        Post.role == opposite_role,
+        Post.status == "active",
+        Post.author_id != post.author_id,
+        or_(
+            _keys_condition(Post, post, contained=False),
+            _keys_condition(Post, post, contained=True)
         )
-    )
+    ).order_by(Post.id)
     
     result = await session.execute(query)
-    all_posts = result.scalars().all()
-    
-    # Проверяем совпадение маршрутов строго (с учетом направления)
-    matching_posts = []
-    post_keys_from_set = set(post.keys_from)
-    post_keys_to_set = set(post.keys_to)
+    matching_posts = list(result.scalars().all())
     
-    for candidate_post in all_posts:
-        candidate_keys_from_set = set(candidate_post.keys_from)
-        candidate_keys_to_set = set(candidate_post.keys_to)
-        
-        # Проверяем: ВСЕ ключи должны совпадать В ТОМ ЖЕ НАПРАВЛЕНИИ
-        # Вариант 1: все ключи текущего поста в кандидате (текущий более общий)
-        match_1 = (post_keys_from_set.issubset(candidate_keys_from_set) and 
-                  post_keys_to_set.issubset(candidate_keys_to_set))
-        
-        # Вариант 2: все ключи кандидата в текущем посте (кандидат более общий)
-        match_2 = (candidate_keys_from_set.issubset(post_keys_from_set) and 
-                  candidate_keys_to_set.issubset(post_keys_to_set))
-        
-        # Совпадение только если выполняется хотя бы один вариант
-        if match_1 or match_2:
-            matching_posts.append(candidate_post)
-            logger.debug(
-                f"✅ Пост {candidate_post.id} совпадает с постом {post.id}:\n"
-                f"  Пост {post.id}: {list(post_keys_from_set)} → {list(post_keys_to_set)}\n"
-                f"  Пост {candidate_post.id}: {list(candidate_keys_from_set)} → {list(candidate_keys_to_set)}"
-            )
-        else:
-            logger.debug(
-                f"❌ Пост {candidate_post.id} НЕ совпадает с постом {post.id}:\n"
-                f"  Пост {post.id}: {list(post_keys_from_set)} → {list(post_keys_to_set)}\n"
-                f"  Пост {candidate_post.id}: {list(candidate_keys_from_set)} → {list(candidate_keys_to_set)}"
-            )
+    if match_trace.ENABLED and match_trace.sampled(post.id):
+        # В режиме sql известны только совпавшие кандидаты
+        match_trace.record(post.id, [
+            ("post", candidate.id, match_trace.MATCHED, ()) for candidate in matching_posts
+        ])
     
     logger.info(f"Найдено {len(matching_posts)} совпадающих объявлений для поста {post.id} (роль: {post.role})")
     
     return matching_posts
 
 
-async def log_notification(
+async def find_posts_for_subscription(
     session: AsyncSession,
-    post_id: int,
-    recipient_id: int,
-    notification_message_id: int = None,
-    recipient_telegram_id: int = None
-) -> None:
+    subscription: Subscription
+) -> List[Union[Post, IndexedPost]]:
     """
-    Записывает в лог отправленное уведомление.
-    
+    Обратный матчинг: активные объявления, которым удовлетворяет подписка.
+
+    Правило то же, что в find_matching_subscriptions: ВСЕ ключи подписки
+    должны присутствовать в объявлении (keys_from и keys_to).
+    Собственные объявления подписчика не учитываются.
+
     Args:
         session: Сессия БД
-        post_id: ID объявления
-        recipient_id: ID получателя (в БД)
-        notification_message_id: ID сообщения уведомления в Telegram
-        recipient_telegram_id: Telegram ID получателя
+        subscription: Сохранённая подписка
+
+    Returns:
+        Список совпадающих объявлений, отсортированный по ID
     """
-    log_entry = NotificationLog(
-        post_id=post_id,
-        recipient_id=recipient_id,
-        notification_message_id=notification_message_id,
-        recipient_telegram_id=recipient_telegram_id
+    if MATCHING_BACKEND == "sql":
+        query = select(Post).where(
+            Post.status == "active",
+            Post.author_id != subscription.user_id,
+            _keys_condition(Post, subscription, contained=False)
+        ).order_by(Post.id)
+
+        result = await session.execute(query)
+        matching_posts = list(result.scalars().all())
+    else:
+        # Объявления ищутся по индексу активных объявлений (без сканирования таблицы)
+        await active_post_index.ensure_loaded(session)
+
+        matching_posts = active_post_index.match_subscription(
+            subscription.keys_from,
+            subscription.keys_to,
+            exclude_author_id=subscription.user_id
+        )
+
+    logger.info(f"Найдено {len(matching_posts)} активных объявлений для подписки {subscription.id}")
+
+    return matching_posts
+
+
+class SubscriptionMatches(NamedTuple):
+    """Результат обратного матчинга новой подписки"""
+    matching_posts: List[Union[Post, IndexedPost]]  # Объявления, о которых подписчик ещё не уведомлён
+    authors: Dict[int, User]  # Авторы объявлений по ID
+
+
+async def match_subscription(
+    session: AsyncSession,
+    subscription: Subscription
+) -> SubscriptionMatches:
+    """
+    Находит уже активные объявления для новой подписки и отбрасывает те,
+    о которых подписчику уже отправлялось уведомление.
+
+    Args:
+        session: Сессия БД
+        subscription: Сохранённая подписка
+
+    Returns:
+        SubscriptionMatches
+    """
+    matching_posts = await find_posts_for_subscription(session, subscription)
+    if not matching_posts:
+        return SubscriptionMatches(matching_posts=[], authors={})
+
+    notified_query = select(NotificationLog.post_id).where(
+        NotificationLog.recipient_id == subscription.user_id,
+        NotificationLog.post_id.in_([p.id for p in matching_posts])
+    )
+    notified_result = await session.execute(notified_query)
+    already_notified = {row[0] for row in notified_result.fetchall()}
+
+    matching_posts = [p for p in matching_posts if p.id not in already_notified]
+    if not matching_posts:
+        return SubscriptionMatches(matching_posts=[], authors={})
+
+    authors_query = select(User).where(User.id.in_({p.author_id for p in matching_posts}))
+    authors_result = await session.execute(authors_query)
+    authors = {user.id: user for user in authors_result.scalars().all()}
+
+    return SubscriptionMatches(
+        matching_posts=[p for p in matching_posts if p.author_id in authors],
+        authors=authors
     )
-    session.add(log_entry)
-    await session.commit()
 
+
+class PostMatches(NamedTuple):
+    """Результат матчинга одного объявления"""
+    users_to_notify: List[User]  # Подписчики, которым ещё не отправлялось уведомление
+    matching_posts: List[Union[Post, IndexedPost]]  # Встречные объявления, авторы которых ещё не уведомлены
+    matching_authors: Dict[int, User]  # Авторы встречных объявлений по ID
+    counterpart_posts: List[Union[Post, IndexedPost]]  # Встречные объявления, о которых уведомить автора
+
+
+async def match_posts_batch(
+    session: AsyncSession,
+    posts: List[Post]
+) -> Dict[int, PostMatches]:
+    """
+    Матчит пачку объявлений против подписок и встречных объявлений.
+    
+    Проверки "уже уведомлён" и загрузка пользователей выполняются одним
+    запросом на всю пачку (resolve_recipients), а не отдельными запросами
+    на каждое объявление и каждого автора встречного объявления.
+    
+    Пары (объявление, получатель) не повторяются в пределах пачки: если два
+    встречных объявления попали в одну пачку, уведомления обоих авторов
+    планируются только для первого из них.
+    
+    Args:
+        session: Сессия БД
+        posts: Объявления пачки
+        
+    Returns:
+        Словарь post_id → PostMatches
+    """
+    if not posts:
+        return {}
+    
+    subscriber_ids: Dict[int, List[int]] = {}
+    counterparts: Dict[int, List[Union[Post, IndexedPost]]] = {}
+    for post in posts:
+        subscriber_ids[post.id] = await find_matching_subscriptions(session, post)
+        counterparts[post.id] = await find_matching_posts(session, post)
+        if match_trace.ENABLED:
+            # Трасса содержит оба прохода - принудительная выборка снимается после второго
+            match_trace.finish(post.id)
+    
+    # Итоговые получатели всей пачки (с данными пользователей) - одним запросом
+    recipients = await resolve_recipients(session, [
+        (post.id, user_id)
+        for post in posts
+        for user_id in (
+            subscriber_ids[post.id] +
+            [p.author_id for p in counterparts[post.id]]
+        )
+    ])
+    
+    results = {}
+    # Пары (объявление, получатель), уже запланированные предыдущими объявлениями пачки
+    planned: Set[Tuple[int, int]] = set()
+    for post in posts:
+        users = recipients.get(post.id, {})
+        # Встречные объявления, чьи авторы уже получили уведомление о посте, пропускаются
+        counterparts_to_notify = [p for p in counterparts[post.id] if p.author_id in users]
+        users_to_notify = [
+            users[uid] for uid in dict.fromkeys(subscriber_ids[post.id])
+            if uid in users and (post.id, uid) not in planned
+        ]
+        matching_posts = [p for p in counterparts_to_notify if (post.id, p.author_id) not in planned]
+        counterpart_posts = [p for p in counterparts_to_notify if (p.id, post.author_id) not in planned]
+        
+        planned.update((post.id, user.id) for user in users_to_notify)
+        planned.update((post.id, p.author_id) for p in matching_posts)
+        planned.update((p.id, post.author_id) for p in counterpart_posts)
+        
+        results[post.id] = PostMatches(
+            users_to_notify=users_to_notify,
+            matching_posts=matching_posts,
+            matching_authors={p.author_id: users[p.author_id] for p in matching_posts},
+            counterpart_posts=counterpart_posts
+        )
+    
+    return results
@@ -0,0 +1,146 @@
+# services/notification_log.py - Отложенная запись лога уведомлений
+# Строки notifications_log копятся в памяти и пишутся одним INSERT пачками
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from config import NOTIFICATION_LOG_FLUSH_ROWS, NOTIFICATION_LOG_FLUSH_MS
+from database.db import async_session_maker
+from database.models import NotificationLog
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк держать в памяти, пока БД недоступна (дальше - отбрасываем)
+MAX_PENDING_ROWS = 50000
+
+
+class NotificationLogBuffer:
+    """
+    Буфер записи в notifications_log (write-behind).
+    Сбрасывается каждые NOTIFICATION_LOG_FLUSH_ROWS строк или
+    NOTIFICATION_LOG_FLUSH_MS миллисекунд и при close().
+    Повторные строки (post_id, recipient_id) отбрасывает ON CONFLICT DO NOTHING.
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker,
+        max_rows: int = NOTIFICATION_LOG_FLUSH_ROWS,
+        flush_interval_ms: int = NOTIFICATION_LOG_FLUSH_MS
+    ):
+        self.session_maker = session_maker
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval_ms / 1000
+        self._rows: List[Dict[str, Any]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._closing = False
+
+    def add(
+        self,
+        post_id: int,
+        recipient_id: int,
+        notification_message_id: int = None,
+        recipient_telegram_id: int = None
+    ) -> None:
+        """
+        Добавляет запись об отправленном уведомлении (вызывается внутри event loop).
+
+        Args:
+            post_id: ID объявления
+            recipient_id: ID получателя (в БД)
+            notification_message_id: ID сообщения уведомления в Telegram
+            recipient_telegram_id: Telegram ID получателя
+        """
+        self._rows.append({
+            "post_id": post_id,
+            "recipient_id": recipient_id,
+            "notification_message_id": notification_message_id,
+            "recipient_telegram_id": recipient_telegram_id
+        })
+        self._ensure_flusher()
+        if len(self._rows) >= self.max_rows:
+            self._wakeup.set()
+
+    def _ensure_flusher(self) -> None:
+        """Запускает фоновый сброс в текущем event loop при первой записи"""
+        if self._flusher is None or self._flusher.done():
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._flusher = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Записывает накопленные строки одним INSERT ... ON CONFLICT DO NOTHING.
+
+        Returns:
+            Количество записанных (отправленных в БД) строк
+        """
+        if not self._rows:
+            return 0
+
+        async with self._flush_lock:
+            rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            try:
+                async with self.session_maker() as session:
+                    await session.execute(
+                        insert(NotificationLog)
+                        .values(rows)
+                        .on_conflict_do_nothing(constraint="uq_notification")
+                    )
+                    await session.commit()
+            except asyncio.CancelledError:
+                self._rows = rows + self._rows
+                raise
+            except Exception as e:
+                metrics.inc("notification_log.flush_failed")
+                # Возвращаем строки в буфер - попробуем при следующем сбросе
+                self._rows = rows + self._rows
+                if len(self._rows) > MAX_PENDING_ROWS:
+                    dropped = len(self._rows) - MAX_PENDING_ROWS
+                    self._rows = self._rows[dropped:]
+                    logger.error(f"❌ Буфер notifications_log переполнен, отброшено {dropped} записей")
+                logger.error(f"❌ Не удалось записать {len(rows)} уведомлений в notifications_log: {e}")
+                return 0
+
+        metrics.inc("notification_log.flushes")
+        metrics.observe("notification_log.flush_rows", len(rows))
+        logger.debug(f"Записано {len(rows)} уведомлений в notifications_log")
+        return len(rows)
+
+    async def close(self) -> None:
+        """Останавливает фоновый сброс и записывает остаток"""
+        if self._flusher is not None:
+            # Даём текущему сбросу завершиться, а не прерываем его посередине
+            self._closing = True
+            self._wakeup.set()
+            await self._flusher
+            self._flusher = None
+            self._closing = False
+
+        if self._rows:
+            if self._flush_lock is None:
+                self._flush_lock = asyncio.Lock()
+            written = await self.flush()
+            logger.info(f"Буфер notifications_log сброшен при остановке ({written} записей)")
+
+
+# Буфер процесса бота (в Celery воркерах - свой, см. tasks/runtime.py)
+notification_log_buffer = NotificationLogBuffer(async_session_maker)
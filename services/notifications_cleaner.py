@@ -1,138 +1,214 @@
 # services/notifications_cleaner.py - Удаление уведомлений при удалении объявления
-# Удаляет уведомления о совпадениях у пользователей, когда объявление удаляется
+# Записи лога удаляются одним запросом в транзакции хендлера, сообщения в чатах - фоновой задачей
 
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
-from aiogram import Bot
 import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, or_, delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from config import NOTIFY_CLEANUP_BATCH, NOTIFY_STALE_MODE, NOTIFY_EAGER_DELETE_MAX_AGE
 from database.models import NotificationLog
+from services import notify_ledger
+from tasks.notifications import delete_notification_messages
+from utils.redis_client import get_redis
 
 logger = logging.getLogger(__name__)
 
+# Прогресс фоновой очистки: total / deleted / failed
+PROGRESS_KEY = "notify:cleanup:{job_id}"
+PROGRESS_TTL = 24 * 3600
 
-async def delete_notifications_for_post(
-    bot: Bot,
-    session: AsyncSession,
+# Сообщение уведомления в чате получателя: (chat_id, message_id)
+NotificationMessage = Tuple[int, int]
+
+
+class TakenNotification(NamedTuple):
+    """Удалённая запись лога уведомлений (до commit вызывающего)"""
     post_id: int
-) -> int:
+    recipient_id: int
+    message: Optional[NotificationMessage]  # None - сообщение остаётся в чате
+
+
+def _eager_cutoff() -> Optional[datetime]:
+    """
+    Политика ленивого режима: уведомления, отправленные раньше этого момента,
+    из чатов не удаляются. None - режим выключен, удаляются все.
     """
-    Удаляет все уведомления о совпадениях для указанного объявления.
-    
+    if not NOTIFY_STALE_MODE:
+        return None
+    return datetime.utcnow() - timedelta(seconds=NOTIFY_EAGER_DELETE_MAX_AGE)
+
+
+async def _take(session: AsyncSession, condition) -> List[TakenNotification]:
+    """Удаляет записи лога одним DELETE ... RETURNING и возвращает их"""
+    result = await session.execute(
+        delete(NotificationLog)
+        .where(condition)
+        .returning(
+            NotificationLog.post_id,
+            NotificationLog.recipient_id,
+            NotificationLog.recipient_telegram_id,
+            NotificationLog.notification_message_id,
+            NotificationLog.sent_at
+        )
+    )
+    cutoff = _eager_cutoff()
+    taken = []
+    for row in result.all():
+        message = None
+        # Сводки (notification_message_id=NULL) общие для нескольких объявлений - не удаляем
+        if row.recipient_telegram_id and row.notification_message_id and (
+            cutoff is None or (row.sent_at and row.sent_at >= cutoff)
+        ):
+            message = (row.recipient_telegram_id, row.notification_message_id)
+        taken.append(TakenNotification(row.post_id, row.recipient_id, message))
+    return taken
+
+
+def _count_messages(taken: List[TakenNotification]) -> int:
+    return sum(1 for notification in taken if notification.message)
+
+
+async def take_notifications_for_posts(
+    session: AsyncSession,
+    post_ids: Iterable[int],
+    keep_stale: bool = True
+) -> List[TakenNotification]:
+    """
+    Удаляет записи лога уведомлений об объявлениях (commit - на стороне вызывающего).
+    В ленивом режиме (NOTIFY_STALE_MODE) старые уведомления остаются в чатах,
+    а их записи помечаются is_stale - show_contact исправит сообщение при нажатии.
+
     Args:
-        bot: Экземпляр бота
         session: Сессия БД
-        post_id: ID объявления
-        
+        post_ids: ID объявлений
+        keep_stale: False - объявления удаляются из БД, записи не сохраняются
+
     Returns:
-        Количество удаленных уведомлений
+        Удалённые записи - передать в schedule_messages_cleanup после commit
     """
-    logger.info(f"🔍 Начинаю удаление уведомлений для поста {post_id}")
-    
-    # Получаем все уведомления для этого поста
-    query = select(NotificationLog).where(
-        NotificationLog.post_id == post_id
-    )
-    result = await session.execute(query)
-    notifications = result.scalars().all()
-    
-    logger.info(f"📋 Найдено {len(notifications)} записей в логе для поста {post_id}")
-    
-    deleted_count = 0
-    
-    for notification in notifications:
-        logger.info(f"   - Запись: msg_id={notification.notification_message_id}, tg_id={notification.recipient_telegram_id}")
-        
-        if notification.notification_message_id and notification.recipient_telegram_id:
-            try:
-                await bot.delete_message(
-                    chat_id=notification.recipient_telegram_id,
-                    message_id=notification.notification_message_id
-                )
-                deleted_count += 1
-                logger.info(
-                    f"✅ Удалено сообщение {notification.notification_message_id} "
-                    f"у пользователя {notification.recipient_telegram_id}"
-                )
-            except Exception as e:
-                # Сообщение уже удалено или недоступно
-                logger.warning(
-                    f"⚠️ Не удалось удалить сообщение {notification.notification_message_id} "
-                    f"у пользователя {notification.recipient_telegram_id}: {e}"
-                )
-        else:
-            logger.warning(f"   ⚠️ Пропуск: нет msg_id или tg_id")
-    
-    # Удаляем записи из лога (commit будет сделан вызывающим кодом)
-    if notifications:
-        for notification in notifications:
-            await session.delete(notification)
-        logger.info(f"🗑 Помечено к удалению {len(notifications)} записей из БД, удалено {deleted_count} сообщений из чатов для поста {post_id}")
-    else:
-        logger.info(f"ℹ️ Нет записей для удаления для поста {post_id}")
-    
-    return deleted_count
-
-
-async def delete_notifications_received_by_author(
-    bot: Bot,
+    post_ids = list(post_ids)
+    if not post_ids:
+        return []
+    condition = NotificationLog.post_id.in_(post_ids)
+    cutoff = _eager_cutoff()
+    if cutoff is not None and keep_stale:
+        # Только отдельные сообщения: сводка (notification_message_id=NULL) общая
+        # для нескольких объявлений, и правка затёрла бы кнопки остальных
+        stale = await session.execute(
+            update(NotificationLog)
+            .where(
+                condition,
+                NotificationLog.sent_at < cutoff,
+                NotificationLog.notification_message_id.isnot(None)
+            )
+            .values(is_stale=1)
+        )
+        logger.info(f"🗑 Помечено устаревшими {stale.rowcount} уведомлений об объявлениях {post_ids}")
+        condition = and_(
+            condition,
+            or_(NotificationLog.sent_at >= cutoff, NotificationLog.notification_message_id.is_(None))
+        )
+    taken = await _take(session, condition)
+    logger.info(f"🗑 Удалены записи лога уведомлений об объявлениях {post_ids}: сообщений к удалению {_count_messages(taken)}")
+    return taken
+
+
+async def take_notifications_received_by(
     session: AsyncSession,
-    author_id: int
-) -> int:
+    user_id: int
+) -> List[TakenNotification]:
     """
-    Удаляет все уведомления, которые получил автор объявления от других объявлений.
-    Используется когда автор удаляет/приостанавливает своё объявление.
-    
+    Удаляет записи лога уведомлений, полученных пользователем от других объявлений.
+    Используется когда автор удаляет/приостанавливает своё объявление или профиль.
+    В ленивом режиме из чатов удаляются только недавние уведомления.
+
     Args:
-        bot: Экземпляр бота
         session: Сессия БД
-        author_id: ID автора объявления
-        
+        user_id: ID пользователя в БД
+
     Returns:
-        Количество удаленных уведомлений
+        Удалённые записи - передать в schedule_messages_cleanup после commit
+    """
+    taken = await _take(session, NotificationLog.recipient_id == user_id)
+    logger.info(f"🗑 Удалены записи лога уведомлений, полученных пользователем {user_id}: сообщений к удалению {_count_messages(taken)}")
+    return taken
+
+
+async def revive_notifications(session: AsyncSession, post_id: int) -> None:
+    """
+    Снимает пометку is_stale с уведомлений о возобновлённом объявлении:
+    оставшиеся в чатах сообщения снова актуальны (commit - на стороне вызывающего).
+
+    Args:
+        session: Сессия БД
+        post_id: ID объявления
     """
-    logger.info(f"🔍 Начинаю удаление уведомлений, полученных автором {author_id}")
-    
-    # Получаем все уведомления, которые получил этот автор
-    query = select(NotificationLog).where(
-        NotificationLog.recipient_id == author_id
+    await session.execute(
+        update(NotificationLog)
+        .where(NotificationLog.post_id == post_id, NotificationLog.is_stale == 1)
+        .values(is_stale=0)
     )
-    result = await session.execute(query)
-    notifications = result.scalars().all()
-    
-    logger.info(f"📋 Найдено {len(notifications)} уведомлений, полученных автором {author_id}")
-    
-    deleted_count = 0
-    
-    for notification in notifications:
-        logger.info(f"   - Запись: msg_id={notification.notification_message_id}, tg_id={notification.recipient_telegram_id}")
-        
-        if notification.notification_message_id and notification.recipient_telegram_id:
-            try:
-                await bot.delete_message(
-                    chat_id=notification.recipient_telegram_id,
-                    message_id=notification.notification_message_id
-                )
-                deleted_count += 1
-                logger.info(
-                    f"✅ Удалено сообщение {notification.notification_message_id} "
-                    f"у пользователя {notification.recipient_telegram_id}"
-                )
-            except Exception as e:
-                logger.warning(
-                    f"⚠️ Не удалось удалить сообщение {notification.notification_message_id} "
-                    f"у пользователя {notification.recipient_telegram_id}: {e}"
-                )
-        else:
-            logger.warning(f"   ⚠️ Пропуск: нет msg_id или tg_id")
-    
-    # Удаляем записи из лога (commit будет сделан вызывающим кодом)
-    if notifications:
-        for notification in notifications:
-            await session.delete(notification)
-        logger.info(f"🗑 Помечено к удалению {len(notifications)} записей из БД, удалено {deleted_count} сообщений из чатов для автора {author_id}")
-    else:
-        logger.info(f"ℹ️ Нет уведомлений для удаления для автора {author_id}")
-    
-    return deleted_count
 
+
+async def schedule_messages_cleanup(taken: List[TakenNotification]) -> Optional[str]:
+    """
+    Завершает удаление уведомлений после commit удаления записей лога:
+    удаляет их записи журнала notify_ledger (возобновлённое объявление снова
+    уведомит получателей) и ставит удаление сообщений в фоновую очередь
+    пачками по NOTIFY_CLEANUP_BATCH.
+
+    Вызывается только после успешного commit: при откате записи лога
+    остаются, и журнал должен по-прежнему защищать от повторной отправки.
+
+    Args:
+        taken: Результат take_notifications_for_posts / take_notifications_received_by
+
+    Returns:
+        ID задачи очистки (прогресс - cleanup_progress) или None, если удалять нечего
+    """
+    await notify_ledger.forget((notification.post_id, notification.recipient_id) for notification in taken)
+
+    messages = list(dict.fromkeys(
+        (int(notification.message[0]), int(notification.message[1]))
+        for notification in taken if notification.message
+    ))
+    if not messages:
+        return None
+
+    job_id = uuid.uuid4().hex[:12]
+    try:
+        progress_key = PROGRESS_KEY.format(job_id=job_id)
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.hset(progress_key, mapping={"total": len(messages), "deleted": 0, "failed": 0})
+            pipe.expire(progress_key, PROGRESS_TTL)
+            await pipe.execute()
+    except Exception as e:
+        # Прогресс - только для наблюдения, удаление идёт и без него
+        logger.warning(f"⚠️ Не удалось записать прогресс очистки {job_id}: {e}")
+
+    for start in range(0, len(messages), NOTIFY_CLEANUP_BATCH):
+        delete_notification_messages.delay(
+            messages=[list(message) for message in messages[start:start + NOTIFY_CLEANUP_BATCH]],
+            job_id=job_id
+        )
+
+    logger.info(f"📨 Очистка {job_id}: {len(messages)} сообщений уведомлений поставлено в очередь")
+    return job_id
+
+
+async def cleanup_progress(job_id: str) -> Optional[dict]:
+    """
+    Прогресс фоновой очистки.
+
+    Args:
+        job_id: ID из schedule_messages_cleanup
+
+    Returns:
+        {"total", "deleted", "failed"} или None, если задача неизвестна
+    """
+    progress = await get_redis().hgetall(PROGRESS_KEY.format(job_id=job_id))
+    return {field: int(value) for field, value in progress.items()} or None
@@ -0,0 +1,123 @@
+# services/notify_ledger.py - Журнал отправленных уведомлений о совпадении в Redis
+# SET NX по (объявление, получатель): повторная рассылка и повтор задачи не дублируют сообщение
+
+import asyncio
+import logging
+from typing import Iterable, List, Sequence, Tuple
+
+from aiogram.exceptions import TelegramNetworkError, TelegramServerError
+
+from config import NOTIFY_LEDGER_TTL
+from utils import metrics
+from utils.redis_client import get_redis, get_sync_redis
+
+logger = logging.getLogger(__name__)
+
+LEDGER_KEY = "notify:sent:{post_id}:{recipient_id}"
+
+
+def is_ambiguous(error: BaseException) -> bool:
+    """
+    Ошибка, после которой неизвестно, дошло ли сообщение (таймаут, обрыв
+    соединения, 5xx Telegram). Запись в журнале при этом сохраняется:
+    лучше не доставить одно уведомление, чем прислать его дважды.
+    """
+    return isinstance(error, (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError))
+
+
+def filter_unsent(pairs: Sequence[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Отбрасывает уже отправленные уведомления перед постановкой в очередь.
+    Синхронный, как и .delay() (вызывается рядом с ним в fanout).
+
+    Args:
+        pairs: Пары (ID объявления, ID получателя в БД)
+
+    Returns:
+        Пары, которых нет в журнале (при недоступном Redis - все)
+    """
+    if not pairs:
+        return []
+    try:
+        pipe = get_sync_redis().pipeline(transaction=False)
+        for post_id, recipient_id in pairs:
+            pipe.exists(LEDGER_KEY.format(post_id=post_id, recipient_id=recipient_id))
+        found = pipe.execute()
+    except Exception as e:
+        logger.warning(f"⚠️ Журнал уведомлений недоступен, проверка перед отправкой пропущена: {e}")
+        return list(pairs)
+
+    unsent = [pair for pair, exists in zip(pairs, found) if not exists]
+    if len(unsent) < len(pairs):
+        metrics.inc("notify_ledger.skipped_enqueue", len(pairs) - len(unsent))
+    return unsent
+
+
+async def claim(post_id: int, recipient_ids: Iterable[int]) -> List[int]:
+    """
+    Занимает отправку уведомления об объявлении получателям (SET NX EX).
+
+    Args:
+        post_id: ID объявления
+        recipient_ids: ID получателей в БД
+
+    Returns:
+        Получатели, которым уведомление ещё не отправлялось
+        (при недоступном Redis - все)
+    """
+    recipient_ids = list(recipient_ids)
+    if not recipient_ids:
+        return []
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for recipient_id in recipient_ids:
+                pipe.set(
+                    LEDGER_KEY.format(post_id=post_id, recipient_id=recipient_id),
+                    1,
+                    ex=NOTIFY_LEDGER_TTL,
+                    nx=True
+                )
+            claimed = await pipe.execute()
+    except Exception as e:
+        logger.warning(f"⚠️ Журнал уведомлений недоступен, отправляю без проверки: {e}")
+        return recipient_ids
+
+    fresh = [recipient_id for recipient_id, ok in zip(recipient_ids, claimed) if ok]
+    if len(fresh) < len(recipient_ids):
+        metrics.inc("notify_ledger.skipped_send", len(recipient_ids) - len(fresh))
+    return fresh
+
+
+async def release(post_id: int, recipient_ids: Iterable[int]) -> None:
+    """
+    Освобождает отправку, которая точно не состоялась (ошибка Telegram),
+    чтобы повтор задачи мог её выполнить.
+
+    Args:
+        post_id: ID объявления
+        recipient_ids: ID получателей в БД
+    """
+    keys = [LEDGER_KEY.format(post_id=post_id, recipient_id=recipient_id) for recipient_id in recipient_ids]
+    if not keys:
+        return
+    try:
+        await get_redis().delete(*keys)
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось освободить {len(keys)} записей журнала уведомлений о посте {post_id}: {e}")
+
+
+async def forget(pairs: Iterable[Tuple[int, int]]) -> None:
+    """
+    Удаляет записи журнала вместе с уведомлениями (пауза/удаление объявления),
+    чтобы после возобновления объявления получатели снова получили уведомление.
+
+    Args:
+        pairs: Пары (ID объявления, ID получателя в БД)
+    """
+    keys = [LEDGER_KEY.format(post_id=post_id, recipient_id=recipient_id) for post_id, recipient_id in pairs]
+    if not keys:
+        return
+    try:
+        await get_redis().delete(*keys)
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось удалить {len(keys)} записей журнала уведомлений: {e}")
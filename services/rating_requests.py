@@ -0,0 +1,55 @@
+# services/rating_requests.py - Планирование запросов на оценку поездки
+# Запросы хранятся в rating_requests и отправляются воркером workers/rating_requests.py
+
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable, Tuple
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import RATING_REQUEST_DELAY_HOURS
+from database.models import RatingRequest
+
+logger = logging.getLogger(__name__)
+
+
+async def schedule_rating_requests(
+    session: AsyncSession,
+    post_id: int,
+    pairs: Iterable[Tuple[int, int]]
+) -> int:
+    """
+    Записывает запросы на оценку через RATING_REQUEST_DELAY_HOURS часов.
+    Повторный показ контактов не создаёт дублей (ON CONFLICT DO NOTHING
+    по uq_rating_request) и не сдвигает время уже запланированного запроса.
+    Коммит - на стороне вызывающего.
+
+    Args:
+        session: Сессия БД
+        post_id: ID объявления
+        pairs: Пары (кто оценивает, кого оценивают) - ID пользователей в БД
+
+    Returns:
+        Количество новых запросов
+    """
+    scheduled_at = datetime.utcnow() + timedelta(hours=RATING_REQUEST_DELAY_HOURS)
+    rows = [
+        {
+            "post_id": post_id,
+            "from_user_id": from_user_id,
+            "to_user_id": to_user_id,
+            "scheduled_at": scheduled_at,
+            "sent": 0
+        }
+        for from_user_id, to_user_id in pairs
+    ]
+    if not rows:
+        return 0
+
+    result = await session.execute(
+        insert(RatingRequest)
+        .values(rows)
+        .on_conflict_do_nothing(constraint="uq_rating_request")
+    )
+    return result.rowcount
@@ -0,0 +1,196 @@
+# services/render_cache.py - Готовые уведомления о совпадении по объявлению
+# Текст и клавиатура формируются один раз при публикации и хранятся в Redis до истечения объявления
+
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple, Union
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Post, User
+from services.match_index import IndexedPost
+from utils import metrics
+from utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Вариант сообщения: пока только уведомление о совпадении маршрута
+MATCH = "match"
+
+RENDER_KEY = "notify:render:{post_id}:{variant}"
+
+# Минимальное время жизни записи (объявление могло уже почти истечь)
+MIN_TTL = 60
+
+
+def post_notification_data(post: Union[Post, IndexedPost]) -> Dict[str, Any]:
+    """Данные объявления для уведомления о совпадении"""
+    return {
+        "id": post.id,
+        "role": post.role,
+        "from_place": post.from_place,
+        "to_place": post.to_place,
+        "departure_time": post.departure_time,
+        "seats": post.seats,
+        "price": post.price
+    }
+
+
+def author_notification_data(author: User) -> Dict[str, Any]:
+    """Данные автора для уведомления о совпадении (номер скрыт)"""
+    return {
+        "user_id": author.id,
+        "name": author.phone[:4] + "***" if author.phone else "Пользователь",
+        "rating": str(author.rating),
+        "car_photo_file_id": author.car_photo_file_id if author.car_photo_file_id else None
+    }
+
+
+def render_match_notification(
+    post_data: Dict[str, Any],
+    author_data: Dict[str, Any]
+) -> Tuple[str, InlineKeyboardMarkup]:
+    """
+    Формирует текст и клавиатуру уведомления о совпадении маршрута.
+
+    Args:
+        post_data: Данные объявления (dict)
+        author_data: Данные автора объявления (dict)
+
+    Returns:
+        (текст, клавиатура)
+    """
+    # Определяем тип объявления
+    role_emoji = "🚗" if post_data["role"] == "driver" else "🚶"
+    role_text = "Водитель" if post_data["role"] == "driver" else "Пассажир"
+
+    # Дополнительная строка для водителя
+    seats_line = f"🪑 Мест: {post_data.get('seats', '—')}\n" if post_data["role"] == "driver" else ""
+
+    text = (
+        f"🔔 <b>Найден попутчик!</b>\n\n"
+        f"{role_emoji} {role_text} едет по вашему маршруту:\n\n"
+        f"📍 <b>Откуда:</b> {post_data['from_place']}\n"
+        f"📍 <b>Куда:</b> {post_data['to_place']}\n"
+        f"⏰ <b>Время:</b> {post_data.get('departure_time', 'Не указано')}\n"
+        f"{seats_line}"
+        f"💰 <b>Цена:</b> {post_data['price']} сом\n"
+        f"⭐ <b>Рейтинг:</b> {author_data['rating']}\n"
+    )
+
+    # Кнопка "Связаться" показывается ТОЛЬКО при совпадении
+    callback_data_value = f"contact:{post_data['id']}:{author_data['user_id']}"
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text="📞 Связаться",
+            callback_data=callback_data_value
+        )],
+        [InlineKeyboardButton(
+            text="🏠 В меню",
+            callback_data="main_menu"
+        )]
+    ])
+    return text, keyboard
+
+
+def _ttl(expires_at: Optional[datetime]) -> int:
+    if not expires_at:
+        return MIN_TTL
+    return max(int((expires_at - datetime.utcnow()).total_seconds()), MIN_TTL)
+
+
+async def store(post: Union[Post, IndexedPost], author: User) -> Dict[str, Any]:
+    """
+    Формирует уведомление о совпадении с объявлением и кладёт его в Redis
+    до истечения объявления (повторный вызов обновляет запись и срок).
+
+    Args:
+        post: Объявление
+        author: Автор объявления
+
+    Returns:
+        {"post": ..., "author": ..., "text": ..., "keyboard": InlineKeyboardMarkup}
+    """
+    post_data = post_notification_data(post)
+    author_data = author_notification_data(author)
+    text, keyboard = render_match_notification(post_data, author_data)
+
+    await get_redis().set(
+        RENDER_KEY.format(post_id=post.id, variant=MATCH),
+        json.dumps({
+            "post": post_data,
+            "author": author_data,
+            "text": text,
+            "keyboard": keyboard.model_dump(exclude_none=True)
+        }, ensure_ascii=False),
+        ex=_ttl(post.expires_at)
+    )
+    return {"post": post_data, "author": author_data, "text": text, "keyboard": keyboard}
+
+
+async def load(post_id: int, variant: str = MATCH) -> Optional[Dict[str, Any]]:
+    """
+    Готовое уведомление по объявлению из Redis.
+
+    Args:
+        post_id: ID объявления
+        variant: Вариант сообщения
+
+    Returns:
+        {"post", "author", "text", "keyboard"} или None, если записи нет
+    """
+    raw = await get_redis().get(RENDER_KEY.format(post_id=post_id, variant=variant))
+    if raw is None:
+        metrics.inc("render_cache.miss")
+        return None
+
+    metrics.inc("render_cache.hit")
+    payload = json.loads(raw)
+    payload["keyboard"] = InlineKeyboardMarkup.model_validate(payload["keyboard"])
+    return payload
+
+
+async def get_or_render(session: AsyncSession, post_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Готовое уведомление о совпадении с объявлением: из Redis, а если записи
+    нет (истекла, Redis очищен) - из БД с повторным сохранением.
+
+    Args:
+        session: Сессия БД (используется только при промахе)
+        post_id: ID объявления
+
+    Returns:
+        {"post", "author", "text", "keyboard"} или None, если объявление не активно
+    """
+    try:
+        payload = await load(post_id)
+        if payload:
+            return payload
+    except Exception as e:
+        logger.warning(f"⚠️ Кэш уведомлений недоступен, формирую из БД: {e}")
+
+    post_result = await session.execute(select(Post).where(Post.id == post_id))
+    post = post_result.scalar_one_or_none()
+    if not post or post.status != "active":
+        return None
+
+    author_result = await session.execute(select(User).where(User.id == post.author_id))
+    author = author_result.scalar_one_or_none()
+    if not author:
+        return None
+
+    try:
+        return await store(post, author)
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось сохранить уведомление о посте {post_id} в кэш: {e}")
+        text, keyboard = render_match_notification(post_notification_data(post), author_notification_data(author))
+        return {
+            "post": post_notification_data(post),
+            "author": author_notification_data(author),
+            "text": text,
+            "keyboard": keyboard
+        }
@@ -0,0 +1,65 @@
+# services/reverse_matching.py - Обратный матчинг новых подписок
+# Уведомляет подписчика об уже активных объявлениях по его маршруту
+
+import logging
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Subscription, User
+from services import notify_ledger
+from services.digest import digest_kwargs
+from services.matching import match_subscription
+from tasks.notifications import send_match_notification
+
+logger = logging.getLogger(__name__)
+
+
+async def notify_subscription_matches(
+    session: AsyncSession,
+    subscription: Subscription
+) -> int:
+    """
+    Ищет активные объявления для только что сохранённой подписки
+    и ставит в очередь уведомления о совпадении.
+    Вызывается после commit подписки (и index_subscription).
+
+    Args:
+        session: Сессия БД
+        subscription: Сохранённая подписка
+
+    Returns:
+        Количество запланированных уведомлений
+    """
+    matches = await match_subscription(session, subscription)
+    if not matches.matching_posts:
+        return 0
+
+    subscriber_query = select(User).where(User.id == subscription.user_id)
+    subscriber_result = await session.execute(subscriber_query)
+    subscriber = subscriber_result.scalar_one_or_none()
+    if not subscriber:
+        return 0
+
+    # Уже отправленные уведомления (повторное сохранение подписки) не ставим в очередь
+    unsent = set(notify_ledger.filter_unsent(
+        [(post.id, subscriber.id) for post in matches.matching_posts]
+    ))
+    posts = [post for post in matches.matching_posts if (post.id, subscriber.id) in unsent]
+
+    for post in posts:
+        logger.info(
+            f"Отправляю уведомление подписчику {subscriber.telegram_id} "
+            f"о существующем объявлении {post.id} (подписка {subscription.id})"
+        )
+        send_match_notification.delay(
+            recipient_telegram_id=subscriber.telegram_id,
+            post_id=post.id,
+            recipient_db_id=subscriber.id,
+            **digest_kwargs(subscriber)
+        )
+
+    logger.info(
+        f"✅ Запланировано {len(posts)} уведомлений "
+        f"по новой подписке {subscription.id}"
+    )
+    return len(posts)
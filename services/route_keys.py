@@ -0,0 +1,71 @@
+# services/route_keys.py - Словарь ключей маршрутов
+# Отображает ключи из generate_keys в компактные целые ID (таблица route_keys)
+
+from typing import Dict, List, Union
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+
+from database.db import get_session
+from database.models import RouteKey, Post, Subscription
+
+logger = logging.getLogger(__name__)
+
+# Кэш процесса: ключ → ID (записи словаря никогда не меняются и не удаляются)
+_key_ids_cache: Dict[str, int] = {}
+
+
+async def get_key_ids(session: AsyncSession, keys: List[str]) -> List[int]:
+    """
+    Возвращает ID ключей из словаря, добавляя отсутствующие ключи.
+
+    Args:
+        session: Сессия БД
+        keys: Ключи маршрута (из generate_keys)
+
+    Returns:
+        Список ID в том же порядке, что и ключи
+    """
+    missing = [key for key in dict.fromkeys(keys) if key not in _key_ids_cache]
+
+    if missing:
+        result = await session.execute(
+            select(RouteKey.key, RouteKey.id).where(RouteKey.key.in_(missing))
+        )
+        for key, key_id in result.all():
+            _key_ids_cache[key] = key_id
+        missing = [key for key in missing if key not in _key_ids_cache]
+
+    if missing:
+        # Новые ключи добавляются в отдельной транзакции, чтобы их ID
+        # не пропали при откате транзакции вызывающего кода
+        async with get_session() as dictionary_session:
+            await dictionary_session.execute(
+                insert(RouteKey)
+                .values([{"key": key} for key in missing])
+                .on_conflict_do_nothing(index_elements=["key"])
+            )
+            result = await dictionary_session.execute(
+                select(RouteKey.key, RouteKey.id).where(RouteKey.key.in_(missing))
+            )
+            inserted = result.all()
+        # Кэшируем только после commit словарной транзакции
+        for key, key_id in inserted:
+            _key_ids_cache[key] = key_id
+        logger.info(f"Добавлено {len(missing)} новых ключей в словарь маршрутов")
+
+    return [_key_ids_cache[key] for key in keys]
+
+
+async def assign_key_ids(session: AsyncSession, route: Union[Post, Subscription]) -> None:
+    """
+    Заполняет key_ids_from / key_ids_to объявления или подписки
+    по их текстовым ключам. Вызывается перед сохранением.
+
+    Args:
+        session: Сессия БД
+        route: Объявление или подписка с заполненными keys_from / keys_to
+    """
+    route.key_ids_from = await get_key_ids(session, route.keys_from)
+    route.key_ids_to = await get_key_ids(session, route.keys_to)
@@ -1,8 +1,14 @@
 # tasks/__init__.py
-from tasks.notifications import send_match_notification, schedule_rating_request
+from tasks.notifications import (
+    send_match_notification,
+    send_match_notifications_batch,
+    send_match_digest,
+    schedule_rating_request
+)
 
 __all__ = [
     "send_match_notification",
+    "send_match_notifications_batch",
+    "send_match_digest",
     "schedule_rating_request"
 ]
-
@@ -0,0 +1,250 @@
+# tasks/delivery.py - Повторы задач уведомлений по классу ошибки и dead-letter очередь
+# TelegramRetryAfter - ровно через retry_after, временные ошибки - с разбросом, постоянные - в DLQ
+
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramRetryAfter,
+    TelegramUnauthorizedError
+)
+
+from config import (
+    NOTIFY_RETRY_BACKOFF_BASE,
+    NOTIFY_RETRY_BACKOFF_MAX,
+    NOTIFY_DLQ_STREAM,
+    NOTIFY_DLQ_MAXLEN
+)
+from tasks.queue import REGISTRY
+from utils import metrics
+from utils.redis_client import get_redis, get_sync_redis
+
+logger = logging.getLogger(__name__)
+
+# Причины попадания задачи в DLQ
+PERMANENT = "permanent"  # Повтор не поможет (бот заблокирован, чат не найден)
+EXHAUSTED = "exhausted"  # Исчерпаны повторы
+
+# Ошибки Telegram, после которых повтор не поможет
+PERMANENT_ERRORS = (TelegramForbiddenError, TelegramBadRequest, TelegramUnauthorizedError)
+
+# Сколько записей DLQ переотправлять за раз
+REPLAY_BATCH = 1000
+
+
+def retry_delay(error: BaseException, attempt: int) -> Optional[float]:
+    """
+    Задержка перед повтором задачи по классу ошибки.
+
+    Args:
+        error: Ошибка выполнения
+        attempt: Номер повтора (0 - первый)
+
+    Returns:
+        Секунды до повтора или None - повтор не поможет
+    """
+    if isinstance(error, TelegramRetryAfter):
+        # Telegram сам сообщает, когда снова принимать запросы
+        return float(error.retry_after)
+    if isinstance(error, PERMANENT_ERRORS):
+        return None
+    # Экспонента с разбросом: повторы задач, упавших вместе, не приходят одной волной
+    ceiling = min(NOTIFY_RETRY_BACKOFF_MAX, NOTIFY_RETRY_BACKOFF_BASE * 2 ** attempt)
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def heaviest_error(errors: Sequence[BaseException]) -> BaseException:
+    """
+    Ошибка, по которой планировать повтор пачки: самый долгий
+    TelegramRetryAfter, иначе первая ошибка.
+    """
+    retry_after = [error for error in errors if isinstance(error, TelegramRetryAfter)]
+    if retry_after:
+        return max(retry_after, key=lambda error: error.retry_after)
+    return errors[0]
+
+
+def _entry(
+    name: str,
+    args: Optional[Sequence[Any]],
+    kwargs: Optional[Dict[str, Any]],
+    error: BaseException,
+    reason: str,
+    queue: Optional[str]
+) -> Dict[str, str]:
+    return {
+        "task": name,
+        "args": json.dumps(list(args or ()), ensure_ascii=False),
+        "kwargs": json.dumps(dict(kwargs or {}), ensure_ascii=False),
+        "queue": queue or "",
+        "reason": reason,
+        "error": f"{type(error).__name__}: {error}"[:500],
+        "failed_at": str(int(time.time()))
+    }
+
+
+def dead_letter(
+    name: str,
+    args: Optional[Sequence[Any]],
+    kwargs: Optional[Dict[str, Any]],
+    error: BaseException,
+    reason: str,
+    queue: Optional[str] = None
+) -> None:
+    """
+    Записывает невыполненную задачу в DLQ (NOTIFY_DLQ_STREAM).
+
+    Args:
+        name: Имя задачи
+        args / kwargs: Аргументы задачи (для переотправки)
+        error: Последняя ошибка
+        reason: PERMANENT или EXHAUSTED
+        queue: Класс трафика задачи
+    """
+    metrics.inc(f"notify_dlq.{reason}")
+    logger.error(f"❌ Задача {name} отправлена в DLQ ({reason}): {error}")
+    try:
+        get_sync_redis().xadd(
+            NOTIFY_DLQ_STREAM,
+            _entry(name, args, kwargs, error, reason, queue),
+            maxlen=NOTIFY_DLQ_MAXLEN,
+            approximate=True
+        )
+    except Exception as e:
+        logger.error(f"❌ Не удалось записать задачу {name} в DLQ: {e}")
+
+
+async def dead_letter_async(
+    name: str,
+    args: Optional[Sequence[Any]],
+    kwargs: Optional[Dict[str, Any]],
+    error: BaseException,
+    reason: str,
+    queue: Optional[str] = None
+) -> None:
+    """То же, что dead_letter, для асинхронного кода (тела задач, потребитель стрима)"""
+    metrics.inc(f"notify_dlq.{reason}")
+    logger.error(f"❌ Задача {name} отправлена в DLQ ({reason}): {error}")
+    try:
+        await get_redis().xadd(
+            NOTIFY_DLQ_STREAM,
+            _entry(name, args, kwargs, error, reason, queue),
+            maxlen=NOTIFY_DLQ_MAXLEN,
+            approximate=True
+        )
+    except Exception as e:
+        logger.error(f"❌ Не удалось записать задачу {name} в DLQ: {e}")
+
+
+def retry_or_dead_letter(
+    task,
+    error: BaseException,
+    args: Optional[Sequence[Any]] = None,
+    kwargs: Optional[Dict[str, Any]] = None
+) -> None:
+    """
+    Celery: планирует повтор задачи с задержкой по классу ошибки
+    или отправляет её в DLQ. Вызывается из except обёртки задачи.
+
+    Args:
+        task: Celery задача (bind=True)
+        error: Ошибка выполнения
+        args / kwargs: Аргументы повтора (по умолчанию - текущие)
+
+    Raises:
+        celery.exceptions.Retry: Повтор запланирован
+    """
+    args = task.request.args if args is None else args
+    kwargs = task.request.kwargs if kwargs is None else kwargs
+    attempt = task.request.retries
+
+    delay = retry_delay(error, attempt)
+    if delay is None:
+        dead_letter(task.name, args, kwargs, error, PERMANENT, task.queue)
+        return
+    if attempt >= task.max_retries:
+        dead_letter(task.name, args, kwargs, error, EXHAUSTED, task.queue)
+        return
+
+    logger.warning(f"⚠️ Задача {task.name} будет повторена через {delay:.1f} сек (попытка {attempt + 1}): {error}")
+    raise task.retry(exc=error, countdown=delay, args=args, kwargs=kwargs)
+
+
+async def dead_letters(count: int = 10) -> List[Tuple[str, Dict[str, str]]]:
+    """
+    Последние записи DLQ.
+
+    Args:
+        count: Сколько записей вернуть
+
+    Returns:
+        [(ID записи, поля)] - от новых к старым
+    """
+    return await get_redis().xrevrange(NOTIFY_DLQ_STREAM, count=count)
+
+
+async def dead_letters_count() -> int:
+    """Количество записей в DLQ"""
+    return await get_redis().xlen(NOTIFY_DLQ_STREAM)
+
+
+async def replay(entry_ids: Optional[Sequence[str]] = None) -> int:
+    """
+    Ставит задачи из DLQ обратно в очередь и удаляет их из DLQ.
+
+    Args:
+        entry_ids: ID записей (None - до REPLAY_BATCH самых старых)
+
+    Returns:
+        Сколько задач поставлено в очередь
+    """
+    redis = get_redis()
+    if entry_ids is None:
+        entries = await redis.xrange(NOTIFY_DLQ_STREAM, count=REPLAY_BATCH)
+    else:
+        entries = []
+        for entry_id in entry_ids:
+            entries.extend(await redis.xrange(NOTIFY_DLQ_STREAM, min=entry_id, max=entry_id))
+
+    replayed = 0
+    for entry_id, fields in entries:
+        task = REGISTRY.get(fields.get("task"))
+        if not task:
+            logger.warning(f"⚠️ Запись DLQ {entry_id}: неизвестная задача {fields.get('task')}, пропускаю")
+            continue
+        # .apply_async синхронный (Celery / синхронный Redis) - не блокируем event loop
+        await asyncio.to_thread(
+            task.apply_async,
+            args=json.loads(fields["args"]),
+            kwargs=json.loads(fields["kwargs"]),
+            queue=fields.get("queue") or None
+        )
+        await redis.xdel(NOTIFY_DLQ_STREAM, entry_id)
+        replayed += 1
+
+    metrics.inc("notify_dlq.replayed", replayed)
+    return replayed
+
+
+async def drop(entry_ids: Optional[Sequence[str]] = None) -> int:
+    """
+    Удаляет записи из DLQ.
+
+    Args:
+        entry_ids: ID записей (None - все)
+
+    Returns:
+        Сколько записей удалено
+    """
+    redis = get_redis()
+    if entry_ids is None:
+        count = await redis.xlen(NOTIFY_DLQ_STREAM)
+        await redis.delete(NOTIFY_DLQ_STREAM)
+        return count
+    return await redis.xdel(NOTIFY_DLQ_STREAM, *entry_ids) if entry_ids else 0
@@ -0,0 +1,107 @@
+# tasks/monitoring.py - Глубина очередей уведомлений и время ожидания задач
+# Данные для подбора числа воркеров на каждую очередь (/queues у админа)
+
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from celery.signals import before_task_publish, task_prerun
+
+from celery_app import NOTIFICATION_QUEUES
+from config import NOTIFY_QUEUE_BACKEND, NOTIFY_QUEUE_STREAM, NOTIFY_QUEUE_DELAYED
+from utils import metrics
+from utils.redis_client import get_redis, get_sync_redis
+
+logger = logging.getLogger(__name__)
+
+# Последние времена ожидания задач очереди (мс), общие для всех воркеров
+WAIT_KEY = "notify:wait_ms:{queue}"
+WAIT_WINDOW = 1000
+
+
+def record_wait(queue: Optional[str], wait_ms: float) -> None:
+    """
+    Записывает время от постановки задачи в очередь до начала выполнения.
+
+    Args:
+        queue: Очередь (класс трафика) задачи
+        wait_ms: Время ожидания в миллисекундах
+    """
+    queue = queue or "unknown"
+    metrics.observe(f"queue.wait_ms.{queue}", wait_ms)
+    try:
+        pipe = get_sync_redis().pipeline(transaction=False)
+        pipe.lpush(WAIT_KEY.format(queue=queue), round(wait_ms))
+        pipe.ltrim(WAIT_KEY.format(queue=queue), 0, WAIT_WINDOW - 1)
+        pipe.execute()
+    except Exception as e:
+        logger.debug(f"Не удалось записать время ожидания очереди {queue}: {e}")
+
+
+async def record_wait_async(queue: Optional[str], wait_ms: float) -> None:
+    """То же, что record_wait, для потребителя стрима (workers/notify_queue.py)"""
+    queue = queue or "unknown"
+    metrics.observe(f"queue.wait_ms.{queue}", wait_ms)
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            pipe.lpush(WAIT_KEY.format(queue=queue), round(wait_ms))
+            pipe.ltrim(WAIT_KEY.format(queue=queue), 0, WAIT_WINDOW - 1)
+            await pipe.execute()
+    except Exception as e:
+        logger.debug(f"Не удалось записать время ожидания очереди {queue}: {e}")
+
+
+@before_task_publish.connect
+def _stamp_published_at(headers=None, **kwargs) -> None:
+    # Заголовок доступен воркеру как task.request.published_at
+    if headers is not None:
+        headers["published_at"] = time.time()
+
+
+@task_prerun.connect
+def _observe_wait(task=None, **kwargs) -> None:
+    published_at = getattr(task.request, "published_at", None)
+    if not published_at:
+        return
+
+    # Для отложенных задач (countdown) ожидание считается с назначенного времени
+    started_from = published_at
+    eta = task.request.eta
+    if eta:
+        try:
+            started_from = max(published_at, datetime.fromisoformat(eta).timestamp())
+        except (TypeError, ValueError):
+            pass
+
+    queue = (task.request.delivery_info or {}).get("routing_key")
+    record_wait(queue, (time.time() - started_from) * 1000)
+
+
+async def queue_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Текущее состояние очередей уведомлений.
+
+    Returns:
+        {очередь: {"depth": задач в очереди, "wait": {count, avg, p50, p99, max}}}
+    """
+    redis = get_redis()
+    stats = {}
+
+    for queue in NOTIFICATION_QUEUES:
+        # Брокер Celery на Redis хранит очередь в списке с её именем
+        depth = await redis.llen(queue) if NOTIFY_QUEUE_BACKEND == "celery" else None
+
+        summary = metrics.Summary()
+        for value in await redis.lrange(WAIT_KEY.format(queue=queue), 0, -1):
+            summary.observe(float(value))
+        stats[queue] = {"depth": depth, "wait": summary.to_dict()}
+
+    if NOTIFY_QUEUE_BACKEND == "stream":
+        # Один стрим на все классы; отложенные задачи (countdown, повторы) - отдельно
+        stats["stream"] = {
+            "depth": await redis.xlen(NOTIFY_QUEUE_STREAM),
+            "delayed": await redis.zcard(NOTIFY_QUEUE_DELAYED)
+        }
+
+    return stats
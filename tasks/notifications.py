@@ -1,140 +1,416 @@
 # tasks/notifications.py - Celery задачи для уведомлений
-# Асинхронная отправка уведомлений через очередь
+# Асинхронная отправка уведомлений через очередь (Celery или Redis Streams, см. tasks/queue.py)
 
 import asyncio
 import logging
-from typing import Dict, Any
+from collections import defaultdict
+from typing import Dict, Any, List, Tuple
 
-from celery_app import celery
+from celery_app import celery, QUEUE_REALTIME_MATCH, QUEUE_BULK, QUEUE_EXPIRATION, QUEUE_RATING
 from aiogram import Bot
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message
 
-from config import BOT_TOKEN, DATABASE_URL
+from config import NOTIFY_BATCH_CONCURRENCY, NOTIFY_BATCH_RATE, DIGEST_MAX_ITEMS, NOTIFY_CLEANUP_CONCURRENCY
+from services import digest, notify_ledger, render_cache
+from services.render_cache import render_match_notification
+from tasks import monitoring  # noqa: F401 - метрики ожидания в очередях (сигналы Celery)
+from tasks import runtime
+from tasks.delivery import PERMANENT, dead_letter_async, heaviest_error, retry_delay, retry_or_dead_letter
+from tasks.queue import QueueTask, RetryWith
+from utils import metrics
+from utils.redis_client import get_redis
 
 logger = logging.getLogger(__name__)
 
 
-@celery.task(bind=True, max_retries=3, default_retry_delay=60)
-def send_match_notification(
-    self,
-    recipient_telegram_id: int,
+async def deliver_match_notification(
+    bot: Bot,
+    chat_id: int,
     post_data: Dict[str, Any],
     author_data: Dict[str, Any],
-    recipient_db_id: int = None
+    text: str,
+    keyboard: InlineKeyboardMarkup
+) -> Message:
+    """Отправляет готовое уведомление о совпадении (с фото авто, если есть)"""
+    # Если это водитель и у него есть фото автомобиля - отправляем фото
+    car_photo_file_id = author_data.get("car_photo_file_id")
+    if post_data["role"] == "driver" and car_photo_file_id:
+        return await bot.send_photo(
+            chat_id=chat_id,
+            photo=car_photo_file_id,
+            caption=text,
+            parse_mode="HTML",
+            reply_markup=keyboard
+        )
+    # Обычное текстовое сообщение
+    return await bot.send_message(
+        chat_id=chat_id,
+        text=text,
+        parse_mode="HTML",
+        reply_markup=keyboard
+    )
+
+
+async def send_match_notification_async(
+    recipient_telegram_id: int,
+    post_data: Dict[str, Any] = None,
+    author_data: Dict[str, Any] = None,
+    recipient_db_id: int = None,
+    digest_threshold: int = None,
+    digest_window: int = None,
+    post_id: int = None
 ):
     """
     Отправляет уведомление о совпадении маршрута.
-    Выполняется асинхронно через Celery.
+    Совпадения сверх порога за окно получателя откладываются в сводку.
     
     Args:
         recipient_telegram_id: Telegram ID получателя
-        post_data: Данные объявления (dict)
+        post_data: Данные объявления (dict) - задачи, поставленные до кэша уведомлений
         author_data: Данные автора объявления (dict)
-        recipient_db_id: ID получателя в БД (для сохранения в лог)
+        recipient_db_id: ID получателя в БД (для сохранения в лог и сводки)
+        digest_threshold / digest_window: Настройки сводки получателя (digest.digest_kwargs)
+        post_id: ID объявления - готовое уведомление берётся из render_cache
     """
-    async def send():
-        bot = Bot(token=BOT_TOKEN)
+    bot = runtime.get_bot()
+    
+    if post_data is not None:
+        post_id = post_data["id"]
+    
+    # Повторная рассылка или повтор задачи после отправки - без вызова Telegram
+    if recipient_db_id and not await notify_ledger.claim(post_id, [recipient_db_id]):
+        logger.info(f"Уведомление о посте {post_id} пользователю {recipient_telegram_id} уже отправлено, пропускаю")
+        return
+    
+    try:
+        if post_data is None:
+            async with runtime.session_maker()() as session:
+                payload = await render_cache.get_or_render(session, post_id)
+            if not payload:
+                # Объявление могут возобновить - отправка должна остаться возможной
+                if recipient_db_id:
+                    await notify_ledger.release(post_id, [recipient_db_id])
+                logger.info(f"Объявление {post_id} больше не активно, уведомление пользователю {recipient_telegram_id} отменено")
+                return
+            post_data, author_data = payload["post"], payload["author"]
+            text, keyboard = payload["text"], payload["keyboard"]
+        else:
+            text, keyboard = render_match_notification(post_data, author_data)
         
-        try:
-            # Определяем тип объявления
-            role_emoji = "🚗" if post_data["role"] == "driver" else "🚶"
-            role_text = "Водитель" if post_data["role"] == "driver" else "Пассажир"
-            
-            # Дополнительная строка для водителя
-            seats_line = f"🪑 Мест: {post_data.get('seats', '—')}\n" if post_data["role"] == "driver" else ""
-            
-            text = (
-                f"🔔 <b>Найден попутчик!</b>\n\n"
-                f"{role_emoji} {role_text} едет по вашему маршруту:\n\n"
-                f"📍 <b>Откуда:</b> {post_data['from_place']}\n"
-                f"📍 <b>Куда:</b> {post_data['to_place']}\n"
-                f"⏰ <b>Время:</b> {post_data.get('departure_time', 'Не указано')}\n"
-                f"{seats_line}"
-                f"💰 <b>Цена:</b> {post_data['price']} сом\n"
-                f"⭐ <b>Рейтинг:</b> {author_data['rating']}\n"
+        if recipient_db_id and not await digest.admit(recipient_db_id, digest_threshold, digest_window):
+            await defer_to_digest(recipient_telegram_id, recipient_db_id, post_data, author_data)
+            return
+        
+        message = await deliver_match_notification(
+            bot, recipient_telegram_id, post_data, author_data, text, keyboard
+        )
+        
+        logger.info(f"✅ Уведомление о посте {post_id} отправлено пользователю {recipient_telegram_id} (msg_id={message.message_id})")
+        
+        # Сохраняем message_id в БД - пачкой вместе с другими уведомлениями процесса
+        if recipient_db_id:
+            runtime.notification_log().add(
+                post_id=post_id,
+                recipient_id=recipient_db_id,
+                notification_message_id=message.message_id,
+                recipient_telegram_id=recipient_telegram_id
             )
-            
-            # Кнопка "Связаться" показывается ТОЛЬКО при совпадении
-            callback_data_value = f"contact:{post_data['id']}:{author_data['user_id']}"
-            logger.info(f"Формирую callback_data для кнопки: '{callback_data_value}' (длина: {len(callback_data_value)})")
-            
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(
-                    text="📞 Связаться",
-                    callback_data=callback_data_value
-                )],
-                [InlineKeyboardButton(
-                    text="🏠 В меню",
-                    callback_data="main_menu"
-                )]
-            ])
-            
-            # Если это водитель и у него есть фото автомобиля - отправляем фото
-            car_photo_file_id = author_data.get("car_photo_file_id")
-            if post_data["role"] == "driver" and car_photo_file_id:
-                message = await bot.send_photo(
-                    chat_id=recipient_telegram_id,
-                    photo=car_photo_file_id,
-                    caption=text,
-                    parse_mode="HTML",
-                    reply_markup=keyboard
+        
+    except Exception as e:
+        if recipient_db_id and notify_ledger.is_ambiguous(e):
+            # Сообщение могло дойти - повтор задачи мог бы его продублировать
+            logger.warning(f"⚠️ Неизвестно, доставлено ли уведомление о посте {post_id} пользователю {recipient_telegram_id}, повтор не выполняется: {e}")
+            return
+        if recipient_db_id:
+            await notify_ledger.release(post_id, [recipient_db_id])
+        logger.error(f"Ошибка отправки уведомления: {e}")
+        raise
+
+
+@celery.task(bind=True, max_retries=3, default_retry_delay=60, queue=QUEUE_REALTIME_MATCH, name="tasks.notifications.send_match_notification")
+def send_match_notification_task(self, *args, **kwargs):
+    """Celery задача send_match_notification_async"""
+    try:
+        runtime.run(send_match_notification_async(*args, **kwargs))
+    except Exception as exc:
+        logger.error(f"Celery task failed: {exc}")
+        retry_or_dead_letter(self, exc)
+
+
+send_match_notification = QueueTask(send_match_notification_task, send_match_notification_async)
+
+
+async def defer_to_digest(
+    recipient_telegram_id: int,
+    recipient_db_id: int,
+    post_data: Dict[str, Any],
+    author_data: Dict[str, Any]
+):
+    """Откладывает совпадение в сводку и планирует её отправку в конце окна"""
+    countdown = await digest.defer(recipient_db_id, post_data, author_data)
+    logger.info(f"Уведомление о посте {post_data['id']} для {recipient_telegram_id} отложено в сводку")
+    if countdown:
+        send_match_digest.apply_async(
+            kwargs={"recipient_telegram_id": recipient_telegram_id, "recipient_db_id": recipient_db_id},
+            countdown=countdown
+        )
+
+
+async def send_match_digest_async(
+    recipient_telegram_id: int,
+    recipient_db_id: int
+):
+    """
+    Отправляет сводку отложенных совпадений одним сообщением
+    (по DIGEST_MAX_ITEMS объявлений). Неактивные объявления пропускаются.
+    
+    Args:
+        recipient_telegram_id: Telegram ID получателя
+        recipient_db_id: ID получателя в БД
+    """
+    from sqlalchemy import select
+    from database.models import Post
+    
+    items, count = await digest.peek_pending(recipient_db_id)
+    if items:
+        async with runtime.session_maker()() as session:
+            active_result = await session.execute(
+                select(Post.id).where(
+                    Post.id.in_([item["post"]["id"] for item in items]),
+                    Post.status == "active"
                 )
-            else:
-                # Обычное текстовое сообщение
-                message = await bot.send_message(
-                chat_id=recipient_telegram_id,
-                text=text,
-                parse_mode="HTML",
-                reply_markup=keyboard
             )
+            active_ids = set(active_result.scalars())
+        items = [item for item in items if item["post"]["id"] in active_ids]
+    
+    bot = runtime.get_bot()
+    for start in range(0, len(items), DIGEST_MAX_ITEMS):
+        chunk = items[start:start + DIGEST_MAX_ITEMS]
+        text, keyboard = digest.render_digest(chunk)
+        await bot.send_message(
+            chat_id=recipient_telegram_id,
+            text=text,
+            parse_mode="HTML",
+            reply_markup=keyboard
+        )
+        # Одно сообщение на несколько объявлений - не удаляем его вместе с объявлением
+        for item in chunk:
+            runtime.notification_log().add(
+                post_id=item["post"]["id"],
+                recipient_id=recipient_db_id,
+                recipient_telegram_id=recipient_telegram_id
+            )
+    
+    if items:
+        logger.info(f"✅ Сводка из {len(items)} совпадений отправлена пользователю {recipient_telegram_id}")
+    
+    countdown = await digest.ack_pending(recipient_db_id, count)
+    if countdown:
+        send_match_digest.apply_async(
+            kwargs={"recipient_telegram_id": recipient_telegram_id, "recipient_db_id": recipient_db_id},
+            countdown=countdown
+        )
+
+
+@celery.task(bind=True, max_retries=3, default_retry_delay=60, queue=QUEUE_REALTIME_MATCH, name="tasks.notifications.send_match_digest")
+def send_match_digest_task(self, *args, **kwargs):
+    """Celery задача send_match_digest_async"""
+    try:
+        runtime.run(send_match_digest_async(*args, **kwargs))
+    except Exception as exc:
+        logger.error(f"Digest task failed: {exc}")
+        retry_or_dead_letter(self, exc)
+
+
+send_match_digest = QueueTask(send_match_digest_task, send_match_digest_async)
+
+
+async def send_match_notifications_batch_async(
+    post_id: int,
+    recipient_ids: List[int]
+):
+    """
+    Рассылает уведомление об одном объявлении пачке получателей.
+    Сообщение берётся готовым из render_cache, отправка идёт параллельно
+    (не больше NOTIFY_BATCH_CONCURRENCY одновременно и NOTIFY_BATCH_RATE в секунду),
+    результаты записываются в notifications_log через буфер процесса.
+    При ошибках задача повторяется только для неполучивших (RetryWith),
+    получатели с постоянной ошибкой (бот заблокирован) уходят в DLQ.
+    Уже получившие уведомление (журнал notify_ledger) пропускаются.
+    
+    Args:
+        post_id: ID объявления
+        recipient_ids: ID получателей в БД
+    """
+    from sqlalchemy import select
+    from database.models import Post, User
+    
+    bot = runtime.get_bot()
+    
+    recipient_ids = await notify_ledger.claim(post_id, recipient_ids)
+    if not recipient_ids:
+        return
+    
+    try:
+        async with runtime.session_maker()() as session:
+            status_result = await session.execute(select(Post.status).where(Post.id == post_id))
+            payload = None
+            if status_result.scalar_one_or_none() == "active":
+                payload = await render_cache.get_or_render(session, post_id)
+            if not payload:
+                # Объявление могут возобновить - отправка должна остаться возможной
+                await notify_ledger.release(post_id, recipient_ids)
+                logger.info(f"Объявление {post_id} больше не активно, рассылка {len(recipient_ids)} уведомлений отменена")
+                return
             
-            logger.info(f"✅ Уведомление отправлено пользователю {recipient_telegram_id} (msg_id={message.message_id}) с callback_data: {callback_data_value}")
-            
-            # Сохраняем message_id в БД (не критично, если не получится)
-            if recipient_db_id:
-                try:
-                    # Создаем НОВЫЙ engine и session специально для этой задачи
-                    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-                    from database.models import NotificationLog
-                    from config import DATABASE_URL
-                    
-                    # Создаём изолированный engine для этой задачи
-                    task_engine = create_async_engine(DATABASE_URL, echo=False)
-                    task_session_maker = async_sessionmaker(task_engine, class_=AsyncSession, expire_on_commit=False)
-                    
-                    async with task_session_maker() as task_session:
-                        log_entry = NotificationLog(
-                            post_id=post_data['id'],
-                            recipient_id=recipient_db_id,
-                            notification_message_id=message.message_id,
-                            recipient_telegram_id=recipient_telegram_id
-                        )
-                        task_session.add(log_entry)
-                        await task_session.commit()
-                        logger.info(f"✅ Сохранено в лог: post_id={post_data['id']}, recipient_id={recipient_db_id}, msg_id={message.message_id}")
-                    
-                    # Закрываем engine
-                    await task_engine.dispose()
-                except Exception as db_error:
-                    # Не прерываем выполнение, если не удалось сохранить в БД
-                    logger.warning(f"⚠️ Не удалось сохранить уведомление в БД: {db_error}. Уведомление отправлено, но не будет удалено при удалении поста.")
-            
-        except Exception as e:
-            logger.error(f"Ошибка отправки уведомления: {e}")
-            raise
-        finally:
-            await bot.session.close()
+            users_result = await session.execute(select(User).where(User.id.in_(recipient_ids)))
+            users = {user.id: user for user in users_result.scalars()}
+    except Exception:
+        await notify_ledger.release(post_id, recipient_ids)
+        raise
+    
+    post_data, author_data = payload["post"], payload["author"]
+    text, keyboard = payload["text"], payload["keyboard"]
     
+    semaphore = asyncio.Semaphore(NOTIFY_BATCH_CONCURRENCY)
+    interval = 1.0 / NOTIFY_BATCH_RATE
+    loop = asyncio.get_running_loop()
+    next_slot = loop.time()
+    
+    async def deliver(user: User):
+        nonlocal next_slot
+        async with semaphore:
+            # Равномерно распределяем отправки во времени
+            now = loop.time()
+            delay = next_slot - now
+            next_slot = max(next_slot, now) + interval
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return await deliver_match_notification(
+                bot, user.telegram_id, post_data, author_data, text, keyboard
+            )
+    
+    recipients = []
+    deferred = set()
     try:
-        asyncio.run(send())
+        for user_id in recipient_ids:
+            user = users.get(user_id)
+            if not user:
+                continue
+            settings = digest.digest_kwargs(user)
+            if not await digest.admit(user.id, settings["digest_threshold"], settings["digest_window"]):
+                await defer_to_digest(user.telegram_id, user.id, post_data, author_data)
+                deferred.add(user.id)
+                continue
+            recipients.append(user)
+    except Exception:
+        # Отложенные в сводку уйдут с ней, остальные ещё не отправлялись
+        await notify_ledger.release(post_id, [user_id for user_id in recipient_ids if user_id not in deferred])
+        raise
+    
+    results = await asyncio.gather(
+        *(deliver(user) for user in recipients),
+        return_exceptions=True
+    )
+    
+    delivered = 0
+    failed_ids = []
+    errors = []
+    for user, result in zip(recipients, results):
+        if isinstance(result, Exception) and retry_delay(result, 0) is None:
+            # Бот заблокирован, чат не найден - повтор не поможет, получатель уходит в DLQ
+            await notify_ledger.release(post_id, [user.id])
+            await dead_letter_async(
+                send_match_notifications_batch.name,
+                (),
+                {"post_id": post_id, "recipient_ids": [user.id]},
+                result,
+                PERMANENT,
+                QUEUE_BULK
+            )
+            continue
+        if isinstance(result, Exception) and notify_ledger.is_ambiguous(result):
+            # Сообщение могло дойти - повтор мог бы его продублировать
+            logger.warning(f"⚠️ Неизвестно, доставлено ли уведомление пользователю {user.telegram_id} о посте {post_id}, повтор не выполняется: {result}")
+            continue
+        if isinstance(result, Exception):
+            logger.error(f"Ошибка отправки уведомления пользователю {user.telegram_id} о посте {post_id}: {result}")
+            failed_ids.append(user.id)
+            errors.append(result)
+            continue
+        runtime.notification_log().add(
+            post_id=post_id,
+            recipient_id=user.id,
+            notification_message_id=result.message_id,
+            recipient_telegram_id=user.telegram_id
+        )
+        delivered += 1
+    
+    logger.info(f"✅ Уведомление о посте {post_id} отправлено {delivered} из {len(recipients)} получателей")
+    if failed_ids:
+        await notify_ledger.release(post_id, failed_ids)
+        # Повтор пачки - не раньше самого долгого TelegramRetryAfter
+        raise RetryWith({"post_id": post_id, "recipient_ids": failed_ids}, heaviest_error(errors))
+
+
+@celery.task(bind=True, max_retries=3, default_retry_delay=60, queue=QUEUE_BULK, name="tasks.notifications.send_match_notifications_batch")
+def send_match_notifications_batch_task(self, *args, **kwargs):
+    """Celery задача send_match_notifications_batch_async"""
+    try:
+        runtime.run(send_match_notifications_batch_async(*args, **kwargs))
+    except RetryWith as partial:
+        logger.error(f"Celery batch task: {len(partial.kwargs['recipient_ids'])} уведомлений о посте {partial.kwargs['post_id']} не отправлено, повтор")
+        retry_or_dead_letter(self, partial.error or partial, args=(), kwargs=partial.kwargs)
     except Exception as exc:
-        logger.error(f"Celery task failed: {exc}")
-        raise self.retry(exc=exc)
+        logger.error(f"Celery batch task failed: {exc}")
+        retry_or_dead_letter(self, exc)
+
 
+send_match_notifications_batch = QueueTask(send_match_notifications_batch_task, send_match_notifications_batch_async)
 
-@celery.task(bind=True, max_retries=3, default_retry_delay=60)
-def schedule_rating_request(
-    self,
+
+def render_rating_request(
+    to_user_telegram_id: int,
+    to_user_name: str,
+    post_id: int,
+    from_place: str,
+    to_place: str
+) -> Tuple[str, InlineKeyboardMarkup]:
+    """
+    Формирует текст и клавиатуру запроса на оценку поездки.
+    
+    Args:
+        to_user_telegram_id: Кого оценивают
+        to_user_name: Имя оцениваемого
+        post_id: ID объявления
+        from_place: Откуда
+        to_place: Куда
+    
+    Returns:
+        (текст, клавиатура)
+    """
+    text = (
+        f"⭐ <b>Оцените поездку</b>\n\n"
+        f"Как прошла поездка с {to_user_name}?\n"
+        f"📍 Маршрут: {from_place} → {to_place}\n"
+    )
+    
+    # Кнопки оценки
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="⭐ 1", callback_data=f"rate:{post_id}:{to_user_telegram_id}:1"),
+            InlineKeyboardButton(text="⭐ 2", callback_data=f"rate:{post_id}:{to_user_telegram_id}:2"),
+            InlineKeyboardButton(text="⭐ 3", callback_data=f"rate:{post_id}:{to_user_telegram_id}:3"),
+            InlineKeyboardButton(text="⭐ 4", callback_data=f"rate:{post_id}:{to_user_telegram_id}:4"),
+            InlineKeyboardButton(text="⭐ 5", callback_data=f"rate:{post_id}:{to_user_telegram_id}:5"),
+        ],
+            [InlineKeyboardButton(text="⏭ Пропустить", callback_data=f"rate:skip:{post_id}:{to_user_telegram_id}")]
+    ])
+    return text, keyboard
+
+
+async def schedule_rating_request_async(
     from_user_telegram_id: int,
     to_user_telegram_id: int,
     to_user_name: str,
@@ -144,7 +420,8 @@ def schedule_rating_request(
 ):
     """
     Отправляет запрос на оценку поездки.
-    Вызывается через 2 часа после совпадения.
+    Новые запросы планируются в rating_requests (services/rating_requests.py),
+    задача выполняет только поставленные ранее с countdown.
     
     Args:
         from_user_telegram_id: Кто оценивает
@@ -154,91 +431,71 @@ def schedule_rating_request(
         from_place: Откуда
         to_place: Куда
     """
-    async def send():
-        bot = Bot(token=BOT_TOKEN)
+    bot = runtime.get_bot()
+    
+    try:
+        # Проверяем, не поставлена ли уже оценка
+        from sqlalchemy import select
+        from database.models import User, Rating
         
-        try:
-            # Проверяем, не поставлена ли уже оценка
-            from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-            from sqlalchemy import select
-            from database.models import User, Rating
+        async with runtime.session_maker()() as session:
+            # Получаем пользователей по telegram_id
+            from_user_query = select(User).where(User.telegram_id == from_user_telegram_id)
+            from_user_result = await session.execute(from_user_query)
+            from_user = from_user_result.scalar_one_or_none()
             
-            task_engine = create_async_engine(DATABASE_URL, echo=False)
-            task_session_maker = async_sessionmaker(task_engine, class_=AsyncSession, expire_on_commit=False)
-            
-            async with task_session_maker() as session:
-                # Получаем пользователей по telegram_id
-                from_user_query = select(User).where(User.telegram_id == from_user_telegram_id)
-                from_user_result = await session.execute(from_user_query)
-                from_user = from_user_result.scalar_one_or_none()
-                
-                to_user_query = select(User).where(User.telegram_id == to_user_telegram_id)
-                to_user_result = await session.execute(to_user_query)
-                to_user = to_user_result.scalar_one_or_none()
-                
-                if not from_user or not to_user:
-                    logger.warning(f"Пользователи не найдены для запроса на рейтинг: from={from_user_telegram_id}, to={to_user_telegram_id}")
-                    return
-                
-                # Проверяем, не поставлена ли уже оценка
-                existing_rating_query = select(Rating).where(
-                    Rating.from_user_id == from_user.id,
-                    Rating.to_user_id == to_user.id,
-                    Rating.post_id == post_id
-                )
-                existing_rating_result = await session.execute(existing_rating_query)
-                existing_rating = existing_rating_result.scalar_one_or_none()
-                
-                if existing_rating:
-                    logger.info(f"Оценка уже поставлена пользователем {from_user_telegram_id} для поста {post_id}, пропускаем запрос")
-                    return
-                
-                # Отправляем запрос на оценку
-            text = (
-                f"⭐ <b>Оцените поездку</b>\n\n"
-                f"Как прошла поездка с {to_user_name}?\n"
-                f"📍 Маршрут: {from_place} → {to_place}\n"
-            )
+            to_user_query = select(User).where(User.telegram_id == to_user_telegram_id)
+            to_user_result = await session.execute(to_user_query)
+            to_user = to_user_result.scalar_one_or_none()
             
-            # Кнопки оценки
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [
-                    InlineKeyboardButton(text="⭐ 1", callback_data=f"rate:{post_id}:{to_user_telegram_id}:1"),
-                    InlineKeyboardButton(text="⭐ 2", callback_data=f"rate:{post_id}:{to_user_telegram_id}:2"),
-                    InlineKeyboardButton(text="⭐ 3", callback_data=f"rate:{post_id}:{to_user_telegram_id}:3"),
-                    InlineKeyboardButton(text="⭐ 4", callback_data=f"rate:{post_id}:{to_user_telegram_id}:4"),
-                    InlineKeyboardButton(text="⭐ 5", callback_data=f"rate:{post_id}:{to_user_telegram_id}:5"),
-                ],
-                    [InlineKeyboardButton(text="⏭ Пропустить", callback_data=f"rate:skip:{post_id}:{to_user_telegram_id}")]
-            ])
+            if not from_user or not to_user:
+                logger.warning(f"Пользователи не найдены для запроса на рейтинг: from={from_user_telegram_id}, to={to_user_telegram_id}")
+                return
             
-            await bot.send_message(
-                chat_id=from_user_telegram_id,
-                text=text,
-                parse_mode="HTML",
-                reply_markup=keyboard
+            # Проверяем, не поставлена ли уже оценка
+            existing_rating_query = select(Rating).where(
+                Rating.from_user_id == from_user.id,
+                Rating.to_user_id == to_user.id,
+                Rating.post_id == post_id
             )
+            existing_rating_result = await session.execute(existing_rating_query)
+            existing_rating = existing_rating_result.scalar_one_or_none()
             
-            logger.info(f"Запрос на рейтинг отправлен пользователю {from_user_telegram_id} для поста {post_id}")
-            
-            await task_engine.dispose()
+            if existing_rating:
+                logger.info(f"Оценка уже поставлена пользователем {from_user_telegram_id} для поста {post_id}, пропускаем запрос")
+                return
             
-        except Exception as e:
-            logger.error(f"Ошибка отправки запроса на рейтинг: {e}")
-            raise
-        finally:
-            await bot.session.close()
-    
+            # Отправляем запрос на оценку
+        text, keyboard = render_rating_request(to_user_telegram_id, to_user_name, post_id, from_place, to_place)
+        
+        await bot.send_message(
+            chat_id=from_user_telegram_id,
+            text=text,
+            parse_mode="HTML",
+            reply_markup=keyboard
+        )
+        
+        logger.info(f"Запрос на рейтинг отправлен пользователю {from_user_telegram_id} для поста {post_id}")
+        
+    except Exception as e:
+        logger.error(f"Ошибка отправки запроса на рейтинг: {e}")
+        raise
+
+
+@celery.task(bind=True, max_retries=3, default_retry_delay=60, queue=QUEUE_RATING, name="tasks.notifications.schedule_rating_request")
+def schedule_rating_request_task(self, *args, **kwargs):
+    """Celery задача schedule_rating_request_async"""
     try:
-        asyncio.run(send())
+        runtime.run(schedule_rating_request_async(*args, **kwargs))
     except Exception as exc:
         logger.error(f"Rating request task failed: {exc}")
-        raise self.retry(exc=exc)
+        retry_or_dead_letter(self, exc)
 
 
-@celery.task(bind=True, max_retries=3)
-def send_expiration_notification(
-    self,
+schedule_rating_request = QueueTask(schedule_rating_request_task, schedule_rating_request_async)
+
+
+async def send_expiration_notification_async(
     user_telegram_id: int,
     post_data: Dict[str, Any]
 ):
@@ -249,42 +506,125 @@ def send_expiration_notification(
         user_telegram_id: Telegram ID автора
         post_data: Данные объявления
     """
-    async def send():
-        bot = Bot(token=BOT_TOKEN)
+    bot = runtime.get_bot()
+    
+    try:
+        text = (
+            f"⏰ <b>Ваше объявление истекло</b>\n\n"
+            f"📍 {post_data['from_place']} → {post_data['to_place']}\n\n"
+            f"Хотите создать новое?"
+        )
         
-        try:
-            text = (
-                f"⏰ <b>Ваше объявление истекло</b>\n\n"
-                f"📍 {post_data['from_place']} → {post_data['to_place']}\n\n"
-                f"Хотите создать новое?"
-            )
-            
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(
-                    text="🔄 Создать такое же",
-                    callback_data=f"recreate:{post_data['id']}"
-                )],
-                [InlineKeyboardButton(
-                    text="📝 Новое объявление",
-                    callback_data="create_post"
-                )],
-                [InlineKeyboardButton(
-                    text="🏠 В меню",
-                    callback_data="main_menu"
-                )]
-            ])
-            
-            await bot.send_message(
-                chat_id=user_telegram_id,
-                text=text,
-                parse_mode="HTML",
-                reply_markup=keyboard
-            )
-            
-        except Exception as e:
-            logger.error(f"Ошибка отправки уведомления об истечении: {e}")
-        finally:
-            await bot.session.close()
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(
+                text="🔄 Создать такое же",
+                callback_data=f"recreate:{post_data['id']}"
+            )],
+            [InlineKeyboardButton(
+                text="📝 Новое объявление",
+                callback_data="create_post"
+            )],
+            [InlineKeyboardButton(
+                text="🏠 В меню",
+                callback_data="main_menu"
+            )]
+        ])
+        
+        await bot.send_message(
+            chat_id=user_telegram_id,
+            text=text,
+            parse_mode="HTML",
+            reply_markup=keyboard
+        )
+        
+    except Exception as e:
+        logger.error(f"Ошибка отправки уведомления об истечении: {e}")
+
+
+@celery.task(bind=True, max_retries=3, queue=QUEUE_EXPIRATION, name="tasks.notifications.send_expiration_notification")
+def send_expiration_notification_task(self, *args, **kwargs):
+    """Celery задача send_expiration_notification_async"""
+    runtime.run(send_expiration_notification_async(*args, **kwargs))
+
+
+send_expiration_notification = QueueTask(send_expiration_notification_task, send_expiration_notification_async)
+
+
+# Максимум сообщений в одном запросе deleteMessages
+DELETE_MESSAGES_LIMIT = 100
+
+
+async def delete_notification_messages_async(
+    messages: List[List[int]],
+    job_id: str = None
+):
+    """
+    Удаляет сообщения уведомлений из чатов получателей (после удаления записей лога
+    в services/notifications_cleaner.py). Сообщения одного чата удаляются по
+    DELETE_MESSAGES_LIMIT за запрос, одновременно не больше NOTIFY_CLEANUP_CONCURRENCY
+    запросов; лимиты Telegram соблюдает rate limiter бота (фоновая полоса).
+    Прогресс пишется в notify:cleanup:{job_id} по мере удаления.
+    
+    Args:
+        messages: Сообщения [chat_id, message_id]
+        job_id: ID очистки (schedule_messages_cleanup)
+    """
+    from services.notifications_cleaner import PROGRESS_KEY
+    
+    bot = runtime.get_bot()
+    
+    message_ids_by_chat = defaultdict(list)
+    for chat_id, message_id in messages:
+        message_ids_by_chat[chat_id].append(message_id)
+    chunks = [
+        (chat_id, message_ids[start:start + DELETE_MESSAGES_LIMIT])
+        for chat_id, message_ids in message_ids_by_chat.items()
+        for start in range(0, len(message_ids), DELETE_MESSAGES_LIMIT)
+    ]
+    
+    semaphore = asyncio.Semaphore(NOTIFY_CLEANUP_CONCURRENCY)
+    totals = {"deleted": 0, "failed": 0}
+    
+    async def report(field: str, count: int):
+        totals[field] += count
+        metrics.inc(f"notify_cleanup.{field}", count)
+        if job_id:
+            try:
+                await get_redis().hincrby(PROGRESS_KEY.format(job_id=job_id), field, count)
+            except Exception as e:
+                logger.debug(f"Не удалось обновить прогресс очистки {job_id}: {e}")
     
-    asyncio.run(send())
+    async def delete_chunk(chat_id: int, message_ids: List[int]):
+        async with semaphore:
+            for _ in range(2):
+                try:
+                    # Уже удалённые пользователем сообщения Telegram пропускает
+                    await bot.delete_messages(chat_id=chat_id, message_ids=message_ids)
+                    await report("deleted", len(message_ids))
+                    return
+                except TelegramRetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                except Exception as e:
+                    logger.warning(f"⚠️ Не удалось удалить {len(message_ids)} сообщений у пользователя {chat_id}: {e}")
+                    break
+            await report("failed", len(message_ids))
+    
+    await asyncio.gather(*(delete_chunk(chat_id, message_ids) for chat_id, message_ids in chunks))
+    
+    logger.info(
+        f"✅ Очистка {job_id}: удалено {totals['deleted']} сообщений уведомлений "
+        f"в {len(message_ids_by_chat)} чатах, не удалось {totals['failed']}"
+    )
+
+
+@celery.task(bind=True, max_retries=3, default_retry_delay=60, queue=QUEUE_BULK, name="tasks.notifications.delete_notification_messages")
+def delete_notification_messages_task(self, *args, **kwargs):
+    """Celery задача delete_notification_messages_async"""
+    try:
+        runtime.run(delete_notification_messages_async(*args, **kwargs))
+    except Exception as exc:
+        logger.error(f"Cleanup task failed: {exc}")
+        retry_or_dead_letter(self, exc)
+
 
+delete_notification_messages = QueueTask(delete_notification_messages_task, delete_notification_messages_async)
@@ -0,0 +1,136 @@
+# tasks/queue.py - Очередь задач уведомлений: Celery или Redis Streams
+# Одни и те же вызовы .delay() / .apply_async() для обоих бэкендов (NOTIFY_QUEUE_BACKEND)
+
+import json
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+
+from config import (
+    NOTIFY_QUEUE_BACKEND,
+    NOTIFY_QUEUE_STREAM,
+    NOTIFY_QUEUE_DELAYED
+)
+from utils import metrics
+from utils.redis_client import get_sync_redis
+
+logger = logging.getLogger(__name__)
+
+# Задачи, которые умеет выполнять потребитель стрима (workers/notify_queue.py)
+REGISTRY: Dict[str, "QueueTask"] = {}
+
+
+class RetryWith(Exception):
+    """Задача выполнена частично - повторить с другими аргументами"""
+
+    def __init__(self, kwargs: Dict[str, Any], error: Optional[BaseException] = None):
+        """
+        Args:
+            kwargs: Аргументы повтора
+            error: Ошибка, по которой выбирается задержка повтора (tasks/delivery.py)
+        """
+        super().__init__(f"retry with {kwargs}")
+        self.kwargs = kwargs
+        self.error = error
+
+
+class QueueTask:
+    """
+    Задача уведомлений с выбором бэкенда очереди.
+
+    NOTIFY_QUEUE_BACKEND="celery" - вызовы передаются Celery задаче как есть.
+    NOTIFY_QUEUE_BACKEND="stream" - задача попадает в Redis Stream
+    (или в отложенные, если задан countdown) и выполняется потребителем
+    notifier.py; число повторов берётся из Celery задачи, задержка - по классу
+    ошибки (tasks/delivery.py).
+    """
+
+    def __init__(self, celery_task, body: Callable[..., Awaitable[Any]]):
+        """
+        Args:
+            celery_task: Celery задача (обёртка над body)
+            body: Асинхронное тело задачи
+        """
+        self.celery_task = celery_task
+        self.body = body
+        self.name = celery_task.name
+        self.max_retries = celery_task.max_retries
+        # Класс трафика (очередь Celery) из @celery.task(queue=...)
+        self.queue = celery_task.queue
+        REGISTRY[self.name] = self
+
+    def delay(self, *args, **kwargs):
+        return self.apply_async(args=args, kwargs=kwargs)
+
+    def apply_async(
+        self,
+        args: Optional[Sequence[Any]] = None,
+        kwargs: Optional[Dict[str, Any]] = None,
+        countdown: Optional[float] = None,
+        queue: Optional[str] = None,
+        **options
+    ):
+        """
+        Ставит задачу в очередь.
+
+        Args:
+            args / kwargs: Аргументы задачи
+            countdown: Через сколько секунд выполнить
+            queue: Класс трафика, если отличается от класса задачи
+        """
+        queue = queue or self.queue
+        if NOTIFY_QUEUE_BACKEND == "stream":
+            return enqueue(self.name, args, kwargs, countdown, queue)
+        return self.celery_task.apply_async(args=args, kwargs=kwargs, countdown=countdown, queue=queue, **options)
+
+
+def build_message(
+    name: str,
+    args: Optional[Sequence[Any]] = None,
+    kwargs: Optional[Dict[str, Any]] = None,
+    attempt: int = 0,
+    queue: Optional[str] = None
+) -> str:
+    """Сериализует вызов задачи (id делает отложенные записи уникальными)"""
+    return json.dumps({
+        "id": uuid.uuid4().hex,
+        "task": name,
+        "args": list(args or ()),
+        "kwargs": dict(kwargs or {}),
+        "attempt": attempt,
+        "queue": queue
+    }, ensure_ascii=False)
+
+
+def enqueue(
+    name: str,
+    args: Optional[Sequence[Any]] = None,
+    kwargs: Optional[Dict[str, Any]] = None,
+    countdown: Optional[float] = None,
+    queue: Optional[str] = None
+) -> str:
+    """
+    Ставит задачу в стрим уведомлений.
+
+    Args:
+        name: Имя задачи (как у Celery)
+        args / kwargs: Аргументы задачи
+        countdown: Через сколько секунд выполнить
+        queue: Класс трафика (для метрик ожидания)
+
+    Returns:
+        ID записи в стриме или сообщение отложенной задачи
+    """
+    message = build_message(name, args, kwargs, queue=queue)
+    # Синхронный клиент: .delay() синхронный, как и у Celery
+    client = get_sync_redis()
+
+    if countdown:
+        client.zadd(NOTIFY_QUEUE_DELAYED, {message: (time.time() + countdown) * 1000})
+        metrics.inc("notify_queue.enqueued_delayed")
+        return message
+
+    entry_id = client.xadd(NOTIFY_QUEUE_STREAM, {"message": message})
+    metrics.inc("notify_queue.enqueued")
+    return entry_id
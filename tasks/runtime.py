@@ -0,0 +1,168 @@
+# tasks/runtime.py - Постоянное окружение процесса Celery воркера
+# Один event loop, один Bot (с пулом HTTP соединений) и один engine БД на процесс
+
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Optional, TypeVar
+
+from aiogram import Bot
+from celery.signals import worker_process_init, worker_process_shutdown
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+from config import BOT_TOKEN, DATABASE_URL
+from services.notification_log import NotificationLogBuffer
+from utils.rate_limiter import TelegramRateLimiter, BULK
+from utils.redis_client import close_redis
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_bot: Optional[Bot] = None
+_engine: Optional[AsyncEngine] = None
+_session_maker: Optional[async_sessionmaker] = None
+_notification_log: Optional[NotificationLogBuffer] = None
+
+_init_lock = threading.Lock()
+
+
+def _create_resources() -> None:
+    global _bot, _engine, _session_maker, _notification_log
+
+    # HTTP сессия бота создаётся при первом запросе и дальше переиспользуется
+    _bot = Bot(token=BOT_TOKEN)
+    # Рассылки уступают глобальный лимит ответам пользователям в боте
+    _bot.session.middleware(TelegramRateLimiter(default_lane=BULK))
+
+    # asyncpg соединения привязаны к loop, поэтому engine живёт вместе с ним
+    _engine = create_async_engine(
+        DATABASE_URL,
+        echo=False,
+        pool_size=5,
+        max_overflow=5,
+        pool_pre_ping=True
+    )
+    _session_maker = async_sessionmaker(_engine, class_=AsyncSession, expire_on_commit=False)
+    _notification_log = NotificationLogBuffer(_session_maker)
+
+
+def _reset() -> None:
+    global _loop, _thread, _bot, _engine, _session_maker, _notification_log
+    _loop, _thread, _bot, _engine, _session_maker, _notification_log = None, None, None, None, None, None
+
+
+def init() -> None:
+    """
+    Создаёт event loop (в отдельном потоке), Bot и engine процесса.
+    Вызывается по сигналу worker_process_init; при пуле solo/threads
+    сигнал не приходит, поэтому run() инициализирует окружение лениво.
+
+    Loop крутится в своём потоке постоянно, а не только во время задачи:
+    так фоновые задачи (сброс буфера notifications_log по таймеру)
+    выполняются и между задачами Celery.
+    """
+    global _loop, _thread
+
+    with _init_lock:
+        if _loop is not None:
+            return
+
+        _loop = asyncio.new_event_loop()
+        _thread = threading.Thread(
+            target=_loop.run_forever,
+            name="notifications-runtime",
+            daemon=True
+        )
+        _thread.start()
+        _create_resources()
+
+    logger.info("✅ Окружение воркера уведомлений инициализировано")
+
+
+async def _close_resources() -> None:
+    # Буфер пишет через engine - сбрасываем его первым
+    await _notification_log.close()
+    await _bot.session.close()
+    await _engine.dispose()
+    await close_redis()
+
+
+def shutdown() -> None:
+    """Сбрасывает буфер notifications_log, закрывает HTTP сессию бота, пулы БД и Redis и event loop"""
+    with _init_lock:
+        if _loop is None:
+            return
+
+        try:
+            asyncio.run_coroutine_threadsafe(_close_resources(), _loop).result()
+        except Exception as e:
+            logger.error(f"❌ Ошибка закрытия окружения воркера: {e}")
+        finally:
+            _loop.call_soon_threadsafe(_loop.stop)
+            _thread.join()
+            _loop.close()
+            _reset()
+            logger.info("Окружение воркера уведомлений закрыто")
+
+
+def attach() -> None:
+    """
+    Создаёт Bot и engine для уже работающего event loop
+    (потребитель стрима уведомлений, notifier.py). run() в этом режиме не нужен.
+    """
+    _create_resources()
+    logger.info("✅ Окружение уведомлений подключено к текущему event loop")
+
+
+async def detach() -> None:
+    """Закрывает окружение, созданное attach()"""
+    if _bot is None:
+        return
+    try:
+        await _close_resources()
+    finally:
+        _reset()
+        logger.info("Окружение уведомлений закрыто")
+
+
+def get_bot() -> Bot:
+    """Bot процесса (внутри run() или после attach())"""
+    return _bot
+
+
+def session_maker() -> async_sessionmaker:
+    """Фабрика сессий БД процесса (внутри run() или после attach())"""
+    return _session_maker
+
+
+def notification_log() -> NotificationLogBuffer:
+    """Буфер записи notifications_log процесса (внутри run() или после attach())"""
+    return _notification_log
+
+
+def run(coro: Awaitable[T]) -> T:
+    """
+    Выполняет корутину задачи в постоянном event loop процесса
+    и блокирует вызывающий поток до её завершения.
+
+    Args:
+        coro: Корутина задачи
+
+    Returns:
+        Результат корутины
+    """
+    init()
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result()
+
+
+@worker_process_init.connect
+def _on_worker_process_init(**kwargs) -> None:
+    init()
+
+
+@worker_process_shutdown.connect
+def _on_worker_process_shutdown(**kwargs) -> None:
+    shutdown()
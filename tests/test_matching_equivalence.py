@@ -0,0 +1,195 @@
+# tests/test_matching_equivalence.py - SQL и in-memory матчинг возвращают одни и те же ID
+# SQL-часть выполняется на PostgreSQL из TEST_DATABASE_URL (без него пропускается)
+
+import asyncio
+import os
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+os.environ.setdefault("BOT_TOKEN", "1:test")
+
+from database.models import Post
+from services import matching
+from services.match_index import SubscriptionIndex, ActivePostIndex
+
+ROLES = ("driver", "passenger")
+VOCABULARY = ["ош", "базар", "дордой", "аламедин", "центр", "вокзал", "мадина", "джал"]
+KEY_IDS = {key: i for i, key in enumerate(VOCABULARY, start=1)}
+
+USERS = 20
+SUBSCRIPTIONS = 300
+POSTS = 300
+PROBES = 200
+
+ID_OFFSET = 100_000_000  # Не пересекаемся с данными в тестовой БД
+
+
+def random_keys(rnd: random.Random) -> list:
+    # Пустые наборы ключей возможны (show_post_confirmation их не проверяет)
+    return rnd.sample(VOCABULARY, rnd.randint(0, 3))
+
+
+def key_ids(row_id: int, keys: list):
+    # Часть строк без ID ключей - как до add_route_key_ids.py
+    return None if row_id % 5 == 0 else [KEY_IDS[key] for key in keys]
+
+
+def make_corpus(seed: int) -> dict:
+    rnd = random.Random(seed)
+    subscriptions = [
+        (ID_OFFSET + i, ID_OFFSET + rnd.randint(1, USERS), random_keys(rnd), random_keys(rnd))
+        for i in range(1, SUBSCRIPTIONS + 1)
+    ]
+    posts = [
+        (ID_OFFSET + i, ID_OFFSET + rnd.randint(1, USERS), rnd.choice(ROLES), random_keys(rnd), random_keys(rnd))
+        for i in range(1, POSTS + 1)
+    ]
+    probes = [
+        Post(
+            id=ID_OFFSET + POSTS + i,
+            author_id=ID_OFFSET + rnd.randint(1, USERS),
+            role=rnd.choice(ROLES),
+            keys_from=random_keys(rnd),
+            keys_to=random_keys(rnd)
+        )
+        for i in range(1, PROBES + 1)
+    ]
+    return {"subscriptions": subscriptions, "posts": posts, "probes": probes}
+
+
+def with_key_ids(post: Post) -> Post:
+    return Post(
+        id=post.id,
+        author_id=post.author_id,
+        role=post.role,
+        keys_from=post.keys_from,
+        keys_to=post.keys_to,
+        key_ids_from=[KEY_IDS[key] for key in post.keys_from],
+        key_ids_to=[KEY_IDS[key] for key in post.keys_to]
+    )
+
+
+def memory_results(corpus: dict) -> tuple:
+    """ID совпадений in-memory индексов: (подписки, объявления) по каждому запросу"""
+    subscriptions = SubscriptionIndex()
+    subscriptions.load_rows(corpus["subscriptions"])
+
+    expires_at = datetime.utcnow() + timedelta(hours=1)
+    posts = ActivePostIndex()
+    posts.load_rows(
+        (post_id, author_id, role, "a", "b", None, None, 100, keys_from, keys_to, expires_at)
+        for post_id, author_id, role, keys_from, keys_to in corpus["posts"]
+    )
+
+    subscription_ids, post_ids = [], []
+    for probe in corpus["probes"]:
+        opposite_role = "passenger" if probe.role == "driver" else "driver"
+        subscription_ids.append([
+            sub_id for sub_id, _ in subscriptions.match(probe.keys_from, probe.keys_to, exclude_user_id=probe.author_id)
+        ])
+        post_ids.append([
+            entry.id for entry in posts.match(opposite_role, probe.keys_from, probe.keys_to, exclude_author_id=probe.author_id)
+        ])
+    return subscription_ids, post_ids
+
+
+def reference_results(corpus: dict) -> tuple:
+    """ID совпадений по определению правила (перебор, как исходный Python-матчинг)"""
+    subscription_ids, post_ids = [], []
+    for probe in corpus["probes"]:
+        probe_from, probe_to = set(probe.keys_from), set(probe.keys_to)
+        opposite_role = "passenger" if probe.role == "driver" else "driver"
+        subscription_ids.append([
+            sub_id for sub_id, user_id, keys_from, keys_to in corpus["subscriptions"]
+            if user_id != probe.author_id and set(keys_from) <= probe_from and set(keys_to) <= probe_to
+        ])
+        post_ids.append([
+            post_id for post_id, author_id, role, keys_from, keys_to in corpus["posts"]
+            if role == opposite_role and author_id != probe.author_id and (
+                (set(keys_from) <= probe_from and set(keys_to) <= probe_to) or
+                (probe_from <= set(keys_from) and probe_to <= set(keys_to))
+            )
+        ])
+    return subscription_ids, post_ids
+
+
+async def sql_results(database_url: str, corpus: dict) -> list:
+    """
+    ID совпадений SQL-матчинга: по TEXT[] ключам и по ID ключей (intarray).
+    Данные корпуса вставляются в одной транзакции и откатываются в конце.
+    """
+    from sqlalchemy import insert, text
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from database.models import Base, User, Subscription
+
+    engine = create_async_engine(database_url, echo=False)
+    try:
+        async with engine.connect() as conn:
+            transaction = await conn.begin()
+            try:
+                await conn.execute(text("CREATE EXTENSION IF NOT EXISTS intarray"))
+                await conn.run_sync(Base.metadata.create_all)
+
+                await conn.execute(insert(User), [
+                    {"id": ID_OFFSET + i, "telegram_id": ID_OFFSET + i, "role": ROLES[i % 2], "phone": f"+996{i:09d}"}
+                    for i in range(1, USERS + 1)
+                ])
+                await conn.execute(insert(Subscription), [
+                    {"id": sub_id, "user_id": user_id, "keys_from": keys_from, "keys_to": keys_to,
+                     "key_ids_from": key_ids(sub_id, keys_from), "key_ids_to": key_ids(sub_id, keys_to)}
+                    for sub_id, user_id, keys_from, keys_to in corpus["subscriptions"]
+                ])
+                expires_at = datetime.utcnow() + timedelta(hours=1)
+                await conn.execute(insert(Post), [
+                    {"id": post_id, "author_id": author_id, "role": role, "from_place": "a", "to_place": "b",
+                     "keys_from": keys_from, "keys_to": keys_to,
+                     "key_ids_from": key_ids(post_id, keys_from), "key_ids_to": key_ids(post_id, keys_to),
+                     "price": 100, "status": "active", "expires_at": expires_at}
+                    for post_id, author_id, role, keys_from, keys_to in corpus["posts"]
+                ])
+
+                session = AsyncSession(bind=conn)
+                results = []
+                for make_probe in (lambda probe: probe, with_key_ids):
+                    subscription_ids, post_ids = [], []
+                    for probe in map(make_probe, corpus["probes"]):
+                        opposite_role = "passenger" if probe.role == "driver" else "driver"
+                        # Строки вне корпуса (данные тестовой БД) не сравниваются
+                        matches = await matching._find_matching_subscriptions_sql(session, probe)
+                        subscription_ids.append([sub_id for sub_id, _ in matches if sub_id > ID_OFFSET])
+                        posts = await matching._find_matching_posts_sql(session, probe, opposite_role)
+                        post_ids.append([post.id for post in posts if post.id > ID_OFFSET])
+                        session.expunge_all()
+                    results.append((subscription_ids, post_ids))
+                await session.close()
+                return results
+            finally:
+                await transaction.rollback()
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_memory_matches_reference(seed):
+    corpus = make_corpus(seed)
+    assert memory_results(corpus) == reference_results(corpus)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_sql_matches_memory(seed):
+    database_url = os.getenv("TEST_DATABASE_URL")
+    if not database_url:
+        pytest.skip("TEST_DATABASE_URL не задан - SQL-матчинг не проверяется")
+
+    corpus = make_corpus(seed)
+    expected = memory_results(corpus)
+    try:
+        results = asyncio.run(sql_results(database_url, corpus))
+    except OSError as e:
+        pytest.skip(f"PostgreSQL недоступен: {e}")
+
+    text_results, key_id_results = results
+    assert text_results == expected
+    assert key_id_results == expected
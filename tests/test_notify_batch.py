@@ -0,0 +1,140 @@
+# tests/test_notify_batch.py - Пакетная рассылка уведомлений о совпадении
+# send_match_notifications_batch_async с заглушками бота, журнала, сводки и БД
+
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("BOT_TOKEN", "1:test")
+
+from tasks import notifications
+
+POST_ID = 7
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, parse_mode=None, reply_markup=None):
+        self.sent.append(chat_id)
+        return SimpleNamespace(message_id=1000 + len(self.sent))
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar_one_or_none(self):
+        return self.value
+
+    def scalars(self):
+        return list(self.value)
+
+
+class FakeSession:
+    """Первый запрос - статус объявления, второй - получатели"""
+
+    def __init__(self, users):
+        self.results = [FakeResult("active"), FakeResult(users)]
+
+    async def execute(self, statement):
+        return self.results.pop(0)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeLog:
+    def __init__(self):
+        self.rows = []
+
+    def add(self, **row):
+        self.rows.append(row)
+
+
+def make_user(user_id, digest_threshold=None, digest_window_sec=None):
+    return SimpleNamespace(
+        id=user_id,
+        telegram_id=100 + user_id,
+        digest_threshold=digest_threshold,
+        digest_window_sec=digest_window_sec
+    )
+
+
+@pytest.fixture
+def env(monkeypatch):
+    state = SimpleNamespace(bot=FakeBot(), log=FakeLog(), released=[], admitted=[], deferred=[], users=[])
+
+    async def claim(post_id, recipient_ids):
+        return list(recipient_ids)
+
+    async def release(post_id, recipient_ids):
+        state.released.extend(recipient_ids)
+
+    # Та же сигнатура, что у digest.admit: вызов с другими именами упадёт так же
+    async def admit(user_id, threshold, window):
+        state.admitted.append((user_id, threshold, window))
+        return threshold != 1
+
+    async def defer_to_digest(recipient_telegram_id, recipient_db_id, post_data, author_data):
+        state.deferred.append(recipient_db_id)
+
+    async def get_or_render(session, post_id):
+        return {
+            "post": {"id": post_id, "role": "passenger"},
+            "author": {},
+            "text": "match",
+            "keyboard": None
+        }
+
+    monkeypatch.setattr(notifications.notify_ledger, "claim", claim)
+    monkeypatch.setattr(notifications.notify_ledger, "release", release)
+    monkeypatch.setattr(notifications.digest, "admit", admit)
+    monkeypatch.setattr(notifications, "defer_to_digest", defer_to_digest)
+    monkeypatch.setattr(notifications.render_cache, "get_or_render", get_or_render)
+    monkeypatch.setattr(notifications.runtime, "get_bot", lambda: state.bot)
+    monkeypatch.setattr(notifications.runtime, "session_maker", lambda: lambda: FakeSession(state.users))
+    monkeypatch.setattr(notifications.runtime, "notification_log", lambda: state.log)
+    monkeypatch.setattr(notifications, "NOTIFY_BATCH_RATE", 1000)
+    return state
+
+
+def test_batch_sends_and_defers_to_digest(env):
+    env.users = [make_user(1), make_user(2, digest_threshold=1, digest_window_sec=120), make_user(3, digest_threshold=0)]
+
+    asyncio.run(notifications.send_match_notifications_batch_async(POST_ID, [1, 2, 3]))
+
+    assert env.admitted == [
+        (1, notifications.digest.DIGEST_THRESHOLD, notifications.digest.DIGEST_WINDOW_SEC),
+        (2, 1, 120),
+        (3, 0, notifications.digest.DIGEST_WINDOW_SEC)
+    ]
+    assert env.deferred == [2]
+    assert sorted(env.bot.sent) == [101, 103]
+    assert sorted(row["recipient_id"] for row in env.log.rows) == [1, 3]
+    assert env.released == []
+
+
+def test_batch_releases_claims_when_digest_fails(env, monkeypatch):
+    env.users = [make_user(1, digest_threshold=1), make_user(2, digest_threshold=1), make_user(3)]
+
+    async def defer_to_digest(recipient_telegram_id, recipient_db_id, post_data, author_data):
+        if recipient_db_id == 2:
+            raise ConnectionError("redis down")
+        env.deferred.append(recipient_db_id)
+
+    monkeypatch.setattr(notifications, "defer_to_digest", defer_to_digest)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(notifications.send_match_notifications_batch_async(POST_ID, [1, 2, 3]))
+
+    # Отложенный в сводку получатель остаётся занятым, остальные освобождены
+    assert env.deferred == [1]
+    assert sorted(env.released) == [2, 3]
+    assert env.bot.sent == []
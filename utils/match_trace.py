@@ -0,0 +1,128 @@
+# utils/match_trace.py - Выборочная трассировка матчинга
+# Почему кандидат совпал или не совпал - для 1 из N объявлений, в кольцевом буфере
+
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Set, Tuple
+
+from config import MATCH_TRACE_SAMPLE, MATCH_TRACE_CAPACITY, MATCH_TRACE_MAX_CANDIDATES
+
+# Трассировка выключена - вызывающий код проверяет ENABLED до любых вычислений,
+# поэтому в рабочем режиме стоимость сводится к одной проверке флага
+ENABLED = MATCH_TRACE_SAMPLE > 0
+
+# Коды причин
+MATCHED = "ok"
+OWN = "own"  # Подписка/объявление самого автора
+MISSING_FROM = "from"  # Не хватает ключей "откуда"
+MISSING_TO = "to"  # Не хватает ключей "куда"
+
+# Запись: (вид кандидата, ID кандидата, код причины, недостающие ключи)
+TraceEntry = Tuple[str, int, str, Tuple[str, ...]]
+
+_lock = threading.Lock()
+# post_id -> записи; самые старые трассы вытесняются при переполнении
+_traces: "OrderedDict[int, List[TraceEntry]]" = OrderedDict()
+# Объявления, которые админ попросил трассировать вне выборки
+_forced: Set[int] = set()
+
+
+def sampled(post_id: int) -> bool:
+    """Попадает ли объявление в выборку (1 из MATCH_TRACE_SAMPLE или принудительно)"""
+    return post_id % MATCH_TRACE_SAMPLE == 0 or post_id in _forced
+
+
+def force(post_id: int) -> None:
+    """Трассировать объявление при следующем матчинге независимо от выборки"""
+    with _lock:
+        _forced.add(post_id)
+
+
+def finish(post_id: int) -> None:
+    """
+    Матчинг объявления завершён (подписки и встречные объявления):
+    принудительная трассировка больше не нужна.
+    """
+    with _lock:
+        _forced.discard(post_id)
+
+
+def explain(
+    kind: str,
+    candidate_id: int,
+    owner_id: int,
+    exclude_id: Optional[int],
+    required_from: Iterable[str],
+    required_to: Iterable[str],
+    available_from: Iterable[str],
+    available_to: Iterable[str]
+) -> TraceEntry:
+    """
+    Формирует запись о кандидате: все ли required-ключи есть среди available.
+
+    Args:
+        kind: "sub" - подписка, "post" - встречное объявление
+        candidate_id: ID кандидата
+        owner_id: Владелец кандидата
+        exclude_id: Автор трассируемого объявления
+        required_from / required_to: Ключи, которые должны присутствовать
+        available_from / available_to: Ключи, среди которых их ищут
+
+    Returns:
+        Запись трассы
+    """
+    if owner_id == exclude_id:
+        return (kind, candidate_id, OWN, ())
+    missing_from = set(required_from) - set(available_from)
+    if missing_from:
+        return (kind, candidate_id, MISSING_FROM, tuple(sorted(missing_from)))
+    missing_to = set(required_to) - set(available_to)
+    if missing_to:
+        return (kind, candidate_id, MISSING_TO, tuple(sorted(missing_to)))
+    return (kind, candidate_id, MATCHED, ())
+
+
+def record(post_id: int, entries: Iterable[TraceEntry]) -> None:
+    """
+    Сохраняет записи трассы объявления (не больше MATCH_TRACE_MAX_CANDIDATES).
+
+    Args:
+        post_id: ID трассируемого объявления
+        entries: Записи по кандидатам
+    """
+    with _lock:
+        trace = _traces.pop(post_id, [])
+        for entry in entries:
+            if len(trace) >= MATCH_TRACE_MAX_CANDIDATES:
+                break
+            trace.append(entry)
+        _traces[post_id] = trace
+
+        while len(_traces) > MATCH_TRACE_CAPACITY:
+            _traces.popitem(last=False)
+
+
+def get(post_id: int) -> Optional[List[TraceEntry]]:
+    """Записи трассы объявления или None, если её нет в буфере"""
+    with _lock:
+        trace = _traces.get(post_id)
+        return list(trace) if trace is not None else None
+
+
+def dump(post_id: int) -> Optional[str]:
+    """
+    Текстовое представление трассы для админа.
+
+    Returns:
+        Строки вида "sub 12: from [ош]" или None, если трассы нет
+    """
+    trace = get(post_id)
+    if trace is None:
+        return None
+
+    matched = sum(1 for entry in trace if entry[2] == MATCHED)
+    lines = [f"Трасса объявления {post_id}: {len(trace)} кандидатов, совпало {matched}"]
+    for kind, candidate_id, reason, keys in trace:
+        details = f" [{', '.join(keys)}]" if keys else ""
+        lines.append(f"{kind} {candidate_id}: {reason}{details}")
+    return "\n".join(lines)
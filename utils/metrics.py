@@ -0,0 +1,83 @@
+# utils/metrics.py - Простые метрики внутри процесса
+# Счётчики, gauge и сводки (count/avg/p50/p99/max) без внешних зависимостей
+
+import threading
+from collections import deque
+from typing import Deque, Dict, Any
+
+# Сколько последних наблюдений хранить для оценки перцентилей
+SUMMARY_WINDOW = 1024
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+_summaries: Dict[str, "Summary"] = {}
+
+
+class Summary:
+    """Сводка наблюдений: количество, сумма, максимум и окно последних значений"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent: Deque[float] = deque(maxlen=SUMMARY_WINDOW)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.recent.append(value)
+
+    def to_dict(self) -> Dict[str, float]:
+        values = sorted(self.recent)
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "p50": _percentile(values, 0.50),
+            "p99": _percentile(values, 0.99),
+            "max": self.max
+        }
+
+
+def _percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def inc(name: str, value: float = 1) -> None:
+    """Увеличивает счётчик"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float) -> None:
+    """Устанавливает текущее значение gauge"""
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, value: float) -> None:
+    """Добавляет наблюдение в сводку"""
+    with _lock:
+        summary = _summaries.get(name)
+        if summary is None:
+            summary = _summaries[name] = Summary()
+        summary.observe(value)
+
+
+def snapshot() -> Dict[str, Any]:
+    """
+    Возвращает текущие значения всех метрик.
+
+    Returns:
+        {"counters": {...}, "gauges": {...}, "summaries": {name: {count, avg, p50, p99, max}}}
+    """
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "summaries": {name: summary.to_dict() for name, summary in _summaries.items()}
+        }
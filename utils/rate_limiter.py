@@ -0,0 +1,176 @@
+# utils/rate_limiter.py - Общий лимитер исходящих запросов к Telegram
+# Token bucket в Redis: глобальный, на чат и отдельный для канала; бот и Celery делят одни ведра
+
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from config import (
+    CHANNEL_ID,
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_GLOBAL_RATE, RATE_LIMIT_GLOBAL_BURST,
+    RATE_LIMIT_CHAT_RATE, RATE_LIMIT_CHAT_BURST,
+    RATE_LIMIT_CHANNEL_PER_MIN, RATE_LIMIT_CHANNEL_BURST,
+    RATE_LIMIT_INTERACTIVE_RESERVE
+)
+from utils import metrics
+from utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Полосы приоритета
+INTERACTIVE = "interactive"  # Ответы пользователю в хендлерах
+BULK = "bulk"  # Рассылки, правки канала воркерами
+
+# Лимитируются только методы, отправляющие/меняющие сообщения
+LIMITED_PREFIXES = ("send", "edit", "delete", "copy", "forward")
+# Лимит личного чата Telegram считает только новые сообщения; правки и удаления
+# (clean_chat удаляет по одному) тратят лишь глобальное ведро. Ведро канала - для всех
+CHAT_LIMITED_PREFIXES = ("send", "copy", "forward")
+
+# Атомарно списывает по токену из всех ведер или возвращает, сколько ждать (мс).
+# KEYS - ведра; ARGV - по тройке (токенов в секунду, ёмкость, резерв) на ведро.
+# Резерв - токены, которые не может тратить полоса bulk: они остаются
+# интерактивным ответам, даже когда рассылка выбрала весь глобальный лимит.
+TOKEN_BUCKET_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local wait = 0
+local tokens_left = {}
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[(i - 1) * 3 + 1])
+    local burst = tonumber(ARGV[(i - 1) * 3 + 2])
+    local reserve = tonumber(ARGV[(i - 1) * 3 + 3])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + (now - ts) * rate / 1000)
+    tokens_left[i] = tokens
+    if tokens < 1 + reserve then
+        wait = math.max(wait, math.ceil((1 + reserve - tokens) * 1000 / rate))
+    end
+end
+if wait > 0 then
+    return wait
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[(i - 1) * 3 + 1])
+    local burst = tonumber(ARGV[(i - 1) * 3 + 2])
+    redis.call('HSET', key, 'tokens', tokens_left[i] - 1, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(burst * 1000 / rate) + 1000)
+end
+return 0
+"""
+
+GLOBAL_KEY = "ratelimit:global"
+CHANNEL_KEY = "ratelimit:channel"
+CHAT_KEY = "ratelimit:chat:{chat_id}"
+
+# Полоса текущей задачи (если не задана - полоса лимитера по умолчанию)
+_lane: ContextVar[Optional[str]] = ContextVar("rate_limit_lane", default=None)
+
+# Как часто предупреждать о недоступном Redis (секунды)
+FAIL_OPEN_LOG_INTERVAL = 60
+
+
+@contextmanager
+def lane(name: str):
+    """
+    Выполняет запросы к Telegram внутри блока в полосе name.
+
+    Args:
+        name: INTERACTIVE или BULK
+    """
+    token = _lane.set(name)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+class TelegramRateLimiter(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: перед каждым send/edit/delete ждёт токены
+    в глобальном ведре, а перед отправкой новых сообщений - и в ведре чата
+    (для канала - в более строгом ведре канала).
+    Если Redis недоступен, запросы пропускаются без ожидания.
+    """
+
+    def __init__(self, default_lane: str = INTERACTIVE):
+        """
+        Args:
+            default_lane: Полоса для запросов вне lane() -
+                INTERACTIVE в процессе бота, BULK в Celery воркерах
+        """
+        self.default_lane = default_lane
+        self._script = None
+        self._fail_open_logged_at = 0.0
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        if RATE_LIMIT_ENABLED and method.__api_method__.startswith(LIMITED_PREFIXES):
+            chat_id = getattr(method, "chat_id", None)
+            is_channel = CHANNEL_ID and str(chat_id) == str(CHANNEL_ID)
+            if not is_channel and not method.__api_method__.startswith(CHAT_LIMITED_PREFIXES):
+                chat_id = None
+            await self.acquire(chat_id, _lane.get() or self.default_lane)
+        return await make_request(bot, method)
+
+    def _buckets(self, chat_id, request_lane: str):
+        """Ведра запроса: (ключи, аргументы скрипта)"""
+        reserve = RATE_LIMIT_INTERACTIVE_RESERVE if request_lane == BULK else 0
+        keys: List[str] = [GLOBAL_KEY]
+        args: List[float] = [RATE_LIMIT_GLOBAL_RATE, RATE_LIMIT_GLOBAL_BURST, reserve]
+
+        if chat_id is not None:
+            if CHANNEL_ID and str(chat_id) == str(CHANNEL_ID):
+                keys.append(CHANNEL_KEY)
+                args.extend([RATE_LIMIT_CHANNEL_PER_MIN / 60, RATE_LIMIT_CHANNEL_BURST, 0])
+            else:
+                keys.append(CHAT_KEY.format(chat_id=chat_id))
+                args.extend([RATE_LIMIT_CHAT_RATE, RATE_LIMIT_CHAT_BURST, 0])
+        return keys, args
+
+    async def acquire(self, chat_id, request_lane: str) -> None:
+        """
+        Ждёт, пока во всех ведрах запроса появится токен, и списывает его.
+
+        Args:
+            chat_id: Чат запроса (None - только глобальное ведро)
+            request_lane: INTERACTIVE или BULK
+        """
+        keys, args = self._buckets(chat_id, request_lane)
+        started = time.monotonic()
+
+        while True:
+            try:
+                redis = get_redis()
+                # Скрипт привязан к клиенту; клиент пересоздаётся после close_redis()
+                if self._script is None or self._script.registered_client is not redis:
+                    self._script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+                wait_ms = int(await self._script(keys=keys, args=args))
+            except Exception as e:
+                metrics.inc("rate_limit.fail_open")
+                now = time.monotonic()
+                if now - self._fail_open_logged_at > FAIL_OPEN_LOG_INTERVAL:
+                    self._fail_open_logged_at = now
+                    logger.warning(f"⚠️ Лимитер Telegram недоступен, запросы идут без ограничения: {e}")
+                return
+
+            if wait_ms <= 0:
+                break
+            await asyncio.sleep(wait_ms / 1000)
+
+        waited_ms = (time.monotonic() - started) * 1000
+        metrics.observe(f"rate_limit.wait_ms.{request_lane}", waited_ms)
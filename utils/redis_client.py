@@ -0,0 +1,54 @@
+# utils/redis_client.py - Общее асинхронное подключение к Redis
+# Один пул соединений на процесс (бот, матчер); синхронный - для .delay() и сигналов Celery
+
+import logging
+from typing import Optional
+
+import redis
+from redis.asyncio import Redis
+
+from config import REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+_redis: Optional[Redis] = None
+_sync_redis: Optional[redis.Redis] = None
+
+
+def get_redis() -> Redis:
+    """
+    Возвращает клиент Redis процесса (создаётся при первом вызове).
+
+    Returns:
+        Клиент redis.asyncio с декодированием ответов в str
+    """
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(REDIS_URL, decode_responses=True)
+    return _redis
+
+
+def get_sync_redis() -> redis.Redis:
+    """
+    Возвращает синхронный клиент Redis процесса - для кода, который
+    вызывается синхронно (постановка задач, сигналы Celery).
+
+    Returns:
+        Клиент redis с декодированием ответов в str
+    """
+    global _sync_redis
+    if _sync_redis is None:
+        _sync_redis = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _sync_redis
+
+
+async def close_redis() -> None:
+    """Закрывает подключения к Redis"""
+    global _redis, _sync_redis
+    if _sync_redis is not None:
+        _sync_redis.close()
+        _sync_redis = None
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+        logger.info("Подключение к Redis закрыто")
@@ -15,7 +15,9 @@ from config import EXPIRATION_CHECK_INTERVAL, BOT_TOKEN
 from database.db import get_session
 from database.models import Post, User
 from services.channel import mark_post_as_expired, delete_channel_message
+from services.matching import index_post, unindex_post
 from tasks.notifications import send_expiration_notification
+from utils import rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -105,10 +107,22 @@ async def check_expired_posts(bot: Bot):
             
             await session.commit()
             
+            # Истёкшие объявления покидают индекс активных объявлений
+            for post in expired_posts:
+                if post.status == "expired":
+                    unindex_post(post.id)
+            
     except Exception as e:
         logger.error(f"Ошибка в check_expired_posts: {e}")
 
 
+async def check_expired_posts_job(bot: Bot):
+    """Задача планировщика: check_expired_posts в фоновой полосе лимитера"""
+    # Правки канала - фоновый трафик: не занимает лимит, оставленный ответам пользователям
+    with rate_limiter.lane(rate_limiter.BULK):
+        await check_expired_posts(bot)
+
+
 def start_expiration_worker(bot: Bot):
     """
     Запускает фоновый воркер проверки истёкших объявлений.
@@ -122,7 +136,7 @@ def start_expiration_worker(bot: Bot):
     
     # Добавляем задачу проверки каждую минуту
     scheduler.add_job(
-        check_expired_posts,
+        check_expired_posts_job,
         trigger=IntervalTrigger(seconds=EXPIRATION_CHECK_INTERVAL),
         args=[bot],
         id="check_expired_posts",
@@ -169,6 +183,7 @@ async def extend_post(post_id: int, minutes: int = 60) -> bool:
             post.status = "active"
             
             await session.commit()
+            index_post(post)
             logger.info(f"Объявление {post_id} продлено на {minutes} минут")
             return True
             
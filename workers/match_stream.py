@@ -0,0 +1,216 @@
+# workers/match_stream.py - Матчер, читающий стрим "post_published"
+# Читает события через consumer group, матчит пачками и рассылает уведомления
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import List, Optional, Tuple
+
+from redis.exceptions import ResponseError
+from sqlalchemy import select
+
+from config import (
+    MATCH_STREAM_KEY,
+    MATCH_STREAM_GROUP,
+    MATCH_STREAM_BATCH_SIZE,
+    MATCH_STREAM_CLAIM_IDLE_MS,
+    MATCH_STREAM_MAX_DELIVERIES
+)
+from database.db import get_session
+from database.models import Post, User
+from services.fanout import fan_out_post_matches
+from services.matching import match_posts_batch
+from utils import metrics
+from utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Как долго XREADGROUP ждёт новых событий
+BLOCK_MS = 1000
+
+# Как часто обновлять метрики отставания и подбирать зависшие события
+MAINTENANCE_INTERVAL = 10
+
+
+class MatchStreamConsumer:
+    """
+    Потребитель стрима матчинга (Redis Streams, consumer group).
+
+    Несколько матчеров могут читать один стрим: каждое событие получает
+    ровно один потребитель группы. Событие подтверждается (XACK) только
+    после постановки уведомлений в очередь; события упавшего матчера
+    подбираются через XAUTOCLAIM после MATCH_STREAM_CLAIM_IDLE_MS.
+
+    Метрики:
+    - match_stream.lag - события стрима, ещё не выданные группе
+    - match_stream.pending - выданные, но не подтверждённые события
+    - match_stream.event_age_ms - время от публикации до обработки события
+    - match_stream.processed / match_stream.failed / match_stream.dropped
+    """
+
+    def __init__(self, consumer_name: Optional[str] = None):
+        self.redis = get_redis()
+        self.stream = MATCH_STREAM_KEY
+        self.group = MATCH_STREAM_GROUP
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        self._stopped = asyncio.Event()
+        self._last_maintenance = 0.0
+
+    async def ensure_group(self) -> None:
+        """Создаёт consumer group (и стрим), если их ещё нет"""
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+            logger.info(f"✅ Создана группа {self.group} для стрима {self.stream}")
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    async def run(self) -> None:
+        """Основной цикл матчера"""
+        await self.ensure_group()
+        logger.info(f"🚀 Матчер {self.consumer_name} читает стрим {self.stream}")
+
+        while not self._stopped.is_set():
+            try:
+                if time.monotonic() - self._last_maintenance >= MAINTENANCE_INTERVAL:
+                    await self._maintenance()
+
+                response = await self.redis.xreadgroup(
+                    self.group,
+                    self.consumer_name,
+                    {self.stream: ">"},
+                    count=MATCH_STREAM_BATCH_SIZE,
+                    block=BLOCK_MS
+                )
+                for _, entries in response or []:
+                    await self.handle(entries)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка цикла матчера: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+        logger.info(f"Матчер {self.consumer_name} остановлен")
+
+    async def handle(self, entries: List[Tuple[str, dict]]) -> None:
+        """
+        Матчит пачку событий и подтверждает их.
+        При ошибке события остаются в pending и будут подобраны повторно.
+
+        Args:
+            entries: Записи стрима (entry_id, поля)
+        """
+        if not entries:
+            return
+
+        now_ms = time.time() * 1000
+        post_ids = []
+        for entry_id, fields in entries:
+            metrics.observe("match_stream.event_age_ms", now_ms - int(entry_id.split("-")[0]))
+            if fields.get("post_id", "").isdigit():
+                post_ids.append(int(fields["post_id"]))
+
+        entry_ids = [entry_id for entry_id, _ in entries]
+
+        try:
+            async with get_session() as session:
+                # Объявление могли приостановить или удалить, пока событие ждало в очереди
+                posts_result = await session.execute(
+                    select(Post).where(Post.id.in_(post_ids), Post.status == "active").order_by(Post.id)
+                )
+                posts = list(posts_result.scalars().all())
+
+                if posts:
+                    authors_result = await session.execute(
+                        select(User).where(User.id.in_({post.author_id for post in posts}))
+                    )
+                    authors = {user.id: user for user in authors_result.scalars().all()}
+
+                    results = await match_posts_batch(session, posts)
+                    for post in posts:
+                        author = authors.get(post.author_id)
+                        if author:
+                            fan_out_post_matches(post, author, results[post.id])
+
+        except Exception as e:
+            metrics.inc("match_stream.failed", len(entries))
+            logger.error(f"❌ Ошибка матчинга пачки из {len(entries)} событий: {e}", exc_info=True)
+            return
+
+        await self.redis.xack(self.stream, self.group, *entry_ids)
+        metrics.inc("match_stream.processed", len(entries))
+        logger.info(f"Матчер обработал {len(entries)} событий ({len(posts)} активных объявлений)")
+
+    async def _maintenance(self) -> None:
+        """Обновляет метрики отставания и подбирает события упавших матчеров"""
+        self._last_maintenance = time.monotonic()
+
+        for group_info in await self.redis.xinfo_groups(self.stream):
+            if group_info["name"] == self.group:
+                metrics.set_gauge("match_stream.pending", group_info["pending"])
+                # "lag" есть в XINFO GROUPS начиная с Redis 7
+                if group_info.get("lag") is not None:
+                    metrics.set_gauge("match_stream.lag", group_info["lag"])
+
+        # Отбрасываем события, которые раз за разом роняют матчер
+        pending = await self.redis.xpending_range(
+            self.stream, self.group, min="-", max="+", count=100
+        )
+        poisoned = [
+            item["message_id"] for item in pending
+            if item["times_delivered"] >= MATCH_STREAM_MAX_DELIVERIES
+        ]
+        if poisoned:
+            await self.redis.xack(self.stream, self.group, *poisoned)
+            metrics.inc("match_stream.dropped", len(poisoned))
+            logger.error(f"❌ Отброшено {len(poisoned)} событий после {MATCH_STREAM_MAX_DELIVERIES} попыток: {poisoned}")
+
+        # Redis 6.2 возвращает 2 элемента, Redis 7 - 3 (с удалёнными ID)
+        autoclaim = await self.redis.xautoclaim(
+            self.stream,
+            self.group,
+            self.consumer_name,
+            min_idle_time=MATCH_STREAM_CLAIM_IDLE_MS,
+            start_id="0-0",
+            count=MATCH_STREAM_BATCH_SIZE
+        )
+        claimed = [(entry_id, fields) for entry_id, fields in autoclaim[1] if fields]
+        if claimed:
+            logger.info(f"Подобрано {len(claimed)} зависших событий")
+            await self.handle(claimed)
+
+
+# Глобальный матчер процесса
+_consumer: Optional[MatchStreamConsumer] = None
+_task: Optional[asyncio.Task] = None
+
+
+def start_match_stream_worker() -> None:
+    """Запускает матчер фоновой задачей в текущем event loop"""
+    global _consumer, _task
+
+    _consumer = MatchStreamConsumer()
+    _task = asyncio.get_running_loop().create_task(_consumer.run())
+    logger.info("Матчер стрима запущен")
+
+
+async def stop_match_stream_worker() -> None:
+    """Останавливает матчер, дожидаясь завершения текущей пачки"""
+    global _consumer, _task
+
+    if _consumer is not None:
+        _consumer.stop()
+    if _task is not None:
+        try:
+            await asyncio.wait_for(_task, timeout=BLOCK_MS / 1000 + 5)
+        except asyncio.TimeoutError:
+            _task.cancel()
+        _consumer = None
+        _task = None
+        logger.info("Матчер стрима остановлен")
@@ -0,0 +1,239 @@
+# workers/notify_queue.py - Потребитель стрима задач уведомлений
+# Сотни задач одновременно в одном event loop, повторы и отложенные задачи через ZSET
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from typing import Any, Dict, Optional, Sequence, Set
+
+from redis.exceptions import ResponseError
+
+from config import (
+    NOTIFY_QUEUE_STREAM,
+    NOTIFY_QUEUE_GROUP,
+    NOTIFY_QUEUE_DELAYED,
+    NOTIFY_QUEUE_CONCURRENCY,
+    NOTIFY_QUEUE_CLAIM_IDLE_MS,
+    NOTIFY_QUEUE_MAX_DELIVERIES
+)
+from tasks.delivery import PERMANENT, EXHAUSTED, dead_letter_async, retry_delay
+from tasks.monitoring import record_wait_async
+from tasks.queue import REGISTRY, QueueTask, RetryWith, build_message
+from utils import metrics
+from utils.redis_client import get_redis
+
+# Регистрирует задачи в REGISTRY
+import tasks.notifications  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+# Как долго XREADGROUP ждёт новых задач (и точность отложенных задач)
+BLOCK_MS = 1000
+
+# Как часто обновлять метрики и подбирать задачи упавших потребителей
+MAINTENANCE_INTERVAL = 10
+
+# Сколько отложенных задач переносить в стрим за раз
+PROMOTE_BATCH = 500
+
+# Сколько ждать выполняющиеся задачи при остановке (секунды)
+DRAIN_TIMEOUT = 30
+
+# Атомарно переносит наступившие отложенные задачи из ZSET в стрим
+# (несколько потребителей не перенесут одну задачу дважды)
+PROMOTE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, message in ipairs(due) do
+    redis.call('XADD', KEYS[2], '*', 'message', message)
+    redis.call('ZREM', KEYS[1], message)
+end
+return #due
+"""
+
+
+class NotifyQueueConsumer:
+    """
+    Потребитель очереди уведомлений (NOTIFY_QUEUE_BACKEND="stream").
+
+    Каждая задача стрима выполняется отдельной asyncio задачей, одновременно
+    не больше NOTIFY_QUEUE_CONCURRENCY. Задача подтверждается (XACK + XDEL)
+    после выполнения; при ошибке она возвращается в ZSET отложенных задач
+    с задержкой по классу ошибки (tasks/delivery.py), пока не исчерпает
+    max_retries своей Celery задачи; постоянные ошибки и исчерпанные повторы
+    уходят в DLQ.
+    Задачи упавшего потребителя подбираются через XAUTOCLAIM.
+
+    Метрики:
+    - notify_queue.in_flight / notify_queue.pending / notify_queue.delayed
+    - queue.wait_ms.<класс> - время от постановки в стрим до начала выполнения
+    - notify_queue.processed / retried / failed / dropped
+    """
+
+    def __init__(self, consumer_name: Optional[str] = None, concurrency: int = NOTIFY_QUEUE_CONCURRENCY):
+        self.redis = get_redis()
+        self.stream = NOTIFY_QUEUE_STREAM
+        self.group = NOTIFY_QUEUE_GROUP
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        self.concurrency = concurrency
+        self._stopped = asyncio.Event()
+        self._in_flight: Set[asyncio.Task] = set()
+        self._last_maintenance = 0.0
+        self._promote = self.redis.register_script(PROMOTE_SCRIPT)
+
+    async def ensure_group(self) -> None:
+        """Создаёт consumer group (и стрим), если их ещё нет"""
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+            logger.info(f"✅ Создана группа {self.group} для стрима {self.stream}")
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    async def run(self) -> None:
+        """Основной цикл потребителя"""
+        await self.ensure_group()
+        logger.info(f"🚀 Потребитель {self.consumer_name} читает стрим {self.stream} (до {self.concurrency} задач)")
+
+        while not self._stopped.is_set():
+            try:
+                if time.monotonic() - self._last_maintenance >= MAINTENANCE_INTERVAL:
+                    await self._maintenance()
+
+                await self._promote(keys=[NOTIFY_QUEUE_DELAYED, self.stream], args=[int(time.time() * 1000), PROMOTE_BATCH])
+
+                free = self.concurrency - len(self._in_flight)
+                if free <= 0:
+                    await asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+
+                response = await self.redis.xreadgroup(
+                    self.group,
+                    self.consumer_name,
+                    {self.stream: ">"},
+                    count=free,
+                    block=BLOCK_MS
+                )
+                for _, entries in response or []:
+                    for entry_id, fields in entries:
+                        self._spawn(entry_id, fields)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка цикла потребителя уведомлений: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+        # Не подтверждённые при остановке задачи подберёт XAUTOCLAIM
+        if self._in_flight:
+            logger.info(f"Ожидаю завершения {len(self._in_flight)} задач...")
+            await asyncio.wait(self._in_flight, timeout=DRAIN_TIMEOUT)
+        logger.info(f"Потребитель {self.consumer_name} остановлен")
+
+    def _spawn(self, entry_id: str, fields: Dict[str, str]) -> None:
+        task = asyncio.get_running_loop().create_task(self._execute(entry_id, fields))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+        metrics.set_gauge("notify_queue.in_flight", len(self._in_flight))
+
+    async def _execute(self, entry_id: str, fields: Dict[str, str]) -> None:
+        """Выполняет одну задачу стрима и подтверждает её"""
+        try:
+            message = json.loads(fields["message"])
+            task = REGISTRY[message["task"]]
+        except (KeyError, ValueError) as e:
+            metrics.inc("notify_queue.dropped")
+            logger.error(f"❌ Неизвестная задача в стриме {entry_id}: {fields} ({e})")
+            await self._ack(entry_id)
+            return
+
+        await record_wait_async(message.get("queue"), time.time() * 1000 - int(entry_id.split("-")[0]))
+
+        try:
+            await task.body(*message["args"], **message["kwargs"])
+            metrics.inc("notify_queue.processed")
+        except RetryWith as partial:
+            await self._retry(task, message, (), partial.kwargs, partial.error or partial)
+        except Exception as e:
+            await self._retry(task, message, message["args"], message["kwargs"], e)
+
+        await self._ack(entry_id)
+
+    async def _retry(
+        self,
+        task: QueueTask,
+        message: Dict[str, Any],
+        args: Sequence[Any],
+        kwargs: Dict[str, Any],
+        error: Exception
+    ) -> None:
+        """Откладывает повтор задачи (задержка по классу ошибки) или отправляет её в DLQ"""
+        attempt = message.get("attempt", 0) + 1
+        delay = retry_delay(error, attempt - 1)
+        if delay is None:
+            metrics.inc("notify_queue.failed")
+            await dead_letter_async(task.name, args, kwargs, error, PERMANENT, message.get("queue"))
+            return
+        if attempt > task.max_retries:
+            metrics.inc("notify_queue.failed")
+            logger.error(f"❌ Задача {task.name} не выполнена после {task.max_retries} повторов: {error}")
+            await dead_letter_async(task.name, args, kwargs, error, EXHAUSTED, message.get("queue"))
+            return
+
+        retry_message = build_message(task.name, args, kwargs, attempt, message.get("queue"))
+        await self.redis.zadd(NOTIFY_QUEUE_DELAYED, {retry_message: (time.time() + delay) * 1000})
+        metrics.inc("notify_queue.retried")
+        logger.warning(f"⚠️ Задача {task.name} будет повторена через {delay:.1f} сек (попытка {attempt}): {error}")
+
+    async def _ack(self, entry_id: str) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xack(self.stream, self.group, entry_id)
+            pipe.xdel(self.stream, entry_id)
+            await pipe.execute()
+
+    async def _maintenance(self) -> None:
+        """Обновляет метрики и подбирает задачи упавших потребителей"""
+        self._last_maintenance = time.monotonic()
+
+        for group_info in await self.redis.xinfo_groups(self.stream):
+            if group_info["name"] == self.group:
+                metrics.set_gauge("notify_queue.pending", group_info["pending"])
+        metrics.set_gauge("notify_queue.delayed", await self.redis.zcard(NOTIFY_QUEUE_DELAYED))
+
+        # Отбрасываем задачи, которые раз за разом роняют потребителя
+        pending = await self.redis.xpending_range(
+            self.stream, self.group, min="-", max="+", count=100
+        )
+        poisoned = [
+            item["message_id"] for item in pending
+            if item["times_delivered"] >= NOTIFY_QUEUE_MAX_DELIVERIES
+        ]
+        for entry_id in poisoned:
+            await self._ack(entry_id)
+        if poisoned:
+            metrics.inc("notify_queue.dropped", len(poisoned))
+            logger.error(f"❌ Отброшено {len(poisoned)} задач после {NOTIFY_QUEUE_MAX_DELIVERIES} доставок: {poisoned}")
+
+        free = self.concurrency - len(self._in_flight)
+        if free <= 0:
+            return
+
+        # Redis 6.2 возвращает 2 элемента, Redis 7 - 3 (с удалёнными ID)
+        autoclaim = await self.redis.xautoclaim(
+            self.stream,
+            self.group,
+            self.consumer_name,
+            min_idle_time=NOTIFY_QUEUE_CLAIM_IDLE_MS,
+            start_id="0-0",
+            count=free
+        )
+        claimed = [(entry_id, fields) for entry_id, fields in autoclaim[1] if fields]
+        if claimed:
+            logger.info(f"Подобрано {len(claimed)} зависших задач уведомлений")
+            for entry_id, fields in claimed:
+                self._spawn(entry_id, fields)
@@ -0,0 +1,163 @@
+# workers/rating_requests.py - Фоновая отправка запросов на оценку поездки
+# Забирает наступившие запросы из rating_requests (FOR UPDATE SKIP LOCKED) и отправляет их
+
+import logging
+from datetime import datetime
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from sqlalchemy import select
+
+from config import RATING_SWEEP_INTERVAL, RATING_SWEEP_BATCH
+from database.db import get_session
+from database.models import Post, Rating, RatingRequest, User
+from tasks.notifications import render_rating_request
+from utils import metrics, rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# Глобальный планировщик
+scheduler: Optional[AsyncIOScheduler] = None
+
+
+async def send_rating_requests_batch(bot: Bot) -> int:
+    """
+    Отправляет до RATING_SWEEP_BATCH наступивших запросов одной транзакцией.
+    Строки блокируются FOR UPDATE SKIP LOCKED, поэтому несколько процессов
+    бота не отправят один запрос дважды. Запрос помечается sent=1 после
+    отправки или если он больше не нужен (оценка уже есть, пользователь
+    заблокировал бота); при временной ошибке остаётся до следующей проверки.
+
+    Args:
+        bot: Экземпляр бота
+
+    Returns:
+        Сколько запросов закрыто (sent=1)
+    """
+    async with get_session() as session:
+        due_query = (
+            select(RatingRequest)
+            .where(
+                RatingRequest.sent == 0,
+                RatingRequest.scheduled_at <= datetime.utcnow()
+            )
+            .order_by(RatingRequest.scheduled_at)
+            .limit(RATING_SWEEP_BATCH)
+            .with_for_update(skip_locked=True)
+        )
+        due_result = await session.execute(due_query)
+        requests = due_result.scalars().all()
+        if not requests:
+            return 0
+
+        user_ids = {r.from_user_id for r in requests} | {r.to_user_id for r in requests}
+        post_ids = {r.post_id for r in requests}
+
+        users_result = await session.execute(select(User).where(User.id.in_(user_ids)))
+        users = {user.id: user for user in users_result.scalars()}
+
+        posts_result = await session.execute(select(Post).where(Post.id.in_(post_ids)))
+        posts = {post.id: post for post in posts_result.scalars()}
+
+        # Уже поставленные оценки - запрос не нужен
+        rated_result = await session.execute(
+            select(Rating.from_user_id, Rating.to_user_id, Rating.post_id)
+            .where(Rating.post_id.in_(post_ids))
+        )
+        rated = set(rated_result.all())
+
+        sent = 0
+        closed = 0
+        for request in requests:
+            from_user = users.get(request.from_user_id)
+            to_user = users.get(request.to_user_id)
+            post = posts.get(request.post_id)
+
+            if (request.from_user_id, request.to_user_id, request.post_id) in rated:
+                logger.info(f"Оценка уже поставлена пользователем {request.from_user_id} для поста {request.post_id}, пропускаем запрос")
+                request.sent = 1
+                closed += 1
+                continue
+            if not from_user or not to_user or not post:
+                request.sent = 1
+                closed += 1
+                continue
+
+            text, keyboard = render_rating_request(
+                to_user.telegram_id, "пользователя", post.id, post.from_place, post.to_place
+            )
+            try:
+                await bot.send_message(
+                    chat_id=from_user.telegram_id,
+                    text=text,
+                    parse_mode="HTML",
+                    reply_markup=keyboard
+                )
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Повтор не поможет (бот заблокирован, чат не найден)
+                logger.warning(f"⚠️ Запрос на рейтинг пользователю {from_user.telegram_id} не доставлен: {e}")
+                request.sent = 1
+                closed += 1
+                continue
+            except Exception as e:
+                logger.error(f"❌ Ошибка отправки запроса на рейтинг пользователю {from_user.telegram_id}: {e}")
+                continue
+
+            request.sent = 1
+            sent += 1
+            closed += 1
+            logger.info(f"Запрос на рейтинг отправлен пользователю {from_user.telegram_id} для поста {post.id}")
+
+    metrics.inc("rating_requests.sent", sent)
+    return closed
+
+
+async def send_due_rating_requests(bot: Bot):
+    """
+    Отправляет все наступившие запросы на оценку пачками.
+    Выполняется каждые RATING_SWEEP_INTERVAL секунд.
+    """
+    # Запросы на оценку - фоновый трафик: не занимает лимит ответов пользователям
+    with rate_limiter.lane(rate_limiter.BULK):
+        try:
+            # Полная пачка - вероятно, есть ещё наступившие запросы
+            while await send_rating_requests_batch(bot) >= RATING_SWEEP_BATCH:
+                pass
+        except Exception as e:
+            logger.error(f"Ошибка в send_due_rating_requests: {e}")
+
+
+def start_rating_requests_worker(bot: Bot):
+    """
+    Запускает фоновую отправку запросов на оценку.
+
+    Args:
+        bot: Экземпляр бота
+    """
+    global scheduler
+
+    scheduler = AsyncIOScheduler()
+
+    scheduler.add_job(
+        send_due_rating_requests,
+        trigger=IntervalTrigger(seconds=RATING_SWEEP_INTERVAL),
+        args=[bot],
+        id="send_due_rating_requests",
+        replace_existing=True,
+        max_instances=1
+    )
+
+    scheduler.start()
+    logger.info(f"Воркер запросов на оценку запущен (интервал: {RATING_SWEEP_INTERVAL} сек)")
+
+
+def stop_rating_requests_worker():
+    """Останавливает воркер"""
+    global scheduler
+
+    if scheduler and scheduler.running:
+        scheduler.shutdown(wait=False)
+        logger.info("Воркер запросов на оценку остановлен")